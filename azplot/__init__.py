@@ -1,4 +1,32 @@
-from .stock_bar import draw_stock, StockChartController
-from .netvalue_line import draw_net_value
+import importlib
 
-__all__ = [draw_stock, StockChartController, draw_net_value]
+# 对外的名字 -> 所在子模块；第一次访问时才导入子模块（连同pandas、pyecharts），import azplot本身不加载任何依赖
+_EXPORTS = {
+    'draw_stock': '.stock_bar',
+    'StockChartController': '.stock_bar',
+    'draw_net_value': '.netvalue_line',
+    'StockDataCache': '.stock_data',
+    'TradeLog': '.trades',
+    'MarketPanel': '.panel',
+    'ChartProfiler': '.profiling',
+    'ContactSheet': '.thumbnail',
+    'CompactStockChartModel': '.compact_model',
+    'ChartServer': '.server',
+    'resample_stock_data': '.resample',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module, __name__), name)
+    # 缓存到包的命名空间，之后不再经过__getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
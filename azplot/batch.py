@@ -0,0 +1,49 @@
+import json
+import os
+import re
+from typing import Dict, List
+
+
+def safe_filename(name: str) -> str:
+    """
+    把股票代码、策略名等转成可以当文件名的字符串
+    """
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(name)).strip('_') or '_'
+
+
+class BatchManifest:
+    """
+    批量渲染的清单：每个图一条记录，包含文件路径、大小、各阶段耗时，失败的记录错误信息
+    """
+    output_dir: str
+    entries: List[dict]
+
+    FILE_NAME = 'manifest.json'
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.entries = []
+        os.makedirs(output_dir, exist_ok=True)
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.output_dir, f'{safe_filename(name)}.html')
+
+    def add(self, name: str, path: str = None, timings: Dict[str, float] = None, error: str = None):
+        """
+        :param timings: 阶段名 -> 秒
+        """
+        entry = {'name': name, 'path': path, 'bytes': os.path.getsize(path) if path else None,
+                 'seconds': timings or {}}
+        if error is not None:
+            entry['error'] = error
+        self.entries.append(entry)
+
+    def write(self) -> str:
+        """
+        :return: manifest.json的路径
+        """
+        path = os.path.join(self.output_dir, self.FILE_NAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        return path
+
@@ -0,0 +1,125 @@
+from typing import Dict, List, Tuple, Union
+
+from pyecharts import options as opts
+from pyecharts.charts import Grid
+
+from . import serialize
+from .stock_bar import StockChartModel, StockChartView, _dataset_source, _stock_series
+from .typed_array import ColumnEncoding, DECODER_JS
+
+
+class PrecleanedGrid(Grid):
+    """
+    options已经是清洗过的纯dict，渲染（包括放进Tab）时不再走pyecharts的递归清洗
+    """
+
+    def get_options(self) -> dict:
+        return self.options
+
+    def dump_options(self) -> str:
+        return serialize.dumps(self.options)
+
+
+class StockChartTemplate:
+    """
+    StockChartView的option骨架：坐标轴、datazoom、visualmap、brush、tooltip、各series的样式等
+    同一布局（overlays、use_dataset、typed_arrays相同）只构建、清洗一次，每只股票只注入数据列、标记点、标题和窗口
+    """
+    overlays: List[str]
+    use_dataset: bool
+    typed_arrays: Union[bool, Dict[str, ColumnEncoding]]
+    __skeleton: dict = None
+    __skeleton_name: str
+
+    def __init__(self, overlays: List[str] = ('MA5', 'MA150'), use_dataset: bool = False,
+                 typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False):
+        """
+        :param overlays: 见StockChartView
+        :param use_dataset: 见StockChartView
+        :param typed_arrays: 见StockChartView，隐含use_dataset
+        """
+        self.overlays = list(overlays)
+        self.use_dataset = use_dataset or bool(typed_arrays)
+        self.typed_arrays = typed_arrays
+
+    def __build_skeleton(self, model: StockChartModel):
+        skeleton = serialize.clean_options(
+            StockChartView(model, use_dataset=self.use_dataset, overlays=self.overlays).options)
+        # 数据部分每次都会整个替换，骨架里不留
+        skeleton.pop('dataset', None)
+        for axis in skeleton['xAxis']:
+            axis.pop('data', None)
+        for chart_series in skeleton['series']:
+            chart_series.pop('data', None)
+        skeleton['series'][0].setdefault('markPoint', {}).pop('data', None)
+        self.__skeleton = skeleton
+        self.__skeleton_name = model.stock_name
+
+    def options(self, model: StockChartModel, max_points: int = None) -> dict:
+        """
+        :return: 与 StockChartView(model, ...) 清洗后的options相同的dict，只复制了要改动的那几层
+        """
+        if self.__skeleton is None:
+            self.__build_skeleton(model)
+        skeleton = self.__skeleton
+        series = _stock_series(model, max_points, self.overlays)
+
+        options = dict(skeleton)
+        options['title'] = [dict(skeleton['title'][0], text=model.stock_name, subtext=model.code),
+                            *skeleton['title'][1:]]
+        options['dataZoom'] = [dict(zoom, startValue=series['start_date'], endValue=series['end_date'])
+                               for zoom in skeleton['dataZoom']]
+        if 'legend' in skeleton:
+            # 老版本pyecharts会把series名字写进legend.data
+            options['legend'] = [dict(legend, data=[model.stock_name if name == self.__skeleton_name else name
+                                                    for name in legend['data']]) if 'data' in legend else legend
+                                 for legend in skeleton['legend']]
+
+        chart_series = [dict(s) for s in skeleton['series']]
+        chart_series[0]['name'] = model.stock_name
+        chart_series[0]['markPoint'] = dict(skeleton['series'][0]['markPoint'],
+                                            data=[serialize.clean_options(item) for item in series['mark_points']])
+        if self.use_dataset:
+            source, _ = _dataset_source(series, self.typed_arrays)
+            options['dataset'] = {'source': source}
+        else:
+            dates = series['dates']
+            options['xAxis'] = [dict(axis, data=dates) for axis in skeleton['xAxis']]
+            chart_series[0]['data'] = series['k_line']
+            # Line的data是[x, y]对，与pyecharts的add_yaxis一致
+            for chart_line, values in zip(chart_series[1:], series['lines'].values()):
+                chart_line['data'] = [[date, value] for date, value in zip(dates, values)]
+            chart_series[-2]['data'] = series['amount']
+            chart_series[-1]['data'] = series['returns']
+        options['series'] = chart_series
+        return options
+
+    def chart(self, model: StockChartModel, max_points: int = None) -> PrecleanedGrid:
+        """
+        :return: 可以直接render或放进Tab的图表对象
+        """
+        chart = PrecleanedGrid(init_opts=opts.InitOpts(
+            width="1600px",
+            height="800px",
+            page_title=model.stock_name,
+            animation_opts=opts.AnimationOpts(animation=False),
+        ))
+        chart.options = self.options(model, max_points=max_points)
+        if self.typed_arrays:
+            chart.add_js_funcs(DECODER_JS)
+        return chart
+
+
+_templates: Dict[Tuple[tuple, bool], StockChartTemplate] = {}
+
+
+def get_template(overlays: List[str] = ('MA5', 'MA150'), use_dataset: bool = False,
+                 typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False) -> StockChartTemplate:
+    """
+    同一布局在进程内共用一个StockChartTemplate
+    """
+    encodings = tuple(sorted(typed_arrays.items())) if isinstance(typed_arrays, dict) else typed_arrays
+    key = (tuple(overlays), use_dataset, encodings)
+    if key not in _templates:
+        _templates[key] = StockChartTemplate(overlays=overlays, use_dataset=use_dataset, typed_arrays=typed_arrays)
+    return _templates[key]
@@ -0,0 +1,171 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pyecharts import options as opts
+
+from .indicators import IndicatorContext
+from .stock_bar import StockModelBase, round_half_up_pct
+from .trades import CodeTrades
+
+# 存进model的列；价格按2位小数、成交额按2位小数检查能否无损转成float32
+PRICE_COLUMNS = ('开盘价', '收盘价', '最低价', '最高价', '前收盘价')
+COLUMN_DECIMALS = {**{column: 2 for column in PRICE_COLUMNS}, '成交额': 2, '涨跌幅': 2}
+
+
+def compact_column(values, decimals: int) -> Tuple[np.ndarray, Optional[int]]:
+    """
+    :return: (数组, decimals)：转成float32后能按decimals位小数四舍五入还原出每个值时存float32，
+             否则原样存float64（能不复制就不复制），decimals为None
+    """
+    values = np.asarray(values, dtype=np.float64)
+    packed = values.astype(np.float32)
+    if np.array_equal(np.round(packed.astype(np.float64), decimals), values, equal_nan=True):
+        return packed, decimals
+    return values, None
+
+
+def format_dates(values: np.ndarray) -> List[str]:
+    """
+    datetime64数组 -> ['2023/02/07', ...]，与 .dt.strftime('%Y/%m/%d') 相同
+    """
+    return [date.replace('-', '/') for date in np.datetime_as_string(values, unit='D').tolist()]
+
+
+class CompactStockChartModel(StockModelBase):
+    """
+    StockChartModel的省内存版本，StockChartView、StockChartTemplate、LiveStockChart、thumbnail都可以直接用：
+        - 只保留用到的几列NumPy数组，不保留stock_df；价格等能无损转成float32的列存float32，其余是stock_df列的视图
+        - dates、k_line_OCLH_data、amount、returns在访问时才生成list，不缓存；交易日期不是datetime时也先转成日期
+        - 不往传入的stock_df里写涨跌幅列
+    适合需要长时间缓存大量model的进程；stock_df属性按需重建一个DataFrame，只为兼容
+    """
+    __slots__ = ('code', 'stock_name', 'start_date', 'end_date', '__columns', '__decimals', '__bar_dates',
+                 '__warmup', '__buy_days', '__sell_days', '__trades', '__indicators', '__up_limits')
+    code: str
+    stock_name: str
+    start_date: str
+    end_date: str
+    __columns: Dict[str, np.ndarray]
+    __decimals: Dict[str, Optional[int]]
+    __bar_dates: np.ndarray
+    __warmup: int
+    __buy_days: List
+    __sell_days: List
+    __trades: CodeTrades
+    __indicators: Optional[IndicatorContext]
+    __up_limits: Optional[list]
+
+    def __init__(self, stock_df: pd.DataFrame, start_date: str, end_date: str, buy_days: List[pd.Timestamp] = None,
+                 sell_days: List[pd.Timestamp] = None, warmup: int = 0, trades: CodeTrades = None,
+                 float32: bool = True):
+        """
+        参数同StockChartModel
+        :param float32: 为False时各列都存float64
+        """
+        columns = {column: stock_df[column].to_numpy(dtype=np.float64) for column in PRICE_COLUMNS + ('成交额',)}
+        columns['涨跌幅'] = round_half_up_pct(columns['收盘价'] / columns['前收盘价'] - 1)
+        self.__columns, self.__decimals = {}, {}
+        for column, values in columns.items():
+            if float32:
+                values, decimals = compact_column(values, COLUMN_DECIMALS[column])
+            else:
+                decimals = None
+            self.__columns[column] = values
+            self.__decimals[column] = decimals
+
+        self.__bar_dates = pd.to_datetime(stock_df['交易日期']).to_numpy().astype('datetime64[ns]')
+        self.__warmup = warmup
+        last = stock_df.iloc[-1]
+        self.stock_name = last['股票名称']
+        self.code = last['股票代码']
+        self.start_date = start_date
+        self.end_date = end_date
+        self.__buy_days = buy_days
+        self.__sell_days = sell_days
+        self.__trades = trades
+        self.__indicators = None
+        self.__up_limits = None
+
+    def __len__(self):
+        return len(self.__bar_dates) - self.__warmup
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        :param name: 开盘价、收盘价、最低价、最高价、前收盘价、成交额、涨跌幅
+        :return: 图上那段K线（不含预热）的这一列，float64
+        """
+        return self.__full_column(name)[self.__warmup:]
+
+    def __full_column(self, name: str) -> np.ndarray:
+        values, decimals = self.__columns[name], self.__decimals[name]
+        return values if decimals is None else np.round(values.astype(np.float64), decimals)
+
+    @property
+    def dates(self) -> List[str]:
+        return format_dates(self._bar_dates())
+
+    @property
+    def k_line_OCLH_data(self) -> List[List[float]]:
+        return np.column_stack([self.column(column) for column in ('开盘价', '收盘价', '最低价', '最高价')]).tolist()
+
+    @property
+    def amount(self) -> List[float]:
+        return self.column('成交额').tolist()
+
+    @property
+    def returns(self) -> List[float]:
+        return self.column('涨跌幅').tolist()
+
+    @property
+    def stock_df(self) -> pd.DataFrame:
+        """
+        用保存的列重建的DataFrame（不含预热K线），每次访问都重新生成
+        """
+        stock_df = pd.DataFrame({column: self.column(column) for column in self.__columns})
+        stock_df.insert(0, '交易日期', self.__bar_dates[self.__warmup:])
+        stock_df['股票代码'] = self.code
+        stock_df['股票名称'] = self.stock_name
+        return stock_df
+
+    def history(self, column: str) -> np.ndarray:
+        """
+        同StockChartModel.history
+        """
+        return self.__context().columns[column]
+
+    def indicator(self, name: str, **params):
+        """
+        同StockChartModel.indicator，结果以数组缓存在IndicatorContext里，每次调用重新转成list
+        """
+        values = self.__context().compute(name, **params)
+        if isinstance(values, dict):
+            return {output: v[self.__warmup:].tolist() for output, v in values.items()}
+        return values[self.__warmup:].tolist()
+
+    def __context(self) -> IndicatorContext:
+        if self.__indicators is None:
+            self.__indicators = IndicatorContext(close=self.__full_column('收盘价'),
+                                                 amount=self.__full_column('成交额'))
+        return self.__indicators
+
+    def up_limits(self):
+        """
+        同StockChartModel.up_limits
+        """
+        if self.__up_limits is None:
+            high = self.column('最高价')
+            positions = np.flatnonzero((self.column('涨跌幅') > 9.89) & (high == self.column('收盘价')))
+            self.__up_limits = [opts.MarkPointItem(name='板', coord=[date, price], value='板',
+                                                   itemstyle_opts=opts.ItemStyleOpts(color='#66ccff'))
+                                for date, price in zip(self._dates_at(positions), (high[positions] * 1.02).tolist())]
+        return self.__up_limits
+
+    def _marker_sources(self) -> tuple:
+        return self.__buy_days, self.__sell_days, self.__trades
+
+    def _bar_dates(self) -> np.ndarray:
+        return self.__bar_dates[self.__warmup:]
+
+    def _dates_at(self, positions: np.ndarray) -> list:
+        return format_dates(self._bar_dates()[positions])
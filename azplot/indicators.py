@@ -0,0 +1,121 @@
+import inspect
+import re
+from typing import Callable, Dict, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# 指标名 -> 计算函数 func(context, **params)，返回与输入等长的数组，多输出的指标返回 {输出名: 数组}
+INDICATORS: Dict[str, Callable] = {}
+
+
+def register_indicator(name: str):
+    """
+    注册一个技术指标，用法：
+        @register_indicator('ma')
+        def ma(context, n=5):
+            return context.rolling_mean('close', n)
+    """
+    def decorator(func):
+        INDICATORS[name] = func
+        return func
+    return decorator
+
+
+def parse_indicator(spec: str) -> Tuple[str, dict]:
+    """
+    'MA5' -> ('ma', {'n': 5})，'BOLL' -> ('boll', {})；名字后面的数字作为参数n，只有带参数n的指标才能这样写
+    :raise ValueError: 没有这个指标，或者指标没有参数n却带了数字（如'MACD12'）
+    """
+    match = re.fullmatch(r'([A-Za-z_]+?)(\d+)?', spec)
+    if match is None or match.group(1).lower() not in INDICATORS:
+        raise ValueError(f'unknown indicator: {spec}')
+    name, n = match.groups()
+    name = name.lower()
+    if n is None:
+        return name, {}
+    if 'n' not in inspect.signature(INDICATORS[name]).parameters:
+        raise ValueError(f'indicator {name} takes no window length: {spec}')
+    return name, {'n': int(n)}
+
+
+class IndicatorContext:
+    """
+    一只股票上所有指标共享的输入和中间结果：列数组只取一次，同样(列, 窗口)的滚动统计只算一次，
+    同样(指标, 参数)的结果只算一次，指标之间可以通过compute互相复用（如macd复用ema）
+    """
+    columns: Dict[str, np.ndarray]
+    __rollings: Dict[Tuple[str, str, int], np.ndarray]
+    __results: Dict[tuple, Union[np.ndarray, Dict[str, np.ndarray]]]
+
+    def __init__(self, close, amount=None):
+        """
+        :param close: 收盘价
+        :param amount: 成交额
+        """
+        self.columns = {'close': np.asarray(close, dtype=np.float64)}
+        if amount is not None:
+            self.columns['amount'] = np.asarray(amount, dtype=np.float64)
+        self.__rollings = {}
+        self.__results = {}
+
+    def compute(self, name: str, **params) -> Union[np.ndarray, Dict[str, np.ndarray]]:
+        key = (name,) + tuple(sorted(params.items()))
+        if key not in self.__results:
+            if name not in INDICATORS:
+                raise ValueError(f'unknown indicator: {name}')
+            self.__results[key] = INDICATORS[name](self, **params)
+        return self.__results[key]
+
+    def rolling_mean(self, column: str, n: int) -> np.ndarray:
+        """
+        n日滚动均值，前n-1个为NaN；用pandas的rolling计算，与原来stock_df['收盘价'].rolling(n).mean()逐位相同
+        （前缀和相减会带来1e-10量级的误差，直接出现在图表JSON和提示框里）
+        """
+        return self.__rolling(column, 'mean', n)
+
+    def rolling_std(self, column: str, n: int) -> np.ndarray:
+        """
+        n日滚动总体标准差（ddof=0），前n-1个为NaN
+        """
+        return self.__rolling(column, 'std', n)
+
+    def __rolling(self, column: str, stat: str, n: int) -> np.ndarray:
+        key = (column, stat, n)
+        if key not in self.__rollings:
+            rolling = pd.Series(self.columns[column]).rolling(n)
+            values = rolling.mean() if stat == 'mean' else rolling.std(ddof=0)
+            self.__rollings[key] = values.to_numpy()
+        return self.__rollings[key]
+
+    def ewm_mean(self, column: str, n: int) -> np.ndarray:
+        return pd.Series(self.columns[column]).ewm(span=n, adjust=False).mean().to_numpy()
+
+
+@register_indicator('ma')
+def ma(context: IndicatorContext, n: int = 5) -> np.ndarray:
+    return context.rolling_mean('close', n)
+
+
+@register_indicator('ema')
+def ema(context: IndicatorContext, n: int = 12) -> np.ndarray:
+    return context.ewm_mean('close', n)
+
+
+@register_indicator('macd')
+def macd(context: IndicatorContext, fast: int = 12, slow: int = 26, signal: int = 9) -> Dict[str, np.ndarray]:
+    dif = context.compute('ema', n=fast) - context.compute('ema', n=slow)
+    dea = pd.Series(dif).ewm(span=signal, adjust=False).mean().to_numpy()
+    return {'dif': dif, 'dea': dea, 'macd': (dif - dea) * 2}
+
+
+@register_indicator('boll')
+def boll(context: IndicatorContext, n: int = 20, k: float = 2) -> Dict[str, np.ndarray]:
+    mid = context.compute('ma', n=n)
+    std = context.rolling_std('close', n)
+    return {'mid': mid, 'upper': mid + k * std, 'lower': mid - k * std}
+
+
+@register_indicator('amount_ma')
+def amount_ma(context: IndicatorContext, n: int = 5) -> np.ndarray:
+    return context.rolling_mean('amount', n)
@@ -0,0 +1,140 @@
+import html
+import json
+import os
+
+from pyecharts.globals import CurrentConfig
+
+from .serialize import dump_options
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{page_title}</title>
+    <script type="text/javascript" src="{echarts_src}"></script>
+    <style>
+        .tab {{ overflow: hidden; border: 1px solid #ccc; background-color: #f1f1f1; }}
+        .tab button {{ background-color: inherit; float: left; border: none; outline: none; cursor: pointer;
+                       padding: 8px 12px; }}
+        .tab button:hover {{ background-color: #ddd; }}
+        .tab button.active {{ background-color: #ccc; }}
+    </style>
+</head>
+<body>
+<div class="tab">{buttons}</div>
+<div id="chart" style="width:{width}; height:{height};"></div>
+<script>
+    {js_functions}
+    var DATA_DIR = {data_dir}, CACHE_SIZE = {cache_size};
+    var chart = echarts.init(document.getElementById('chart'), 'white', {{renderer: 'canvas'}});
+    var buttons = document.querySelectorAll('.tab button');
+    var cache = new Map(), current = -1;
+
+    function remember(index, option) {{
+        cache.delete(index);
+        cache.set(index, option);
+        while (cache.size > CACHE_SIZE) {{
+            cache.delete(cache.keys().next().value);
+        }}
+    }}
+
+    // 数据文件加载完后会调用这个函数
+    window.azplotLoaded = function (index, option) {{
+        remember(index, option);
+        if (index === current) {{
+            chart.hideLoading();
+            chart.setOption(option, true);
+        }}
+    }};
+
+    function show(index) {{
+        if (current >= 0) buttons[current].className = '';
+        current = index;
+        buttons[index].className = 'active';
+        if (cache.has(index)) {{
+            window.azplotLoaded(index, cache.get(index));
+            return;
+        }}
+        chart.showLoading();
+        var script = document.createElement('script');
+        script.src = DATA_DIR + '/' + index + '.js';
+        script.onload = script.onerror = function () {{
+            document.head.removeChild(script);
+        }};
+        document.head.appendChild(script);
+    }}
+
+    buttons.forEach(function (button, index) {{
+        button.onclick = function () {{ show(index); }};
+    }});
+
+    // 地址里的 #序号 直接打开对应的图，缩略图总览（thumbnail.ContactSheet）靠它链接到每个图
+    function indexFromHash() {{
+        var index = parseInt(location.hash.slice(1), 10);
+        return index >= 0 && index < buttons.length ? index : 0;
+    }}
+    window.addEventListener('hashchange', function () {{ show(indexFromHash()); }});
+    if (buttons.length > 0) show(indexFromHash());
+</script>
+</body>
+</html>
+"""
+
+
+class LazyTabPage:
+    """
+    多图页面的懒加载版本，用法同pyecharts的Tab：add(chart, tab_name)，最后render(path)
+    页面上只有一个图表实例，每个图的option单独写进data_dir下的{序号}.js，点到对应tab时才加载，
+    前端缓存最近看过的cache_size个；用<script>而不是fetch加载，本地file://打开也能用
+    """
+    page_title: str
+    data_dir: str
+    cache_size: int
+    width: str = "1600px"
+    height: str = "800px"
+    _tab_names: list
+    _js_functions: list
+
+    def __init__(self, page_title: str, data_dir: str = None, cache_size: int = 8):
+        """
+        :param page_title: 网页标题
+        :param data_dir: 每个图的数据文件目录，默认{page_title}_data
+        :param cache_size: 前端缓存的图表数
+        """
+        self.page_title = page_title
+        self.data_dir = data_dir or f'{page_title}_data'
+        self.cache_size = cache_size
+        self._tab_names = []
+        self._js_functions = []
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def add(self, chart, tab_name: str):
+        """
+        立即把chart的option写到数据文件里，不在内存里保留chart
+        """
+        if not self._tab_names:
+            self.width, self.height = chart.width, chart.height
+        index = len(self._tab_names)
+        with open(os.path.join(self.data_dir, f'{index}.js'), 'w', encoding='utf-8') as f:
+            f.write(f'window.azplotLoaded({index}, {dump_options(chart)});\n')
+        self._tab_names.append(tab_name)
+        # 图表的js_functions（如typed_array的解码函数）数据文件里会用到，页面上各放一份
+        for js_function in chart.js_functions.items:
+            if js_function not in self._js_functions:
+                self._js_functions.append(js_function)
+        return self
+
+    def render(self, path: str = 'render.html') -> str:
+        """
+        :return: 页面文件的绝对路径
+        """
+        data_dir = os.path.relpath(os.path.abspath(self.data_dir), os.path.dirname(os.path.abspath(path)))
+        buttons = ''.join(f'<button>{html.escape(str(name))}</button>' for name in self._tab_names)
+        page = PAGE_TEMPLATE.format(page_title=html.escape(self.page_title),
+                                    echarts_src=f'{CurrentConfig.ONLINE_HOST}echarts.min.js',
+                                    js_functions='\n'.join(self._js_functions),
+                                    buttons=buttons, width=self.width, height=self.height,
+                                    data_dir=json.dumps(data_dir.replace(os.sep, '/')), cache_size=self.cache_size)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(page)
+        return os.path.abspath(path)
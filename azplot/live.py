@@ -0,0 +1,361 @@
+import collections
+import json
+import math
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+from pyecharts.globals import CurrentConfig
+
+from . import serialize
+from .indicators import parse_indicator
+from .stock_bar import StockChartModel, StockChartView, round_half_up_pct
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{page_title}</title>
+    <script type="text/javascript" src="{echarts_src}"></script>
+</head>
+<body>
+<div id="chart" style="width:{width}; height:{height};"></div>
+<script>
+    var LINE_COUNT = {line_count};
+    // 页面里的option已经包含到SEQ为止的增量，订阅时让服务端补发之后的
+    var SEQ = {seq};
+    var chart = echarts.init(document.getElementById('chart'), 'white', {{renderer: 'canvas'}});
+    var option = {option};
+    chart.setOption(option);
+
+    var source = new EventSource('events?since=' + SEQ);
+    // 要补发的增量服务端已经不保留了，重新加载整个页面
+    source.addEventListener('reload', function () {{ location.reload(); }});
+    // 每条消息是一根K线：op为append时追加，为update时替换最后一根
+    source.onmessage = function (event) {{
+        var seq = Number(event.lastEventId);
+        if (seq <= SEQ) return;
+        SEQ = seq;
+        var bar = JSON.parse(event.data);
+        function put(data, value) {{
+            if (bar.op === 'append') data.push(value); else data[data.length - 1] = value;
+        }}
+        option.xAxis.forEach(function (axis) {{ put(axis.data, bar.date); }});
+        put(option.series[0].data, bar.ohlc);
+        for (var i = 0; i < LINE_COUNT; i++) put(option.series[1 + i].data, [bar.date, bar.lines[i]]);
+        put(option.series[1 + LINE_COUNT].data, bar.amount);
+        put(option.series[2 + LINE_COUNT].data, bar.returns);
+        var markPoint = option.series[0].markPoint = option.series[0].markPoint || {{data: []}};
+        markPoint.data = markPoint.data.filter(function (item) {{
+            return !(item.name === '板' && item.coord[0] === bar.date);
+        }});
+        if (bar.up_limit) {{
+            markPoint.data.push({{name: '板', coord: bar.up_limit, value: '板', itemStyle: {{color: '#66ccff'}}}});
+        }}
+        chart.setOption({{xAxis: option.xAxis, series: option.series}});
+    }};
+</script>
+</body>
+</html>
+"""
+
+
+class _RollingMean:
+    """
+    n日滚动均值的增量版，照搬pandas rolling(n).mean()的计算过程（加、减各自做Kahan补偿，全同值、符号的修正），
+    逐根喂入与一次性算整列的结果逐位相同；push/replace都是O(1)
+    """
+    n: int
+
+    def __init__(self, n: int):
+        self.n = n
+        self.__values: List[float] = []
+        # (和, 加的补偿, 减的补偿, 非NaN个数, 负数个数, 连续相同值个数, 上一个值)
+        self.__state = (0.0, 0.0, 0.0, 0, 0, 0, math.nan)
+        self.__before_last = self.__state
+
+    def push(self, value: float) -> float:
+        """
+        追加一个值
+        :return: 以它结尾的窗口的均值，不足n个（含NaN）时为NaN
+        """
+        self.__values.append(value)
+        self.__before_last = self.__state
+        return self.__step()
+
+    def replace(self, value: float) -> float:
+        """
+        替换最后一个值，从追加它之前的状态重新算
+        """
+        self.__values[-1] = value
+        self.__state = self.__before_last
+        return self.__step()
+
+    def __step(self) -> float:
+        total, add_comp, remove_comp, nobs, neg_ct, same_ct, prev = self.__state
+        values = self.__values
+        if len(values) == 1:
+            prev = values[0]
+        if len(values) > self.n:
+            old = values[-self.n - 1]
+            if old == old:
+                nobs -= 1
+                y = -old - remove_comp
+                t = total + y
+                remove_comp = t - total - y
+                total = t
+                neg_ct -= math.copysign(1.0, old) < 0
+        value = values[-1]
+        if value == value:
+            nobs += 1
+            y = value - add_comp
+            t = total + y
+            add_comp = t - total - y
+            total = t
+            neg_ct += math.copysign(1.0, value) < 0
+            same_ct = same_ct + 1 if value == prev else 1
+            prev = value
+        self.__state = (total, add_comp, remove_comp, nobs, neg_ct, same_ct, prev)
+
+        if nobs < self.n or nobs == 0:
+            return math.nan
+        if same_ct >= nobs:
+            return prev
+        mean = total / nobs
+        if (neg_ct == 0 and mean < 0) or (neg_ct == nobs and mean > 0):
+            return 0.0
+        return mean
+
+
+class LiveStockChart:
+    """
+    盘中实时刷新的K线图：模型常驻内存，append新K线或更新最后一根，均线增量维护（与重新构造模型的结果逐位相同），
+    每次只把变化的那一根通过SSE推给已打开的页面，单次更新的开销与历史长度无关；
+    每条增量带递增的序号，页面订阅时带上它已经包含的序号，中间错过的由服务端补发
+    用法：
+        live = StockChartController(dir).live_chart('sh601360')
+        live.serve(port=8765)  # 浏览器打开 http://127.0.0.1:8765/
+        live.append({'交易日期': ..., '开盘价': ..., '收盘价': ..., '最低价': ..., '最高价': ..., '前收盘价': ..., '成交额': ...})
+    """
+    model: StockChartModel
+    overlays: List[str]
+    windows: List[int]
+    server: ThreadingHTTPServer = None
+    __dates: List[str]
+    __k_line: List[List[float]]
+    __amount: List[float]
+    __returns: List[float]
+    __lines: List[List[float]]
+    __up_limits: List[dict]
+    __other_marks: List[dict]
+    __means: List[_RollingMean]
+    __seq: int
+    __history: collections.deque
+
+    def __init__(self, model: StockChartModel, overlays: List[str] = ('MA5', 'MA150'), history_size: int = 10000):
+        """
+        :param model: 初始数据
+        :param overlays: 均线，只支持MA{n}
+        :param history_size: 保留多少条最近的增量给断线重连的页面补发，更早的让页面整页重新加载
+        """
+        self.windows = []
+        for spec in overlays:
+            name, params = parse_indicator(spec)
+            if name != 'ma':
+                raise ValueError(f'live chart only supports MA overlays: {spec}')
+            params.setdefault('n', 5)
+            self.windows.append(params['n'])
+        self.overlays = list(overlays)
+        self.model = model
+
+        view = StockChartView(model, overlays=overlays)
+        self.__base_options = serialize.clean_options(view.options)
+        self.__page_title, self.__width, self.__height = view.page_title, view.width, view.height
+        self.__dates = list(model.dates)
+        self.__k_line = [list(bar) for bar in model.k_line_OCLH_data]
+        self.__amount = list(model.amount)
+        self.__returns = list(model.returns)
+        self.__lines = [list(model.ma(n)) for n in self.windows]
+        mark_points = self.__base_options['series'][0].get('markPoint', {}).get('data', [])
+        self.__up_limits = [item for item in mark_points if item.get('name') == '板']
+        self.__other_marks = [item for item in mark_points if item.get('name') != '板']
+        # 从包含预热K线的完整收盘价开始喂，之后的每一步与pandas整列计算时完全一样
+        self.__means = [_RollingMean(n) for n in self.windows]
+        for close in model.history('close').tolist():
+            for mean in self.__means:
+                mean.push(close)
+
+        self.__seq = 0
+        self.__history = collections.deque(maxlen=history_size)
+        self.__lock = threading.Lock()
+        self.__clients: List[queue.Queue] = []
+
+    def append(self, bar: dict) -> dict:
+        """
+        追加一根K线，交易日期与最后一根相同时视为更新最后一根
+        :param bar: 包含 交易日期、开盘价、收盘价、最低价、最高价、前收盘价、成交额
+        :return: 推送给页面的增量
+        """
+        date = pd.Timestamp(bar['交易日期']).strftime('%Y/%m/%d')
+        close = float(bar['收盘价'])
+        high = float(bar['最高价'])
+        returns = float(round_half_up_pct(close / float(bar['前收盘价']) - 1))
+        ohlc = [float(bar['开盘价']), close, float(bar['最低价']), high]
+
+        with self.__lock:
+            if self.__dates and date == self.__dates[-1]:
+                op = 'update'
+                values = [mean.replace(close) for mean in self.__means]
+            elif not self.__dates or date > self.__dates[-1]:
+                op = 'append'
+                values = [mean.push(close) for mean in self.__means]
+            else:
+                raise ValueError(f'bar {date} is older than the last bar {self.__dates[-1]}')
+
+            lines = [None if math.isnan(value) else value for value in values]
+            up_limit = [date, high * 1.02] if returns > 9.89 and high == close else None
+            self.__put(op, self.__dates, date)
+            self.__put(op, self.__k_line, ohlc)
+            self.__put(op, self.__amount, float(bar['成交额']))
+            self.__put(op, self.__returns, returns)
+            for line, value in zip(self.__lines, values):
+                self.__put(op, line, value)
+            self.__up_limits = [item for item in self.__up_limits if item['coord'][0] != date]
+            if up_limit is not None:
+                self.__up_limits.append({'name': '板', 'coord': up_limit, 'value': '板',
+                                         'itemStyle': {'color': '#66ccff'}})
+
+            message = {'op': op, 'date': date, 'ohlc': ohlc, 'amount': float(bar['成交额']), 'returns': returns,
+                       'lines': lines, 'up_limit': up_limit}
+            self.__seq += 1
+            delta = (self.__seq, json.dumps(message, ensure_ascii=False))
+            self.__history.append(delta)
+            for client in self.__clients:
+                client.put(delta)
+        return message
+
+    @staticmethod
+    def __put(op: str, values: list, value):
+        if op == 'append':
+            values.append(value)
+        else:
+            values[-1] = value
+
+    def options(self) -> dict:
+        """
+        当前完整的option，页面打开时用
+        """
+        return self.__snapshot()[0]
+
+    def __snapshot(self) -> Tuple[dict, int]:
+        """
+        :return: (当前完整的option, 它包含到的最后一条增量的序号)，两者在同一把锁里取，互相对得上
+        """
+        with self.__lock:
+            options = dict(self.__base_options)
+            options['xAxis'] = [dict(axis, data=list(self.__dates)) for axis in options['xAxis']]
+            series = [dict(s) for s in options['series']]
+            series[0]['data'] = [list(bar) for bar in self.__k_line]
+            series[0]['markPoint'] = dict(series[0].get('markPoint', {}),
+                                          data=self.__up_limits + self.__other_marks)
+            for i, values in enumerate(self.__lines):
+                series[1 + i]['data'] = [[date, value] for date, value in zip(self.__dates, values)]
+            series[1 + len(self.__lines)]['data'] = list(self.__amount)
+            series[2 + len(self.__lines)]['data'] = list(self.__returns)
+            options['series'] = series
+            return options, self.__seq
+
+    def page(self) -> str:
+        options, seq = self.__snapshot()
+        return PAGE_TEMPLATE.format(page_title=self.__page_title,
+                                    echarts_src=f'{CurrentConfig.ONLINE_HOST}echarts.min.js',
+                                    width=self.__width, height=self.__height, line_count=len(self.windows),
+                                    seq=seq, option=serialize.dumps(options))
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+        """
+        在后台线程启动本地HTTP服务：/ 是图表页面，/events?since={序号} 是SSE增量推送，
+        先补发序号之后的增量；浏览器断线重连时带的Last-Event-ID优先于since
+        """
+        live = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == '/':
+                    body = live.page().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif url.path == '/events':
+                    since = self.headers.get('Last-Event-ID') or parse_qs(url.query).get('since', [None])[0]
+                    try:
+                        since = None if since is None else int(since)
+                    except ValueError:
+                        self.send_error(400, f'bad sequence: {since}')
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Cache-Control', 'no-cache')
+                    self.end_headers()
+                    live._stream(self.wfile, since)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def _subscribe(self, since: Optional[int] = None) -> queue.Queue:
+        """
+        登记一个订阅者，与补发在同一把锁里，补发完之前不会有新增量插到前面
+        :param since: 页面已经包含的最后一条增量的序号，补发之后的；None不补发
+        :return: 放(序号, JSON)的队列，要补发的增量已经不保留时先放一个(None, None)，表示让页面重新加载
+        """
+        client = queue.Queue()
+        with self.__lock:
+            if since is not None and since < self.__seq:
+                oldest = self.__history[0][0] if self.__history else self.__seq + 1
+                if since + 1 < oldest:
+                    client.put((None, None))
+                else:
+                    for delta in self.__history:
+                        if delta[0] > since:
+                            client.put(delta)
+            self.__clients.append(client)
+        return client
+
+    def _stream(self, wfile, since: Optional[int] = None):
+        client = self._subscribe(since)
+        try:
+            while True:
+                try:
+                    seq, data = client.get(timeout=15)
+                    if seq is None:
+                        wfile.write(b'event: reload\ndata: \n\n')
+                    else:
+                        wfile.write(f'id: {seq}\ndata: {data}\n\n'.encode('utf-8'))
+                except queue.Empty:
+                    # 心跳，顺便发现已经断开的连接
+                    wfile.write(b': ping\n\n')
+                wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.__lock:
+                self.__clients.remove(client)
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,72 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+def bucket_starts(n: int, bucket_count: int) -> np.ndarray:
+    """
+    把 [0, n) 均匀切成最多bucket_count个连续的桶
+    :return: 每个桶的起始下标，升序，第一个是0
+    """
+    bucket_count = max(1, min(n, bucket_count))
+    return np.unique(np.linspace(0, n, bucket_count, endpoint=False).astype(np.int64))
+
+
+def bucket_ends(starts: np.ndarray, n: int) -> np.ndarray:
+    """
+    :return: 每个桶最后一个元素的下标
+    """
+    return np.append(starts[1:], n) - 1
+
+
+def aggregate_ohlc(open_, close, low, high, amount, starts: np.ndarray
+                   ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    按桶合并K线：开盘取桶内第一根，收盘取最后一根，最低/最高取极值，成交额求和
+    :param starts: bucket_starts的结果
+    :return: (open, close, low, high, amount)
+    """
+    close = np.asarray(close, dtype=np.float64)
+    ends = bucket_ends(starts, len(close))
+    return (np.asarray(open_, dtype=np.float64)[starts],
+            close[ends],
+            np.fmin.reduceat(np.asarray(low, dtype=np.float64), starts),
+            np.fmax.reduceat(np.asarray(high, dtype=np.float64), starts),
+            np.add.reduceat(np.nan_to_num(np.asarray(amount, dtype=np.float64)), starts))
+
+
+def minmax_indices(series: List[np.ndarray], max_points: int) -> np.ndarray:
+    """
+    min/max分桶抽稀：每个桶里保留每条序列的最小值点和最大值点，首尾点总是保留
+    多条序列共用同一个x轴，所以返回的是所有序列选中下标的并集
+    :param series: 等长的一维数组
+    :param max_points: 目标点数，实际点数不会超过它；不够每条序列在一个桶里取最小、最大值时只保留首尾（小于2时只保留首点）
+    :return: 升序、去重后的下标
+    """
+    n = len(series[0])
+    if n <= max_points:
+        return np.arange(n)
+    # 每个桶每条序列最多贡献2个点，加上首尾正好不超过max_points
+    bucket_count = (max_points - 2) // (2 * len(series))
+    if bucket_count < 1:
+        return np.array([0, n - 1][:max(1, max_points)])
+    starts = bucket_starts(n, bucket_count)
+    bucket_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    picked = [np.array([0, n - 1])]
+    for values in series:
+        values = np.asarray(values, dtype=np.float64)
+        for reduce in (np.fmin, np.fmax):
+            hits = np.flatnonzero(values == reduce.reduceat(values, starts)[bucket_ids])
+            # 同一个桶里有多个相同的极值，只取第一个
+            _, first = np.unique(bucket_ids[hits], return_index=True)
+            picked.append(hits[first])
+    return np.unique(np.concatenate(picked))
+
+
+def compound_returns(returns, indices: np.ndarray) -> np.ndarray:
+    """
+    把逐日涨跌幅（小数）复利合并到抽稀后的点上：每个点的值是从上一个选中点之后到该点的累计涨跌幅
+    """
+    growth = np.cumprod(1 + np.nan_to_num(np.asarray(returns, dtype=np.float64)))
+    previous = np.append(1.0, growth[indices[:-1]])
+    return growth[indices] / previous - 1
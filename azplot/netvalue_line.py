@@ -1,11 +1,26 @@
 import datetime
+import warnings
 from pandas.api.types import is_datetime64_any_dtype as is_datetime
-from typing import List
+from typing import Dict, List, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from pyecharts import options as opts
 from pyecharts.charts import Line, Bar, Grid
-import azhint
+
+from . import serialize
+from .batch import BatchManifest
+from .lod import compound_returns, minmax_indices
+from .profiling import ChartProfile, ChartProfiler
+from .typed_array import ColumnEncoding, DECODER_JS, encode_source, resolve_encodings
+
+
+# typed_arrays模式下各列的默认编码：净值四舍五入到4位小数差值编码，涨跌幅（小数）四舍五入到6位小数
+NET_VALUE_ENCODINGS = {
+    'net': ColumnEncoding(decimals=4, delta=True, lossy=True),
+    'benchmark': ColumnEncoding(decimals=4, delta=True, lossy=True),
+    'returns': ColumnEncoding(decimals=6, lossy=True),
+}
 
 
 class NetLineModel:
@@ -21,6 +36,7 @@ class NetLineModel:
         :param equity_df: ['equity_curve'：净值, '涨跌幅', 'benchmark'：基准净值]
         :return:
         """
+        import azhint
         azhint.df_check(equity_df, ['equity_curve', '涨跌幅', 'benchmark'])
         self.equity_df = equity_df
         self.dates = equity_df.index.strftime('%Y/%m/%d').values.tolist() \
@@ -34,13 +50,30 @@ class NetLineModel:
 
 class NetLineView(Grid):
 
-    def __init__(self, model: NetLineModel):
+    def __init__(self, model: NetLineModel, max_points: int = None, use_dataset: bool = False,
+                 typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False):
+        """
+        :param model:
+        :param max_points: 最多输出的点数，超过时按桶保留净值/基准的最小、最大值点，涨跌幅复利合并到保留的点上；None不抽稀
+        :param use_dataset: 用ECharts的dataset + encode输出数据，日期只序列化一次
+        :param typed_arrays: dataset里的各列编码成base64数组，隐含use_dataset；True用NET_VALUE_ENCODINGS，
+                             也可以传 {列名: ColumnEncoding} 覆盖，列名是date、net、benchmark、returns
+        """
+        dates, net_values, benchmark, returns = model.dates, model.net_values, model.benchmark, model.returns
+        if max_points is not None and len(dates) > max_points:
+            indices = minmax_indices([np.asarray(net_values, dtype=np.float64),
+                                      np.asarray(benchmark, dtype=np.float64)], max_points)
+            dates = np.asarray(dates)[indices].tolist()
+            net_values = np.asarray(net_values, dtype=np.float64)[indices].tolist()
+            benchmark = np.asarray(benchmark, dtype=np.float64)[indices].tolist()
+            returns = compound_returns(returns, indices).tolist()
+
         net_line = (
             Line()
-            .add_xaxis(xaxis_data=model.dates)
+            .add_xaxis(xaxis_data=dates)
             .add_yaxis(
                 series_name="净值",
-                y_axis=model.net_values,
+                y_axis=net_values,
                 symbol_size=0,
                 is_smooth=False,  # 曲线平滑
                 is_hover_animation=False,  # 是否开启 hover 在拐点标志上的提示动画效果。
@@ -58,7 +91,7 @@ class NetLineView(Grid):
             )
             .add_yaxis(
                 series_name="基准净值",
-                y_axis=model.benchmark,
+                y_axis=benchmark,
                 symbol_size=0,
                 is_smooth=False,
                 is_hover_animation=False,
@@ -101,10 +134,10 @@ class NetLineView(Grid):
 
         returns_bar = (
             Bar()
-            .add_xaxis(xaxis_data=model.dates)
+            .add_xaxis(xaxis_data=dates)
             .add_yaxis(
                 series_name="涨跌幅",
-                y_axis=model.returns,
+                y_axis=returns,
                 xaxis_index=1,
                 yaxis_index=1,
                 label_opts=opts.LabelOpts(is_show=False),
@@ -146,18 +179,288 @@ class NetLineView(Grid):
                       ))
         self.add(net_line, grid_opts=opts.GridOpts(pos_left='10%', pos_right='8%', height='70%'))
         self.add(returns_bar, grid_opts=opts.GridOpts(pos_left="10%", pos_right="8%", pos_top="80%", height="20%"))
+        if use_dataset or typed_arrays:
+            # series顺序：净值、基准净值、涨跌幅
+            source = {'date': dates, 'net': net_values, 'benchmark': benchmark, 'returns': returns}
+            if typed_arrays:
+                source = encode_source(source, resolve_encodings(typed_arrays, NET_VALUE_ENCODINGS),
+                                       default=NET_VALUE_ENCODINGS['returns'])
+                self.add_js_funcs(DECODER_JS)
+            self.options['dataset'] = {'source': source}
+            for chart_series, y in zip(self.options['series'], ['net', 'benchmark', 'returns']):
+                chart_series.pop('data', None)
+                chart_series['encode'] = {'x': 'date', 'y': y}
+            for axis in self.options['xAxis']:
+                axis.pop('data', None)
+
+
+class NetSweepModel:
+    """
+    参数扫描的多条净值曲线：所有曲线一次对齐到日期并集上，存成 日期 × 曲线 的float32二维数组，
+    各曲线的期末净值、最大回撤、夏普比率按列向量化计算
+    """
+    name: str
+    names: List[str]
+    dates: List[str]
+    values: np.ndarray  # float32，shape为(日期数, 曲线数)，曲线开始之前为NaN
+    benchmark: np.ndarray  # float32，没有基准时为None
+    stats: pd.DataFrame
+
+    def __init__(self, curves: Union[pd.DataFrame, Dict[str, pd.DataFrame]], name: str = '参数扫描',
+                 benchmark: pd.Series = None, annual_days: int = 252):
+        """
+        :param curves: 宽表（index是日期，每列一条净值曲线，列名是参数组合），
+                       或 参数组合 -> equity_df（见NetLineModel，只用equity_curve列，没传benchmark时取第一个的benchmark列）
+        :param benchmark: 基准净值，index是日期
+        :param annual_days: 计算年化夏普比率用的每年交易日数
+        """
+        if isinstance(curves, dict):
+            if benchmark is None:
+                benchmark = next((df['benchmark'] for df in curves.values() if 'benchmark' in df.columns), None)
+            # 一次concat完成所有曲线在日期并集上的对齐
+            curves = pd.concat({key: df['equity_curve'] for key, df in curves.items()}, axis=1)
+        curves = curves.sort_index()
+        observed = curves.notna().to_numpy()
+        # 曲线在某些日期没有数据（如不交易的品种）时沿用前一天的净值
+        curves = curves.ffill()
+        self.name = name
+        self.names = [str(column) for column in curves.columns]
+        self.dates = curves.index.strftime('%Y/%m/%d').values.tolist() \
+            if is_datetime(curves.index) \
+            else curves.index.values.tolist()
+        self.values = curves.to_numpy(dtype=np.float32)
+        self.benchmark = None if benchmark is None else \
+            benchmark.reindex(curves.index).ffill().to_numpy(dtype=np.float32)
+        self.stats = self.__compute_stats(curves.to_numpy(dtype=np.float64), observed, annual_days)
+
+    def __compute_stats(self, values: np.ndarray, observed: np.ndarray, annual_days: int) -> pd.DataFrame:
+        """
+        :param values: 前向填充后的float64净值，不用存下来的float32，结果与逐条曲线单独计算相同
+        :param observed: 填充前有数据的位置
+        """
+        # fmax.accumulate跳过曲线开始前的NaN
+        drawdown = values / np.fmax.accumulate(values, axis=0) - 1
+        # 只取这条曲线自己有数据的那天的收益率：填充出来的日子收益率是0，会把夏普比率拉向0；
+        # 前一天是填充的值时，它就是上一个有数据的净值，收益率与单独对这条曲线pct_change相同
+        returns = np.where(observed[1:], values[1:] / values[:-1] - 1, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sharpe = np.nanmean(returns, axis=0) / np.nanstd(returns, axis=0, ddof=1) * np.sqrt(annual_days)
+        return pd.DataFrame({
+            'final_nav': values[-1],
+            'max_drawdown': np.nanmin(drawdown, axis=0),
+            'sharpe': sharpe,
+        }, index=self.names)
+
+    def top(self, n: int, by: str = 'final_nav') -> List[int]:
+        """
+        :param by: stats的列名，max_drawdown越大（回撤越小）越好
+        :return: 排名前n的曲线在values里的列号
+        """
+        scores = self.stats[by].to_numpy()
+        order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind='stable')
+        return order[:n].tolist()
+
+    def percentile_band(self, low: float = 5, high: float = 95) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: 每个日期上所有曲线净值的 (low分位, 中位数, high分位)
+        """
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            # 所有曲线都还没开始的日期是全NaN，结果为NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            band = np.nanpercentile(self.values, [low, 50, high], axis=1)
+        return band[0], band[1], band[2]
+
+
+class NetSweepView(Grid):
+
+    def __init__(self, model: NetSweepModel, top_n: int = 10, by: str = 'final_nav', band: Tuple[float, float] = (5, 95),
+                 max_points: int = None):
+        """
+        只画排名前top_n的曲线、全部曲线的分位带和中位数，曲线再多页面上也只有top_n + 4条series
+        :param top_n: 画出的曲线数
+        :param by: 排名依据，见NetSweepModel.top
+        :param band: 分位带的上下分位数
+        :param max_points: 最多输出的点数，超过时按桶保留各条线的最小、最大值点；None不抽稀
+        """
+        top = model.top(top_n, by=by)
+        low, median, high = model.percentile_band(*band)
+        lines = [model.values[:, i] for i in top]
+        dates = model.dates
+        benchmark = model.benchmark
+        if max_points is not None and len(dates) > max_points:
+            indices = minmax_indices([low, median, high, *lines], max_points)
+            dates = np.asarray(dates)[indices].tolist()
+            low, median, high = low[indices], median[indices], high[indices]
+            lines = [values[indices] for values in lines]
+            benchmark = None if benchmark is None else benchmark[indices]
+
+        line = Line().add_xaxis(xaxis_data=dates)
+        # 分位带：下沿是透明的线，上沿减下沿堆叠在它上面填色
+        line.add_yaxis(
+            series_name=f'{band[0]:g}分位',
+            y_axis=_float_list(low),
+            stack='band',
+            symbol_size=0,
+            is_hover_animation=False,
+            linestyle_opts=opts.LineStyleOpts(opacity=0),
+            label_opts=opts.LabelOpts(is_show=False),
+        )
+        line.add_yaxis(
+            series_name=f'{band[0]:g}-{band[1]:g}分位带',
+            y_axis=_float_list(high - low),
+            stack='band',
+            symbol_size=0,
+            is_hover_animation=False,
+            linestyle_opts=opts.LineStyleOpts(opacity=0),
+            areastyle_opts=opts.AreaStyleOpts(opacity=0.2, color='#999999'),
+            label_opts=opts.LabelOpts(is_show=False),
+        )
+        line.add_yaxis(
+            series_name='中位数',
+            y_axis=_float_list(median),
+            symbol_size=0,
+            is_hover_animation=False,
+            linestyle_opts=opts.LineStyleOpts(width=1, type_='dashed', color='#666666'),
+            label_opts=opts.LabelOpts(is_show=False),
+        )
+        if benchmark is not None:
+            line.add_yaxis(
+                series_name='基准净值',
+                y_axis=_float_list(benchmark),
+                symbol_size=0,
+                is_hover_animation=False,
+                linestyle_opts=opts.LineStyleOpts(width=1, color='#000000'),
+                label_opts=opts.LabelOpts(is_show=False),
+            )
+        for i, values in zip(top, lines):
+            line.add_yaxis(
+                series_name=model.names[i],
+                y_axis=_float_list(values),
+                symbol_size=0,
+                is_hover_animation=False,
+                linestyle_opts=opts.LineStyleOpts(width=1, opacity=1),
+                label_opts=opts.LabelOpts(is_show=False),
+            )
+        line.set_global_opts(
+            title_opts=opts.TitleOpts(title=model.name, subtitle=f'{len(model.names)}条曲线，按{by}取前{len(top)}条',
+                                      pos_left="center"),
+            legend_opts=opts.LegendOpts(type_='scroll', pos_bottom=10, pos_left="center"),
+            datazoom_opts=[
+                opts.DataZoomOpts(is_show=False, type_="inside", range_start=0, range_end=100),
+                opts.DataZoomOpts(is_show=True, type_="slider", pos_bottom=40, range_start=0, range_end=100),
+            ],
+            yaxis_opts=opts.AxisOpts(
+                is_scale=True,
+                splitarea_opts=opts.SplitAreaOpts(
+                    is_show=True, areastyle_opts=opts.AreaStyleOpts(opacity=1)
+                ),
+            ),
+            tooltip_opts=opts.TooltipOpts(trigger="axis"),
+            toolbox_opts=opts.ToolboxOpts(is_show=True),
+            xaxis_opts=opts.AxisOpts(type_="category", boundary_gap=False),
+        )
+
+        Grid.__init__(self,
+                      init_opts=opts.InitOpts(
+                          width="1600px",
+                          height="800px",
+                          page_title=model.name,
+                          animation_opts=opts.AnimationOpts(animation=False),
+                      ))
+        self.add(line, grid_opts=opts.GridOpts(pos_left='10%', pos_right='8%', height='70%'))
+
+
+def _float_list(values: np.ndarray) -> List[float]:
+    """
+    float32转成float64后保留4位小数再转list，避免输出1.0299999713897705这样的尾巴；NaN输出为null
+    """
+    return np.round(values.astype(np.float64), 4).tolist()
 
 
 class NetLineController:
-    def draw(self, equity_df: pd.DataFrame, name: str = '策略净值'):
+    profiler: ChartProfiler = None
+
+    def __init__(self, profiler: ChartProfiler = None):
+        """
+        :param profiler: 记录每个图表各阶段（model、view、render）的耗时、内存峰值，输出大小和各series的点数，
+                         见profiling.ChartProfiler
+        """
+        self.profiler = profiler
+
+    def draw(self, equity_df: pd.DataFrame, name: str = '策略净值', max_points: int = None,
+             use_dataset: bool = False, typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False):
+        import webbrowser
+        profile = ChartProfile(name) if self.profiler is None else self.profiler.new_profile(name)
+        with profile.stage('model'):
+            model = NetLineModel(equity_df=equity_df, name=name)
+        with profile.stage('view'):
+            chart = NetLineView(model=model, max_points=max_points, use_dataset=use_dataset,
+                                typed_arrays=typed_arrays)
+        with profile.stage('render'):
+            chart_result = chart.render()
+        self.__finish_profile(profile, chart, chart_result)
+
+        webbrowser.open_new(chart_result)
+        return chart_result
+
+    def draw_sweep(self, curves: Union[pd.DataFrame, Dict[str, pd.DataFrame]], name: str = '参数扫描',
+                   benchmark: pd.Series = None, top_n: int = 10, by: str = 'final_nav',
+                   band: Tuple[float, float] = (5, 95), max_points: int = None) -> str:
+        """
+        参数扫描的所有净值曲线画在一张图上，见NetSweepModel、NetSweepView
+        :return: HTML文件路径；各曲线的统计指标在NetSweepModel(curves).stats里
+        """
         import webbrowser
-        model = NetLineModel(equity_df=equity_df, name=name)
-        chart_result = NetLineView(model=model).render()
+        profile = ChartProfile(name) if self.profiler is None else self.profiler.new_profile(name)
+        with profile.stage('model'):
+            model = NetSweepModel(curves, name=name, benchmark=benchmark)
+        with profile.stage('view'):
+            chart = NetSweepView(model, top_n=top_n, by=by, band=band, max_points=max_points)
+        with profile.stage('render'):
+            chart_result = chart.render()
+        self.__finish_profile(profile, chart, chart_result)
 
         webbrowser.open_new(chart_result)
         return chart_result
 
+    def render_batch(self, equity_dfs: Dict[str, pd.DataFrame], output_dir: str, fast_json: bool = True,
+                     max_points: int = None, use_dataset: bool = False,
+                     typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False) -> List[dict]:
+        """
+        无浏览器批量渲染：每条净值曲线一个{name}.html写到output_dir，并写出manifest.json；单个失败不影响其他
+        :param equity_dfs: 名称 -> equity_df
+        :param fast_json: 用serialize.dump_options（orjson）代替pyecharts默认的option序列化
+        :param typed_arrays: 见NetLineView
+        :return: manifest记录，每条包含name、path、bytes、seconds（各阶段耗时），失败的还有error
+        """
+        manifest = BatchManifest(output_dir)
+        for name, equity_df in equity_dfs.items():
+            # 没有profiler也要记耗时写进manifest，只是不跟踪内存
+            profile = ChartProfile(name) if self.profiler is None else self.profiler.new_profile(name)
+            try:
+                with profile.stage('model'):
+                    model = NetLineModel(equity_df=equity_df, name=name)
+                with profile.stage('view'):
+                    chart = NetLineView(model=model, max_points=max_points, use_dataset=use_dataset,
+                                        typed_arrays=typed_arrays)
+                with profile.stage('render'):
+                    path = serialize.render(chart, manifest.path_for(name), fast_json=fast_json)
+            except Exception as e:
+                manifest.add(name, timings=profile.timings, error=f'{type(e).__name__}: {e}')
+                continue
+            manifest.add(name, path, profile.timings)
+            self.__finish_profile(profile, chart, path)
+        manifest.write()
+        return manifest.entries
+
+    def __finish_profile(self, profile: ChartProfile, chart, path: str):
+        if self.profiler is None:
+            return
+        profile.record_chart(chart)
+        profile.record_output(path)
+        self.profiler.add(profile)
+
 
-def draw_net_value(equity_df: pd.DataFrame, name: str = '策略净值'):
-    NetLineController().draw(equity_df=equity_df, name=name)
+def draw_net_value(equity_df: pd.DataFrame, name: str = '策略净值', max_points: int = None):
+    NetLineController().draw(equity_df=equity_df, name=name, max_points=max_points)
 
@@ -0,0 +1,344 @@
+import glob
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .stock_data import read_stock_csv
+
+
+class MarketPanel:
+    """
+    把整个stock_data_dir合并成一份内存映射的列存面板：每列一个连续的.bin文件（np.memmap），
+    外加 代码 -> 行段 的索引和交易日历。按代码、日期范围取数据都是memmap上的切片，不拷贝、不再逐个打开CSV
+    用法：
+        panel = MarketPanel.build(stock_data_dir)    # 第一次：读全部CSV
+        panel = MarketPanel(panel_dir, stock_data_dir)
+        panel.update()                               # 之后：只读有变化的CSV，只追加新的交易日
+        StockChartController(stock_data_dir, panel=panel)
+    追加的行写在文件末尾，同一代码会变成多段，读取时拼接（会拷贝）；compact()把每个代码重新排成一段
+    """
+    panel_dir: str
+    stock_data_dir: str
+    calendar: np.ndarray  # 所有出现过的交易日，datetime64[ns]，升序
+    __schema: List[dict]  # [{'name': 列名, 'dtype': 存储类型, 'vocab': 字符串列的取值表}]
+    __index: Dict[str, dict]  # 代码 -> {'segments': [[起始行, 行数], ...], 'mtime_ns': ..., 'size': ...}
+    __rows: int
+    __arrays: Dict[str, np.memmap]
+    __vocab_ids: Dict[str, Dict[str, int]]
+
+    META_FILE = 'meta.json'
+    DATE_COLUMN = '交易日期'
+    # 字符串列缺失值（包括没有这一列）的编号，不占取值表里的位置
+    MISSING_ID = -1
+
+    def __init__(self, panel_dir: str, stock_data_dir: str = None):
+        """
+        :param panel_dir: 面板目录，不存在时是一个空面板，第一次update时创建
+        :param stock_data_dir: 源CSV目录，update时用；不传则用构建时记录的目录
+        """
+        self.panel_dir = panel_dir
+        meta = {}
+        try:
+            with open(os.path.join(panel_dir, self.META_FILE), encoding='utf-8') as f:
+                meta = json.load(f)
+        except OSError:
+            pass
+        self.stock_data_dir = stock_data_dir or meta.get('stock_data_dir')
+        self.__schema = meta.get('schema', [])
+        self.__index = meta.get('index', {})
+        self.__rows = meta.get('rows', 0)
+        self.calendar = np.array(meta.get('calendar', []), dtype='datetime64[D]').astype('datetime64[ns]')
+        self.__arrays = {}
+        self.__vocab_ids = {column['name']: {value: i for i, value in enumerate(column['vocab'])}
+                            for column in self.__schema if 'vocab' in column}
+
+    @classmethod
+    def build(cls, stock_data_dir: str, panel_dir: str = None) -> 'MarketPanel':
+        """
+        :param panel_dir: 默认放在stock_data_dir旁边：{stock_data_dir}_azplot_panel
+        """
+        panel = cls(panel_dir or stock_data_dir.rstrip('/\\') + '_azplot_panel', stock_data_dir)
+        panel.update()
+        return panel
+
+    @property
+    def codes(self) -> List[str]:
+        return list(self.__index)
+
+    @property
+    def columns(self) -> List[str]:
+        return [column['name'] for column in self.__schema]
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.__index
+
+    def __len__(self):
+        return len(self.__index)
+
+    def column(self, name: str, code: str, start=None, end=None) -> np.ndarray:
+        """
+        一只股票某一列在[start, end]交易日之间的值；只有一段时是memmap上的只读切片
+        字符串列返回取值表里的编号，见vocab；缺失值是MISSING_ID
+        """
+        rows = self.__row_slices(code, start, end)
+        array = self.__array(name)
+        if len(rows) == 1:
+            return array[rows[0]]
+        return np.concatenate([array[s] for s in rows])
+
+    def vocab(self, name: str) -> List[str]:
+        """
+        字符串列的取值表，column返回的编号是它的下标
+        """
+        return self.__column_schema(name)['vocab']
+
+    def frame(self, code: str, start=None, end=None) -> pd.DataFrame:
+        """
+        :param start: 起始交易日（含），不传则从头开始
+        :param end: 结束交易日（含），不传则到最后
+        :return: 与read_stock_csv结果相同的DataFrame；数值列不拷贝、只读，调用方可以加列但不能原地改已有的列
+        """
+        columns = {}
+        for column in self.__schema:
+            values = self.column(column['name'], code, start, end)
+            if 'vocab' in column:
+                # 末尾多放一个None，MISSING_ID（-1）正好取到它
+                values = np.asarray(column['vocab'] + [None], dtype=object)[values]
+            columns[column['name']] = values
+        return pd.DataFrame(columns, copy=False)
+
+    def frames(self, codes: Iterable[str], start=None, end=None) -> Dict[str, pd.DataFrame]:
+        """
+        多只股票的frame，面板里没有的代码跳过
+        """
+        return {code: self.frame(code, start, end) for code in codes if code in self.__index}
+
+    def update(self, codes: Iterable[str] = None) -> List[str]:
+        """
+        从stock_data_dir增量更新：只读mtime、size变化了的CSV；历史行没变时只追加新的交易日，
+        历史行有改动（如复权重算）时整只股票重新追加一份，旧的行段作废，等compact回收
+        :param codes: 只检查这些代码，不传则扫描整个目录
+        :return: 有改动的代码
+        """
+        if self.stock_data_dir is None:
+            raise ValueError('stock_data_dir is required to update a panel')
+        if codes is None:
+            codes = sorted(os.path.splitext(os.path.basename(path))[0]
+                           for path in glob.glob(os.path.join(self.stock_data_dir, '*.csv')))
+        batch = {}
+        for code in codes:
+            stat = os.stat(f'{self.stock_data_dir}/{code}.csv')
+            entry = self.__index.get(code)
+            if entry is not None and (entry['mtime_ns'], entry['size']) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            batch[code] = (read_stock_csv(f'{self.stock_data_dir}/{code}.csv'), (stat.st_mtime_ns, stat.st_size),
+                           False)
+        return self.__append(batch)
+
+    def append_frame(self, day_df: pd.DataFrame) -> List[str]:
+        """
+        直接追加一份横截面数据（如当天收盘后的全市场日线），不必等CSV更新
+        :param day_df: 包含股票代码列，可以有多个交易日；每只股票只追加比面板里最后一天更新的行
+        :return: 有追加的代码
+        """
+        day_df = day_df.dropna(subset=['成交额'])
+        day_df = day_df.assign(**{self.DATE_COLUMN: pd.to_datetime(day_df[self.DATE_COLUMN])})
+        batch = {}
+        for code, stock_data in day_df.groupby('股票代码', sort=False):
+            stock_data = stock_data.sort_values(self.DATE_COLUMN)
+            if code in self.__index:
+                last_date = self.column(self.DATE_COLUMN, code)[-1]
+                stock_data = stock_data[stock_data[self.DATE_COLUMN].to_numpy() > last_date]
+                if stock_data.empty:
+                    continue
+                entry = self.__index[code]
+                batch[code] = (stock_data, (entry['mtime_ns'], entry['size']), True)
+            else:
+                # 源CSV的签名未知，下次update会完整读一遍这只股票
+                batch[code] = (stock_data.reset_index(drop=True), (None, None), True)
+        return self.__append(batch)
+
+    def compact(self):
+        """
+        把每只股票重新排成连续的一段，回收update留下的作废行
+        """
+        if not self.__index:
+            return
+        order = [self.__row_slices(code) for code in self.__index]
+        tmp_dir = f'{self.panel_dir}.tmp{os.getpid()}'
+        os.makedirs(tmp_dir, exist_ok=True)
+        for i, column in enumerate(self.__schema):
+            array = self.__array(column['name'])
+            with open(os.path.join(tmp_dir, f'{i}.bin'), 'wb') as f:
+                for rows in order:
+                    for s in rows:
+                        f.write(np.ascontiguousarray(array[s]).tobytes())
+        offset = 0
+        for code, rows in zip(self.__index, order):
+            length = sum(s.stop - s.start for s in rows)
+            self.__index[code]['segments'] = [[offset, length]]
+            offset += length
+        self.__arrays.clear()
+        for i in range(len(self.__schema)):
+            os.replace(os.path.join(tmp_dir, f'{i}.bin'), self.__bin_path(i))
+        os.rmdir(tmp_dir)
+        self.__rows = offset
+        self.__write_meta()
+
+    def __append(self, batch: Dict[str, Tuple[pd.DataFrame, tuple, bool]]) -> List[str]:
+        """
+        :param batch: 代码 -> (清洗后的日线, 源CSV签名, 是否只含新增行)；不只含新增行时先与面板里的历史比对
+        """
+        if not batch:
+            return []
+        if not self.__schema:
+            first = next(iter(batch.values()))[0]
+            self.__schema = [self.__infer_column(name, values) for name, values in first.items()]
+            self.__vocab_ids = {column['name']: {} for column in self.__schema if 'vocab' in column}
+        os.makedirs(self.panel_dir, exist_ok=True)
+        # 关掉自己的memmap再写文件（Windows上映射着的文件不能截断）
+        self.__arrays.clear()
+        files = []
+        for i, column in enumerate(self.__schema):
+            f = open(self.__bin_path(i), 'ab+')
+            # 上次写到一半中断时，meta之后多出来的字节丢掉
+            f.truncate(self.__rows * np.dtype(column['dtype']).itemsize)
+            f.seek(0, os.SEEK_END)
+            files.append(f)
+
+        changed = []
+        new_dates = []
+        try:
+            for code, (stock_data, signature, only_new) in batch.items():
+                segments = self.__index[code]['segments'] if code in self.__index else []
+                if segments and not only_new:
+                    stock_data, rewrite = self.__new_rows(code, stock_data)
+                    if rewrite:
+                        # 历史行有变化：整只股票重新追加一份，旧的行段作废
+                        segments = []
+                if not stock_data.empty:
+                    for f, column in zip(files, self.__schema):
+                        f.write(self.__encode(column, stock_data).tobytes())
+                    segments = self.__extend_segments(segments, len(stock_data))
+                    self.__rows += len(stock_data)
+                    new_dates.append(stock_data[self.DATE_COLUMN].to_numpy().astype('datetime64[ns]'))
+                    changed.append(code)
+                self.__index[code] = {'segments': segments, 'mtime_ns': signature[0], 'size': signature[1]}
+        finally:
+            for f in files:
+                f.close()
+        # 比对历史时按旧行数打开过memmap，行数变了要重新打开
+        self.__arrays.clear()
+        if new_dates:
+            self.calendar = np.union1d(self.calendar, np.concatenate(new_dates))
+        self.__write_meta()
+        return changed
+
+    def __new_rows(self, code: str, stock_data: pd.DataFrame) -> Tuple[pd.DataFrame, bool]:
+        """
+        :return: (要追加的行, 是否整只股票重写)；面板里已有的交易日和收盘价都没变时只返回后面新增的行
+        """
+        count = len(self.column(self.DATE_COLUMN, code))
+        head = stock_data.iloc[:count]
+        unchanged = len(stock_data) >= count and all(
+            np.array_equal(self.column(name, code), self.__encode(self.__column_schema(name), head), equal_nan=True)
+            for name in (self.DATE_COLUMN, '收盘价'))
+        if unchanged:
+            return stock_data.iloc[count:], False
+        return stock_data, True
+
+    def __extend_segments(self, segments: List[List[int]], length: int) -> List[List[int]]:
+        if segments and segments[-1][0] + segments[-1][1] == self.__rows:
+            # 与这只股票最后一段首尾相接，直接延长
+            return segments[:-1] + [[segments[-1][0], segments[-1][1] + length]]
+        return segments + [[self.__rows, length]]
+
+    def __encode(self, column: dict, stock_data: pd.DataFrame) -> np.ndarray:
+        name, dtype = column['name'], column['dtype']
+        if name not in stock_data:
+            if 'vocab' in column:
+                missing = self.MISSING_ID
+            elif dtype == 'datetime64[ns]':
+                missing = np.datetime64('NaT')
+            else:
+                missing = np.nan
+            return np.full(len(stock_data), missing).astype(dtype)
+        values = stock_data[name]
+        if 'vocab' in column:
+            ids = self.__vocab_ids[name]
+            for value in values.dropna().unique():
+                if value not in ids:
+                    ids[value] = len(column['vocab'])
+                    column['vocab'].append(value)
+            return values.map(ids).fillna(self.MISSING_ID).to_numpy(dtype=dtype)
+        if dtype == 'datetime64[ns]':
+            return pd.to_datetime(values).to_numpy().astype(dtype)
+        return values.to_numpy(dtype=dtype)
+
+    @staticmethod
+    def __infer_column(name: str, values: pd.Series) -> dict:
+        if values.dtype.kind == 'M':
+            return {'name': name, 'dtype': 'datetime64[ns]'}
+        if values.dtype.kind in 'biuf':
+            return {'name': name, 'dtype': 'float64'}
+        # 字符串列存成取值表里的编号
+        return {'name': name, 'dtype': 'int32', 'vocab': []}
+
+    def __column_schema(self, name: str) -> dict:
+        for column in self.__schema:
+            if column['name'] == name:
+                return column
+        raise KeyError(name)
+
+    def __array(self, name: str) -> np.ndarray:
+        array = self.__arrays.get(name)
+        if array is None:
+            i = self.columns.index(name)
+            dtype = np.dtype(self.__schema[i]['dtype'])
+            if self.__rows == 0:
+                array = np.empty(0, dtype=dtype)
+            else:
+                array = np.memmap(self.__bin_path(i), dtype=dtype, mode='r', shape=(self.__rows,))
+            self.__arrays[name] = array
+        return array
+
+    def __row_slices(self, code: str, start=None, end=None) -> List[slice]:
+        entry = self.__index.get(code)
+        if entry is None:
+            raise KeyError(code)
+        rows = [slice(offset, offset + length) for offset, length in entry['segments']]
+        if start is None and end is None:
+            return rows or [slice(0, 0)]
+        # 各段按日期先后排列，整体二分查找后再映射回行段
+        dates = self.__array(self.DATE_COLUMN)
+        lengths = np.cumsum([0] + [s.stop - s.start for s in rows])
+        code_dates = dates[rows[0]] if len(rows) == 1 else np.concatenate([dates[s] for s in rows])
+        left = 0 if start is None else int(code_dates.searchsorted(np.datetime64(pd.Timestamp(start), 'ns')))
+        right = len(code_dates) if end is None else \
+            int(code_dates.searchsorted(np.datetime64(pd.Timestamp(end), 'ns'), side='right'))
+        result = []
+        for s, base in zip(rows, lengths):
+            lo, hi = max(left - base, 0), min(right - base, s.stop - s.start)
+            if lo < hi:
+                result.append(slice(s.start + lo, s.start + hi))
+        return result or [slice(0, 0)]
+
+    def __bin_path(self, i: int) -> str:
+        return os.path.join(self.panel_dir, f'{i}.bin')
+
+    def __write_meta(self):
+        meta = {
+            'stock_data_dir': self.stock_data_dir,
+            'rows': self.__rows,
+            'schema': self.__schema,
+            'index': self.__index,
+            'calendar': np.datetime_as_string(self.calendar, unit='D').tolist(),
+        }
+        tmp_path = os.path.join(self.panel_dir, self.META_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        # meta最后原子替换，.bin里多写的行在meta更新前不可见
+        os.replace(tmp_path, os.path.join(self.panel_dir, self.META_FILE))
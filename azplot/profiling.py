@@ -0,0 +1,145 @@
+import contextlib
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+
+class ChartProfile:
+    """
+    一个图表的性能记录：各阶段的耗时和内存峰值、输出文件大小、各series的点数
+    stages: 阶段名 -> {'seconds': 耗时, 'peak_bytes': 阶段内比开始时多占用的内存峰值（不跟踪内存时为None）}
+    """
+    name: str
+    track_memory: bool
+    stages: Dict[str, dict]
+    output_bytes: int = None
+    series_points: Dict[str, Optional[int]]
+
+    def __init__(self, name: str, track_memory: bool = False):
+        self.name = name
+        self.track_memory = track_memory
+        self.stages = {}
+        self.series_points = {}
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """
+        with profile.stage('read_csv'): ...  同名阶段多次进入时累加
+        """
+        started_tracing = False
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = None
+            if self.track_memory:
+                peak_bytes = max(tracemalloc.get_traced_memory()[1] - memory_before, 0)
+                if started_tracing:
+                    tracemalloc.stop()
+            record = self.stages.setdefault(stage, {'seconds': 0.0, 'peak_bytes': peak_bytes})
+            record['seconds'] += seconds
+            if peak_bytes is not None:
+                record['peak_bytes'] = max(record['peak_bytes'] or 0, peak_bytes)
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """
+        阶段名 -> 秒，与BatchManifest.add的timings格式相同
+        """
+        return {stage: record['seconds'] for stage, record in self.stages.items()}
+
+    def record_chart(self, chart):
+        """
+        记下chart里每个series的点数；dataset模式下每个series的点数是dataset的行数，
+        各列都是typed_array编码（JsCode，要到前端才解码）时点数记为None
+        """
+        options = chart.options
+        dataset = options.get('dataset')
+        rows = None
+        if isinstance(dataset, dict) and isinstance(dataset.get('source'), dict):
+            rows = next((len(column) for column in dataset['source'].values() if isinstance(column, list)), None)
+        for i, series in enumerate(options.get('series', [])):
+            name = series.get('name') or f'series{i}'
+            if name in self.series_points:
+                name = f'{name}#{i}'
+            data = series.get('data')
+            self.series_points[name] = len(data) if data is not None else rows
+
+    def record_output(self, path: str):
+        self.output_bytes = os.path.getsize(path)
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'stages': self.stages, 'output_bytes': self.output_bytes,
+                'series_points': self.series_points}
+
+
+class ChartProfiler:
+    """
+    传给StockChartController/NetLineController后，每生成一个图表记录一个ChartProfile：
+        profiler = ChartProfiler(callback=lambda p: print(p.to_dict()))
+        StockChartController(stock_data_dir, profiler=profiler).draw_stocks(stocks_df)
+        print(profiler.format_report())
+    """
+    track_memory: bool
+    callback: Callable[[ChartProfile], None]
+    profiles: List[ChartProfile]
+
+    def __init__(self, track_memory: bool = True, callback: Callable[[ChartProfile], None] = None):
+        """
+        :param track_memory: 用tracemalloc记录每个阶段的内存峰值；tracemalloc会让被测代码明显变慢，只看耗时时关掉
+        :param callback: 每个图表记录完成时调用
+        """
+        self.track_memory = track_memory
+        self.callback = callback
+        self.profiles = []
+
+    def new_profile(self, name: str) -> ChartProfile:
+        return ChartProfile(name, track_memory=self.track_memory)
+
+    def add(self, profile: ChartProfile):
+        """
+        记录一个完成的ChartProfile（可以来自子进程）
+        """
+        self.profiles.append(profile)
+        if self.callback is not None:
+            self.callback(profile)
+
+    def report(self) -> dict:
+        """
+        :return: 所有图表按阶段汇总：{'charts': 图表数, 'output_bytes': 总字节数,
+                 'stages': {阶段: {'count', 'total_seconds', 'mean_seconds', 'max_seconds', 'slowest', 'max_peak_bytes'}}}
+        """
+        stages = {}
+        for profile in self.profiles:
+            for stage, record in profile.stages.items():
+                summary = stages.setdefault(stage, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                                    'slowest': None, 'max_peak_bytes': None})
+                summary['count'] += 1
+                summary['total_seconds'] += record['seconds']
+                if record['seconds'] >= summary['max_seconds']:
+                    summary['max_seconds'], summary['slowest'] = record['seconds'], profile.name
+                if record['peak_bytes'] is not None:
+                    summary['max_peak_bytes'] = max(summary['max_peak_bytes'] or 0, record['peak_bytes'])
+        for summary in stages.values():
+            summary['mean_seconds'] = summary['total_seconds'] / summary['count']
+        return {'charts': len(self.profiles),
+                'output_bytes': sum(p.output_bytes or 0 for p in self.profiles),
+                'stages': stages}
+
+    def format_report(self) -> str:
+        report = self.report()
+        lines = [f"{report['charts']} charts, {report['output_bytes'] / 1024:.0f} KB written",
+                 f"{'stage':12s} {'count':>6s} {'total ms':>10s} {'mean ms':>9s} {'max ms':>9s} {'peak KB':>9s}  slowest"]
+        for stage, s in sorted(report['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+            peak = '' if s['max_peak_bytes'] is None else f"{s['max_peak_bytes'] / 1024:.0f}"
+            lines.append(f"{stage:12s} {s['count']:6d} {s['total_seconds'] * 1000:10.1f} "
+                         f"{s['mean_seconds'] * 1000:9.1f} {s['max_seconds'] * 1000:9.1f} {peak:>9s}  {s['slowest']}")
+        return '\n'.join(lines)
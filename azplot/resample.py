@@ -0,0 +1,142 @@
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .lod import aggregate_ohlc, bucket_ends
+from .trades import CodeTrades
+
+
+def parse_timeframe(timeframe: str) -> Tuple[str, int]:
+    """
+    'D'（日线，不合并）、'W'（周线）、'M'（月线）、'{n}D'（每n个交易日一根，如'5D'）
+    :return: ('D', n) / ('W', 1) / ('M', 1)
+    """
+    match = re.fullmatch(r'(\d*)([DWM])', str(timeframe).strip().upper())
+    if match is None or (match.group(2) != 'D' and match.group(1) not in ('', '1')) or match.group(1) == '0':
+        raise ValueError(f'unknown timeframe: {timeframe}')
+    return match.group(2), int(match.group(1) or 1)
+
+
+def normalize_timeframe(timeframe: str) -> str:
+    """
+    :return: 规范写法：'D'、'W'、'M'、'5D'，'w'、'1D'这类写法不同但含义相同的统一成一种
+    """
+    kind, n = parse_timeframe(timeframe)
+    return f'{n}D' if n > 1 else kind
+
+
+def is_daily(timeframe: str) -> bool:
+    return parse_timeframe(timeframe) == ('D', 1)
+
+
+def _period_keys(dates: np.ndarray, kind: str) -> np.ndarray:
+    """
+    每个日期所在的自然周（周一开始）或自然月的编号
+    """
+    if kind == 'M':
+        return dates.astype('datetime64[M]').astype(np.int64)
+    # 1970-01-01是周四，加3天后整除7就是以周一为起点的周编号
+    return (dates.astype('datetime64[D]').astype(np.int64) + 3) // 7
+
+
+def timeframe_starts(dates: np.ndarray, timeframe: str) -> np.ndarray:
+    """
+    :param dates: 升序的交易日期（停牌日已经去掉），只按实际有K线的日期分组
+    :return: 每根合并后K线在dates里的起始下标，可以直接给lod.aggregate_ohlc
+    """
+    kind, n = parse_timeframe(timeframe)
+    if kind == 'D':
+        return np.arange(0, len(dates), n)
+    keys = _period_keys(np.asarray(dates), kind)
+    return np.flatnonzero(np.diff(keys, prepend=keys[:1] - 1))
+
+
+def resample_stock_data(stock_data: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+    把清洗后的日线合并成周线/月线/N日线：开盘取第一根，收盘取最后一根，最低/最高取极值，成交额求和，
+    前收盘价取第一根的（StockChartModel据此算出的涨跌幅就是整根K线的涨跌幅），交易日期取最后一根的
+    :return: 与stock_data列相同（只保留画图用到的列）的新DataFrame；日线原样返回stock_data
+    """
+    if is_daily(timeframe) or len(stock_data) == 0:
+        return stock_data
+    dates = stock_data['交易日期'].to_numpy()
+    starts = timeframe_starts(dates, timeframe)
+    ends = bucket_ends(starts, len(dates))
+    open_, close, low, high, amount = aggregate_ohlc(stock_data['开盘价'].to_numpy(), stock_data['收盘价'].to_numpy(),
+                                                     stock_data['最低价'].to_numpy(), stock_data['最高价'].to_numpy(),
+                                                     stock_data['成交额'].to_numpy(), starts)
+    return pd.DataFrame({
+        '交易日期': dates[ends],
+        '开盘价': open_,
+        '收盘价': close,
+        '最低价': low,
+        '最高价': high,
+        '前收盘价': stock_data['前收盘价'].to_numpy(dtype=np.float64)[starts],
+        '成交额': amount,
+        '股票名称': stock_data['股票名称'].to_numpy()[ends],
+        '股票代码': stock_data['股票代码'].to_numpy()[ends],
+    })
+
+
+class BarSnapper:
+    """
+    把日期对到合并后所在的那根K线上（用它的交易日期，即最后一个交易日表示），买卖点、窗口都靠它换算
+    """
+    kind: str
+    labels: np.ndarray
+    first_dates: np.ndarray
+
+    def __init__(self, stock_data: pd.DataFrame, resampled: pd.DataFrame, timeframe: str):
+        """
+        :param stock_data: 合并前的日线
+        :param resampled: resample_stock_data(stock_data, timeframe)
+        """
+        self.kind, _ = parse_timeframe(timeframe)
+        dates = stock_data['交易日期'].to_numpy().astype('datetime64[ns]')
+        self.labels = resampled['交易日期'].to_numpy().astype('datetime64[ns]')
+        self.first_dates = dates[timeframe_starts(dates, timeframe)] if len(dates) else dates
+
+    def positions(self, days) -> np.ndarray:
+        """
+        :return: 每个日期所在K线的下标，不在任何一根K线里的为-1：
+                 周线/月线按自然周、自然月判断（停牌的那几天也算在同一周、同一月里），N日线要求落在这根K线的首尾之间
+        """
+        # 带时分秒的按所在的那一天
+        days = np.asarray(pd.to_datetime(days)).astype('datetime64[D]').astype('datetime64[ns]')
+        positions = self.labels.searchsorted(days, side='left')
+        found = positions < len(self.labels)
+        if self.kind == 'D':
+            found[found] = self.first_dates[positions[found]] <= days[found]
+        else:
+            bar_keys = _period_keys(self.labels[positions[found]], self.kind)
+            found[found] = bar_keys == _period_keys(days[found], self.kind)
+        return np.where(found, positions, -1)
+
+    def days(self, days: Optional[List[pd.Timestamp]]) -> Optional[List[pd.Timestamp]]:
+        """
+        :return: 换成所在K线的交易日期，去掉不在任何K线里的，保持顺序和重复
+        """
+        if days is None:
+            return None
+        positions = self.positions(days)
+        return [pd.Timestamp(label) for label in self.labels[positions[positions >= 0]]]
+
+    def window_date(self, day: str) -> str:
+        """
+        :param day: 窗口起止日期，如2022/10/11
+        :return: 第一根交易日期不早于它的K线的日期，同样是 %Y/%m/%d 格式；比所有K线都晚时取最后一根
+        """
+        if len(self.labels) == 0:
+            return day
+        position = min(int(self.labels.searchsorted(np.datetime64(pd.Timestamp(day)), side='left')),
+                       len(self.labels) - 1)
+        return pd.Timestamp(self.labels[position]).strftime('%Y/%m/%d')
+
+    def trades(self, trades: Optional[CodeTrades]) -> Optional[CodeTrades]:
+        if trades is None:
+            return None
+        positions = self.positions(trades.dates)
+        keep = positions >= 0
+        return CodeTrades(self.labels[positions[keep]], trades.is_buy[keep], trades.price[keep], trades.size[keep])
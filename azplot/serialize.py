@@ -0,0 +1,65 @@
+from typing import Any
+
+from pyecharts.charts.base import default
+from pyecharts.commons import utils
+from pyecharts.options.series_options import BasicOpts
+
+try:
+    import orjson
+except ImportError:  # orjson是可选依赖，没装就退回pyecharts自带的simplejson
+    orjson = None
+    import simplejson
+
+
+def clean_options(value: Any) -> Any:
+    """
+    与pyecharts的remove_key_with_none_value效果相同：去掉值为None或空字符串的key，把opts对象展开成dict
+    不同的是只有里面装着容器的list才会逐项递归，纯数值的data数组原样返回
+    """
+    if isinstance(value, dict):
+        cleaned = {}
+        for key, item in value.items():
+            if item is None or (isinstance(item, str) and not item):
+                continue
+            cleaned[key] = clean_options(item)
+        return cleaned
+    if isinstance(value, BasicOpts):
+        return clean_options(value.opts)
+    if isinstance(value, (list, tuple, set)):
+        if any(isinstance(item, (dict, list, tuple, set, BasicOpts)) for item in value):
+            return [clean_options(item) for item in value]
+        return value if isinstance(value, list) else list(value)
+    return value
+
+
+def dumps(options: dict) -> str:
+    """
+    把已经clean_options过的option输出成不带缩进的JSON，NaN输出为null，JsCode照常展开
+    装了orjson就用orjson（同时支持直接序列化NumPy数组），否则用simplejson
+    """
+    if orjson is not None:
+        text = orjson.dumps(options, default=default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    else:
+        text = simplejson.dumps(options, default=default, ignore_nan=True, ensure_ascii=False,
+                                separators=(',', ':'))
+    return utils.replace_placeholder(text)
+
+
+def dump_options(chart) -> str:
+    """
+    chart.dump_options()的快速版本，见dumps
+    """
+    return dumps(clean_options(chart.options))
+
+
+def render(chart, path: str, fast_json: bool = True) -> str:
+    """
+    渲染chart到path，不打开浏览器
+    :param fast_json: 用dump_options代替pyecharts默认的option序列化
+    :return: 文件的绝对路径
+    """
+    if fast_json:
+        # pyecharts渲染时通过chart.dump_options()生成option，在实例上换成快速版本
+        chart.dump_options = lambda: dump_options(chart)
+    return chart.render(path)
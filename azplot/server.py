@@ -0,0 +1,372 @@
+"""
+本地图表服务：按URL现算图表，渲染好的option JSON放进LRU，同一图表多人、多次打开只算一次
+用法：
+    python -m azplot.server --stock-data-dir D:/data/stock --net-value-dir D:/data/equity --port 8766 --workers 4
+路由（GET/HEAD）：
+    /stock/{code}       K线图页面，参数：start、end（窗口，如2022/10/11）、buy、sell（逗号分隔的日期）、
+                        stick_count（以第一个买点为中心的K线根数）、windowed（1/true：只输出窗口附近的K线）、max_points、
+                        timeframe（D、W、M或5D这样的N日线）
+    /stock/{code}.json  同上，只返回option JSON
+    /net/{name}         {net_value_dir}/{name}.csv的净值图页面，参数：max_points；/net/{name}.json同理
+    /stats              缓存命中/未命中等计数
+"""
+import argparse
+import asyncio
+import hashlib
+import html
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{page_title}</title>
+    <script type="text/javascript" src="{echarts_src}"></script>
+</head>
+<body>
+<div id="chart" style="width:{width}; height:{height};"></div>
+<script>
+    var chart = echarts.init(document.getElementById('chart'), 'white', {{renderer: 'canvas'}});
+    chart.setOption({option});
+</script>
+</body>
+</html>
+"""
+
+# windowed这类开关参数不区分大小写，只认这些取值，其他的返回400
+TRUE_VALUES = frozenset({'1', 'true', 'yes', 'on'})
+FALSE_VALUES = frozenset({'0', 'false', 'no', 'off', ''})
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class RenderedChart:
+    """
+    缓存里的一项：option JSON和生成页面需要的标题、尺寸
+    """
+    __slots__ = ('option', 'page_title', 'width', 'height')
+    option: str
+    page_title: str
+    width: str
+    height: str
+
+    def __init__(self, option: str, page_title: str, width: str, height: str):
+        self.option = option
+        self.page_title = page_title
+        self.width = width
+        self.height = height
+
+    def page(self) -> str:
+        from pyecharts.globals import CurrentConfig
+        return PAGE_TEMPLATE.format(page_title=html.escape(self.page_title),
+                                    echarts_src=f'{CurrentConfig.ONLINE_HOST}echarts.min.js',
+                                    width=self.width, height=self.height, option=self.option)
+
+
+class ChartServer:
+    """
+    asyncio的HTTP服务，建模、渲染在进程池里做，事件循环只负责收发和查缓存：
+        - 缓存key是(图表类型, 名字, 源文件mtime, 规范化后的参数)，源文件更新后自然失效
+        - ETag由服务启动时间和缓存key算出，浏览器带If-None-Match来时不用渲染就能回304
+        - 同一key正在渲染时，后来的请求等同一个结果，不重复提交
+    """
+    stock_data_dir: Optional[str]
+    net_value_dir: Optional[str]
+    max_items: int
+    stats: Dict[str, float]
+    __pool_args: Optional[tuple]
+    __executor: Executor
+    __cache: OrderedDict
+    __cache_bytes: int
+    __pending: Dict[tuple, asyncio.Future]
+    __started: int
+
+    def __init__(self, stock_controller=None, net_value_dir: str = None, workers: int = None,
+                 executor: Executor = None, max_items: int = 512):
+        """
+        :param stock_controller: StockChartController，它的数据目录、缓存、面板设置会在每个工作进程里重建
+        :param net_value_dir: 净值CSV目录，每个文件第一列是日期，另有equity_curve、涨跌幅、benchmark列
+        :param workers: 进程池大小，None为CPU核数
+        :param executor: 自定义的Executor（如ThreadPoolExecutor），传了就不再创建进程池
+        :param max_items: LRU最多保留的图表数
+        """
+        self.stock_data_dir = None if stock_controller is None else stock_controller.stock_data_dir
+        self.__pool_args = None if stock_controller is None else stock_controller._pool_args()
+        self.net_value_dir = net_value_dir
+        self.max_items = max_items
+        self.__executor = executor or ProcessPoolExecutor(max_workers=workers)
+        self.__cache = OrderedDict()
+        self.__cache_bytes = 0
+        self.__pending = {}
+        # 算进ETag：服务重启（可能换了渲染代码）后浏览器里的旧ETag全部失效
+        self.__started = time.time_ns()
+        # hits：LRU命中；misses：实际提交渲染的次数；coalesced：等了别人正在渲染的同一图表，不算misses
+        self.stats = {'requests': 0, 'hits': 0, 'misses': 0, 'not_modified': 0, 'coalesced': 0, 'errors': 0,
+                      'render_seconds': 0.0}
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8766):
+        """
+        一直运行，直到被取消
+        """
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def run(self, host: str = '127.0.0.1', port: int = 8766):
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self.__executor.shutdown(cancel_futures=True)
+
+    def stats_snapshot(self) -> dict:
+        """
+        :return: stats加上LRU的项数、字节数和命中率（hits / (hits + misses)，合并进在途渲染的请求不计入）
+        """
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, cache_items=len(self.__cache), cache_bytes=self.__cache_bytes,
+                    hit_rate=self.stats['hits'] / lookups if lookups else None)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                status, response_headers, body = await self.respond(method, target, headers)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                response_headers['Content-Length'] = str(len(body))
+                response_headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+                head = f'HTTP/1.1 {status}\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in response_headers.items())
+                writer.write(head.encode('latin-1') + b'\r\n' + (b'' if method == 'HEAD' else body))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str]) -> Tuple[str, dict, bytes]:
+        """
+        :param headers: 请求头，名字是小写
+        :return: (状态行, 响应头, 响应体)
+        """
+        self.stats['requests'] += 1
+        if method not in ('GET', 'HEAD'):
+            return '405 Method Not Allowed', {'Allow': 'GET, HEAD'}, b''
+        url = urlsplit(target)
+        path = unquote(url.path)
+        if path == '/stats':
+            return '200 OK', {'Content-Type': 'application/json', 'Cache-Control': 'no-store'}, \
+                json.dumps(self.stats_snapshot()).encode('utf-8')
+
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        kind, _, name = path.strip('/').partition('/')
+        as_json = name.endswith('.json')
+        if as_json:
+            name = name[:-len('.json')]
+        try:
+            key = self.cache_key(kind, name, query)
+        except FileNotFoundError:
+            return '404 Not Found', {'Content-Type': 'text/plain'}, f'no data for {path}'.encode('utf-8')
+        except BadRequest as e:
+            return '400 Bad Request', {'Content-Type': 'text/plain; charset=utf-8'}, str(e).encode('utf-8')
+
+        etag = '"' + hashlib.blake2b(repr((self.__started, key)).encode('utf-8'), digest_size=12).hexdigest() + \
+               ('-json' if as_json else '') + '"'
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            self.stats['not_modified'] += 1
+            return '304 Not Modified', response_headers, b''
+
+        try:
+            chart = await self.rendered(key)
+        except Exception as e:
+            self.stats['errors'] += 1
+            return '500 Internal Server Error', {'Content-Type': 'text/plain; charset=utf-8'}, \
+                f'{type(e).__name__}: {e}'.encode('utf-8')
+        if as_json:
+            response_headers['Content-Type'] = 'application/json'
+            return '200 OK', response_headers, chart.option.encode('utf-8')
+        response_headers['Content-Type'] = 'text/html; charset=utf-8'
+        return '200 OK', response_headers, chart.page().encode('utf-8')
+
+    def cache_key(self, kind: str, name: str, query: Dict[str, str]) -> tuple:
+        """
+        把URL参数规范化（日期统一格式、买卖点排序），写法不同但含义相同的URL共用一个缓存项
+        :raise FileNotFoundError: 没有这个图表的数据
+        :raise BadRequest: 参数不对
+        """
+        if not name or os.path.basename(name) != name:
+            raise BadRequest(f'bad chart name: {name!r}')
+        if kind == 'stock' and self.stock_data_dir is not None:
+            path = os.path.join(self.stock_data_dir, f'{name}.csv')
+            params = (('start', _parse_date(query.get('start', '2022/10/11')).strftime('%Y/%m/%d')),
+                      ('end', _parse_date(query.get('end', '2023/02/07')).strftime('%Y/%m/%d')),
+                      ('buy', _parse_dates(query.get('buy'))),
+                      ('sell', _parse_dates(query.get('sell'))),
+                      ('stick_count', _parse_int(query.get('stick_count'))),
+                      ('windowed', _parse_bool(query.get('windowed'))),
+                      ('max_points', _parse_int(query.get('max_points'))),
+                      ('timeframe', _parse_timeframe(query.get('timeframe', 'D'))))
+        elif kind == 'net' and self.net_value_dir is not None:
+            path = os.path.join(self.net_value_dir, f'{name}.csv')
+            params = (('max_points', _parse_int(query.get('max_points'))),)
+        else:
+            raise FileNotFoundError(kind)
+        return kind, name, os.stat(path).st_mtime_ns, params
+
+    async def rendered(self, key: tuple) -> RenderedChart:
+        """
+        查LRU，没有就提交到进程池渲染；同一key同时只渲染一次
+        """
+        chart = self.__cache.get(key)
+        if chart is not None:
+            self.__cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return chart
+        pending = self.__pending.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(pending)
+        self.stats['misses'] += 1
+
+        loop = asyncio.get_running_loop()
+        kind, name, _, params = key
+        if kind == 'stock':
+            job = loop.run_in_executor(self.__executor, _render_stock, self.__pool_args, name, params)
+        else:
+            job = loop.run_in_executor(self.__executor, _render_net_value,
+                                       os.path.join(self.net_value_dir, f'{name}.csv'), name, params)
+        self.__pending[key] = job
+        start = time.perf_counter()
+        try:
+            chart = await asyncio.shield(job)
+        finally:
+            self.__pending.pop(key, None)
+            self.stats['render_seconds'] += time.perf_counter() - start
+        self.__put(key, chart)
+        return chart
+
+    def __put(self, key: tuple, chart: RenderedChart):
+        # 同一图表的源文件更新后旧mtime的项不会再被访问，靠LRU自然淘汰
+        self.__cache[key] = chart
+        self.__cache_bytes += len(chart.option)
+        while len(self.__cache) > self.max_items:
+            _, evicted = self.__cache.popitem(last=False)
+            self.__cache_bytes -= len(evicted.option)
+
+
+def _parse_date(value: str):
+    import pandas as pd
+    try:
+        return pd.Timestamp(value)
+    except (ValueError, TypeError):
+        raise BadRequest(f'bad date: {value!r}')
+
+
+def _parse_dates(value: Optional[str]) -> Optional[tuple]:
+    if not value:
+        return None
+    return tuple(sorted({_parse_date(day).strftime('%Y-%m-%d') for day in value.split(',') if day}))
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f'bad integer: {value!r}')
+
+
+def _parse_bool(value: Optional[str]) -> bool:
+    if value is None:
+        return False
+    flag = value.strip().lower()
+    if flag in TRUE_VALUES:
+        return True
+    if flag in FALSE_VALUES:
+        return False
+    raise BadRequest(f'bad boolean: {value!r}')
+
+
+def _parse_timeframe(value: str) -> str:
+    from .resample import normalize_timeframe
+    try:
+        return normalize_timeframe(value)
+    except ValueError:
+        raise BadRequest(f'bad timeframe: {value!r}')
+
+
+def _render_stock(pool_args: tuple, code: str, params: tuple) -> RenderedChart:
+    """
+    在工作进程里运行：复用该进程的StockChartController（连同它的缓存），用省内存的model建图
+    """
+    import pandas as pd
+    from . import serialize
+    from .stock_bar import _make_view, _worker_controller
+    params = dict(params)
+    buy_days = None if params['buy'] is None else [pd.Timestamp(day) for day in params['buy']]
+    sell_days = None if params['sell'] is None else [pd.Timestamp(day) for day in params['sell']]
+    model = _worker_controller(pool_args)._get_chart_model(
+        code, buy_days=buy_days, sell_days=sell_days, window_start=params['start'], window_end=params['end'],
+        stick_count=params['stick_count'], windowed=params['windowed'], compact=True, timeframe=params['timeframe'])
+    chart = _make_view(model, dict(max_points=params['max_points']))
+    return RenderedChart(serialize.dump_options(chart), chart.page_title, chart.width, chart.height)
+
+
+def _render_net_value(path: str, name: str, params: tuple) -> RenderedChart:
+    import pandas as pd
+    from . import serialize
+    from .netvalue_line import NetLineModel, NetLineView
+    equity_df = pd.read_csv(path, index_col=0, parse_dates=[0])
+    chart = NetLineView(NetLineModel(equity_df, name=name), max_points=dict(params)['max_points'])
+    return RenderedChart(serialize.dump_options(chart), chart.page_title, chart.width, chart.height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stock-data-dir', help='日线CSV目录')
+    parser.add_argument('--net-value-dir', help='净值CSV目录')
+    parser.add_argument('--use-cache', action='store_true', help='启用日线数据的二进制缓存，见StockDataCache')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认CPU核数')
+    parser.add_argument('--max-items', type=int, default=512, help='缓存的图表数')
+    args = parser.parse_args()
+
+    stock_controller = None
+    if args.stock_data_dir:
+        from .stock_bar import StockChartController
+        stock_controller = StockChartController(args.stock_data_dir, use_cache=args.use_cache)
+    server = ChartServer(stock_controller, net_value_dir=args.net_value_dir, workers=args.workers,
+                         max_items=args.max_items)
+    print(f'serving on http://{args.host}:{args.port}/stock/{{code}}')
+    server.run(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,183 @@
+import contextlib
+import copy
 import datetime
-from typing import List, Union
+import math
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
 import pandas as pd
 import numpy as np
-from decimal import Decimal, ROUND_HALF_UP
 from pyecharts import options as opts
 from pyecharts.charts import Kline, Line, Bar, Grid, Tab
 from pandas.api.types import is_datetime64_any_dtype as is_datetime
 
-pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
-pd.set_option('display.max_rows', 50)  # 最多显示数据的行数
-pd.set_option('display.unicode.ambiguous_as_wide', True)
-pd.set_option('display.unicode.east_asian_width', True)  # 这两行代码是让print输出的内容对齐
+from . import serialize
+from .batch import BatchManifest
+from .indicators import IndicatorContext, parse_indicator
+from .lazy_page import LazyTabPage
+from .lod import aggregate_ohlc, bucket_ends, bucket_starts
+from .panel import MarketPanel
+from .profiling import ChartProfile, ChartProfiler
+from .resample import BarSnapper, is_daily, parse_timeframe, resample_stock_data
+from .stock_data import clean_stock_data, read_raw_stock_csv, read_raw_stock_csv_tail, StockDataCache
+from .trades import CodeTrades, TradeLog
+from .typed_array import ColumnEncoding, DECODER_JS, encode_source, resolve_encodings
 
+# typed_arrays模式下各列的默认编码：价格2位小数差值编码，成交额float32，涨跌幅2位小数，其他指标线四舍五入到3位小数差值编码
+STOCK_ENCODINGS = {
+    'open': ColumnEncoding(decimals=2, delta=True),
+    'close': ColumnEncoding(decimals=2, delta=True),
+    'low': ColumnEncoding(decimals=2, delta=True),
+    'high': ColumnEncoding(decimals=2, delta=True),
+    'amount': ColumnEncoding(float32=True),
+    'returns': ColumnEncoding(decimals=2),
+}
+LINE_ENCODING = ColumnEncoding(decimals=3, delta=True, lossy=True)
 
-class StockChartModel:
+# StockChartView里最长的均线是ma(150)，服务端截取窗口时要往前多带这么多根K线给均线预热
+INDICATOR_LOOKBACK = 150
+
+
+def round_half_up_pct(ratio) -> np.ndarray:
+    """
+    把涨跌幅比例（如0.0123）四舍五入成保留两位小数的百分数（1.23），向量化实现
+    结果与 round_half_up_pct_decimal 逐位一致：.5 远离0进位，负数同理，-0.0 保留符号
+    """
+    scaled = np.asarray(ratio, dtype=np.float64) * 10000
+    magnitude = np.abs(scaled)
+    floor = np.floor(magnitude)
+    # magnitude - floor 在float64下没有舍入误差，不会像 floor(x + 0.5) 那样把 0.49999... 进成1
+    rounded = floor + (magnitude - floor >= 0.5)
+    return np.copysign(rounded, scaled) / 100
+
+
+def round_half_up_pct_decimal(ratio: pd.Series) -> pd.Series:
+    """
+    round_half_up_pct 的Decimal参考实现，逐行构造Decimal，慢，只用于核对结果
+    """
+    from decimal import Decimal, ROUND_HALF_UP
+    return ratio.apply(lambda x: float(Decimal(x * 10000).quantize(Decimal('1'), rounding=ROUND_HALF_UP) / 100))
+
+
+class StockModelBase:
+    """
+    StockChartModel和compact_model.CompactStockChartModel共用的部分：均线、指标线和买卖点
+    子类提供indicator、column、_bar_dates、_dates_at、_marker_sources
+    """
+    __slots__ = ()
+
+    def ma(self, day_count):
+        return self.indicator('ma', n=day_count)
+
+    def indicator_lines(self, specs: List[str]) -> dict:
+        """
+        :param specs: 如 ['MA5', 'EMA20', 'BOLL']，名字后面的数字作为参数n
+        :return: {线名: list}，多输出的指标展开成 'BOLL.upper' 这样的多条线
+        """
+        lines = {}
+        for spec in specs:
+            name, params = parse_indicator(spec)
+            values = self.indicator(name, **params)
+            if isinstance(values, dict):
+                lines.update({f'{spec}.{output}': v for output, v in values.items()})
+            else:
+                lines[spec] = values
+        return lines
+
+    def buy_data(self):
+        buy_days, _, _ = self._marker_sources()
+        if buy_days is None:
+            return []
+        return self._marks_at(self._bar_positions(buy_days), name='买', color='#dc143c')
+
+    def sell_data(self):
+        _, sell_days, _ = self._marker_sources()
+        if sell_days is None:
+            return []
+        return self._marks_at(self._bar_positions(sell_days), name='卖', color='#228b22')
+
+    def trade_data(self):
+        """
+        成交记录（trades）的买卖点，同一根K线上同方向的多笔成交只标一次，
+        名字（鼠标悬停时显示）里带上这几笔的笔数、成交均价（按数量加权）和总数量
+        """
+        _, _, trades = self._marker_sources()
+        if trades is None or len(trades) == 0:
+            return []
+        positions = self._bar_positions(trades.dates)
+        found = positions >= 0
+        positions, is_buy, price, size = positions[found], trades.is_buy[found], trades.price[found], trades.size[found]
+        return self._trade_marks(positions[is_buy], price[is_buy], size[is_buy], name='买', color='#dc143c') + \
+            self._trade_marks(positions[~is_buy], price[~is_buy], size[~is_buy], name='卖', color='#228b22')
+
+    def _trade_marks(self, positions: np.ndarray, price: np.ndarray, size: np.ndarray, name: str,
+                     color: str) -> List[opts.MarkPointItem]:
+        bars, inverse = np.unique(positions, return_inverse=True)
+
+        def per_bar(weights):
+            return np.bincount(inverse, weights=weights, minlength=len(bars))
+
+        has_price, has_size = ~np.isnan(price), ~np.isnan(size)
+        counts, priced, sized = per_bar(None), per_bar(has_price), per_bar(has_size)
+        total_size = per_bar(np.where(has_size, size, 0))
+        # 每笔都有成交价和数量时按数量加权，否则是有成交价的那几笔的简单平均
+        weighted = (per_bar(has_price & has_size) == counts) & (total_size > 0)
+        mean_price = np.where(weighted, per_bar(np.nan_to_num(price * size)) / np.where(weighted, total_size, 1),
+                              per_bar(np.where(has_price, price, 0)) / np.maximum(priced, 1))
+        titles = [f'{name} {count}笔' + (f' 均价{bar_price:.2f}' if bar_priced else '') +
+                  (f' 共{bar_size:g}' if bar_sized else '')
+                  for count, bar_price, bar_priced, bar_size, bar_sized
+                  in zip(counts.tolist(), mean_price.tolist(), priced.tolist(), total_size.tolist(), sized.tolist())]
+        return self._marks_at(bars, name=name, color=color, titles=titles)
+
+    def marker_positions(self) -> tuple:
+        """
+        :return: (买点行号, 卖点行号)，合并buy_days/sell_days和trades，升序去重，不在stock_df里的日期去掉；
+                 给不经过MarkPointItem的画法（如thumbnail）用
+        """
+        buy_days, sell_days, trades = self._marker_sources()
+        buys, sells = [], []
+        if buy_days is not None:
+            buys.append(self._bar_positions(buy_days))
+        if sell_days is not None:
+            sells.append(self._bar_positions(sell_days))
+        if trades is not None and len(trades) > 0:
+            positions = self._bar_positions(trades.dates)
+            buys.append(positions[trades.is_buy])
+            sells.append(positions[~trades.is_buy])
+
+        def merge(parts):
+            positions = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            return np.unique(positions[positions >= 0])
+        return merge(buys), merge(sells)
+
+    def _bar_positions(self, days) -> np.ndarray:
+        """
+        :param days: 交易日期，带时分秒的按所在的那一天
+        :return: 每个日期在stock_df里的行号，不是交易日（停牌、窗口外）的为-1；用已排序的日期数组二分查找，不扫描全表
+        """
+        bar_dates = self._bar_dates()
+        days = np.asarray(pd.to_datetime(days)).astype('datetime64[D]').astype('datetime64[ns]')
+        positions = bar_dates.searchsorted(days)
+        found = positions < len(bar_dates)
+        found[found] = bar_dates[positions[found]] == days[found]
+        return np.where(found, positions, -1)
+
+    def _marks_at(self, positions: np.ndarray, name: str, color: str,
+                  titles: List[str] = None) -> List[opts.MarkPointItem]:
+        """
+        在指定行的最低价下方画箭头，与buy_data/sell_data的样式相同
+        :param titles: 与去重排序后的positions一一对应的名字，不传则都叫name；箭头上的文字总是name
+        """
+        positions = np.unique(positions[positions >= 0])
+        lows = self.column('最低价')[positions] * 0.98
+        titles = titles or [name] * len(positions)
+        return [opts.MarkPointItem(name=title, coord=[date, low], value=name, symbol='arrow',
+                                   symbol_size=[20, 25], itemstyle_opts=opts.ItemStyleOpts(color=color))
+                for date, low, title in zip(self._dates_at(positions), lows.tolist(), titles)]
+
+
+class StockChartModel(StockModelBase):
     # 包含着OCLH的二维数组
     stock_df: pd.DataFrame
     k_line_OCLH_data: List[List[float]]
@@ -26,18 +190,38 @@ class StockChartModel:
     __up_limits: List = None
     __buy_days: List
     __sell_days: List
+    __trades: CodeTrades
+    __bar_dates: np.ndarray = None
+    __indicators: IndicatorContext
+    __indicator_lists: dict
+    __warmup: int
 
     def __init__(self, stock_df, start_date: str, end_date: str, buy_days: List[pd.Timestamp] = None,
-                 sell_days: List[pd.Timestamp] = None):
+                 sell_days: List[pd.Timestamp] = None, rounding: str = 'vectorized', warmup: int = 0,
+                 trades: CodeTrades = None):
         """
         展示基础K线、成交额、涨跌幅
         :param stock_df:
         :param start_date: 如：2022/10/11
         :param end_date: 如：2023/02/07
+        :param rounding: 涨跌幅的四舍五入方式，'vectorized'（默认）或'decimal'（逐行Decimal，参考实现）
+        :param warmup: stock_df开头只用来给均线预热、不输出到图上的K线根数
+        :param trades: 这只股票的成交记录，见trades.TradeLog.for_code
         """
+        ratio = stock_df['收盘价'] / stock_df['前收盘价'] - 1
+        if rounding == 'vectorized':
+            stock_df['涨跌幅'] = round_half_up_pct(ratio.to_numpy())
+        elif rounding == 'decimal':
+            stock_df['涨跌幅'] = round_half_up_pct_decimal(ratio)
+        else:
+            raise ValueError(f'unknown rounding: {rounding}')
+        # 指标在包含预热K线的完整数据上计算
+        self.__indicators = IndicatorContext(close=stock_df['收盘价'], amount=stock_df['成交额'])
+        self.__indicator_lists = {}
+        self.__warmup = warmup
+        if warmup:
+            stock_df = stock_df.iloc[warmup:]
         self.stock_df = stock_df
-        self.stock_df['涨跌幅'] = (stock_df['收盘价'] / stock_df['前收盘价'] - 1).apply(
-            lambda x: float(Decimal(x * 10000).quantize(Decimal('1'), rounding=ROUND_HALF_UP) / 100))
 
         self.k_line_OCLH_data = stock_df[['开盘价', '收盘价', '最低价', '最高价']].values.tolist()
         self.dates = stock_df['交易日期'].dt.strftime('%Y/%m/%d').values.tolist() \
@@ -53,9 +237,35 @@ class StockChartModel:
         # 买/卖点信息
         self.__buy_days = buy_days
         self.__sell_days = sell_days
+        self.__trades = trades
 
-    def ma(self, day_count):
-        return self.stock_df['收盘价'].rolling(day_count).mean().to_list()
+    def column(self, name: str) -> np.ndarray:
+        """
+        :param name: stock_df的列名，如'收盘价'
+        :return: 图上那段K线（不含预热）的这一列
+        """
+        return self.stock_df[name].to_numpy()
+
+    def history(self, column: str) -> np.ndarray:
+        """
+        含预热K线在内的完整列数据，'close'：收盘价，'amount'：成交额；给需要往前看的增量计算用
+        """
+        return self.__indicators.columns[column]
+
+    def indicator(self, name: str, **params):
+        """
+        按名字计算技术指标（见indicators.INDICATORS），同一(name, params)只算一次
+        :return: 与dates等长的list；多输出的指标（boll、macd）返回 {输出名: list}
+        """
+        key = (name,) + tuple(sorted(params.items()))
+        if key not in self.__indicator_lists:
+            values = self.__indicators.compute(name, **params)
+            if isinstance(values, dict):
+                values = {output: v[self.__warmup:].tolist() for output, v in values.items()}
+            else:
+                values = values[self.__warmup:].tolist()
+            self.__indicator_lists[key] = values
+        return self.__indicator_lists[key]
 
     def up_limits(self):
         # 文档
@@ -70,51 +280,86 @@ class StockChartModel:
                                                                          color='#66ccff')), coords))
         return self.__up_limits
 
-    def buy_data(self):
-        if self.__buy_days is None:
-            return []
-        # 1. 基于buy_days去stock_df里面找对应数据
-        buy_df = self.stock_df[self.stock_df.交易日期.isin(self.__buy_days)]
-        # 2. 处理方式类似up_limits
-        buy_df = buy_df[['交易日期', '最低价']].assign(交易日期=buy_df.交易日期.dt.strftime('%Y/%m/%d')).assign(
-            最低价=buy_df.最低价 * 0.98)
-        coords = [row.tolist() for row in buy_df.values]
-        return list(
-            map(lambda x: opts.MarkPointItem(name='买', coord=x, value='买', symbol='arrow', symbol_size=[20, 25],
-                                             itemstyle_opts=opts.ItemStyleOpts(
-                                                 color='#dc143c')), coords))
+    def _marker_sources(self) -> tuple:
+        return self.__buy_days, self.__sell_days, self.__trades
 
-    def sell_data(self):
-        if self.__sell_days is None:
-            return []
-        # 1. 基于buy_days去stock_df里面找对应数据
-        sell_df = self.stock_df[self.stock_df.交易日期.isin(self.__sell_days)]
-        # 2. 处理方式类似up_limits
-        sell_df = sell_df[['交易日期', '最低价']].assign(交易日期=sell_df.交易日期.dt.strftime('%Y/%m/%d')).assign(
-            最低价=sell_df.最低价 * 0.98)
-        coords = [row.tolist() for row in sell_df.values]
-        return list(
-            map(lambda x: opts.MarkPointItem(name='卖', coord=x, value='卖', symbol='arrow', symbol_size=[20, 25],
-                                             itemstyle_opts=opts.ItemStyleOpts(
-                                                 color='#228b22')), coords))
+    def _bar_dates(self) -> np.ndarray:
+        if self.__bar_dates is None:
+            self.__bar_dates = pd.to_datetime(self.stock_df['交易日期']).to_numpy().astype('datetime64[ns]')
+        return self.__bar_dates
+
+    def _dates_at(self, positions: np.ndarray) -> list:
+        return [self.dates[position] for position in positions.tolist()]
+
+
+def _stock_series(model: StockModelBase, max_points: int = None, overlays: List[str] = ()) -> dict:
+    """
+    StockChartView要画的各条序列；K线数超过max_points时把相邻K线合并成更粗的OHLC（成交额求和），
+    涨跌幅按合并后的收盘价/桶内第一根的前收盘价重新计算，指标线取桶内最后一根的值，标记点移到所在的桶上
+    """
+    # CompactStockChartModel的dates等list每次访问都重新生成，这里只取一次
+    dates = model.dates
+    series = dict(dates=dates, k_line=model.k_line_OCLH_data, lines=model.indicator_lines(overlays),
+                  amount=model.amount, returns=model.returns,
+                  mark_points=model.up_limits() + model.buy_data() + model.sell_data() + model.trade_data(),
+                  start_date=model.start_date, end_date=model.end_date)
+    n = len(dates)
+    if max_points is None or n <= max_points:
+        return series
+
+    starts = bucket_starts(n, max_points)
+    ends = bucket_ends(starts, n)
+    open_, close, low, high, amount = aggregate_ohlc(model.column('开盘价'), model.column('收盘价'),
+                                                     model.column('最低价'), model.column('最高价'),
+                                                     model.column('成交额'), starts)
+    # 日期字符串是 %Y/%m/%d 格式，字典序就是时间顺序，可以直接searchsorted
+    all_dates = np.asarray(dates)
+    labels = all_dates[ends]
+
+    def bucket_labels(dates):
+        positions = np.maximum(all_dates.searchsorted(np.asarray(dates, dtype=all_dates.dtype), side='right') - 1, 0)
+        return labels[starts.searchsorted(positions, side='right') - 1].tolist()
+
+    mark_points = [copy.copy(item) for item in series['mark_points']]
+    for item, label in zip(mark_points, bucket_labels([item.opts['coord'][0] for item in mark_points])):
+        item.opts = dict(item.opts, coord=[label, item.opts['coord'][1]])
+    start_date, end_date = bucket_labels([series['start_date'], series['end_date']])
+
+    return dict(dates=labels.tolist(), k_line=np.column_stack([open_, close, low, high]).tolist(),
+                lines={name: np.asarray(values, dtype=np.float64)[ends].tolist()
+                       for name, values in series['lines'].items()},
+                amount=amount.tolist(),
+                returns=round_half_up_pct(close / model.column('前收盘价')[starts] - 1).tolist(),
+                mark_points=mark_points, start_date=start_date, end_date=end_date)
 
 
 class StockChartView(Grid):
 
-    def __init__(self, model: StockChartModel):
+    def __init__(self, model: StockModelBase, max_points: int = None, use_dataset: bool = False,
+                 overlays: List[str] = ('MA5', 'MA150'), typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False):
+        """
+        :param model:
+        :param max_points: 最多输出的K线根数，超过时合并成更粗的K线；None不抽稀
+        :param use_dataset: 用ECharts的dataset + encode输出数据，日期等每列只序列化一次，各series按列名引用
+        :param overlays: 画在K线上的指标，如 ['MA5', 'EMA20', 'BOLL']，见StockChartModel.indicator_lines
+        :param typed_arrays: dataset里的各列编码成base64的定点数/float32数组，由页面里的解码函数还原，隐含use_dataset；
+                             True用STOCK_ENCODINGS，也可以传 {列名: ColumnEncoding} 覆盖其中的列，
+                             列名是date、open、close、low、high（四列可以合写成price）、各指标线名、amount、returns
+        """
+        series = _stock_series(model, max_points, overlays)
         kline = (
             Kline()
-            .add_xaxis(xaxis_data=model.dates)
+            .add_xaxis(xaxis_data=series['dates'])
             .add_yaxis(
                 series_name=model.stock_name,
-                y_axis=model.k_line_OCLH_data,
+                y_axis=series['k_line'],
                 itemstyle_opts=opts.ItemStyleOpts(color="#ec0000", color0="#00da3c"),  # # 图元样式配置项，
             )
             # 标记点
             .set_series_opts(
                 # 文档：https://pyecharts.org/#/zh-cn/series_options?id=markpointitem%ef%bc%9a%e6%a0%87%e8%ae%b0%e7%82%b9%e6%95%b0%e6%8d%ae%e9%a1%b9
                 markpoint_opts=opts.MarkPointOpts(
-                    data=model.up_limits() + model.buy_data() + model.sell_data()
+                    data=series['mark_points']
                 ))
             .set_global_opts(
                 title_opts=opts.TitleOpts(title=model.stock_name, subtitle=model.code, pos_left="center"),
@@ -129,8 +374,8 @@ class StockChartView(Grid):
                         xaxis_index=[0, 1, 2],
                         range_start=None,  # 数据窗口范围的起始百分比，可以设成80
                         range_end=None,
-                        start_value=model.start_date,
-                        end_value=model.end_date
+                        start_value=series['start_date'],
+                        end_value=series['end_date']
                     ),
                     opts.DataZoomOpts(
                         is_show=True,
@@ -139,8 +384,8 @@ class StockChartView(Grid):
                         pos_top="70%",
                         range_start=None,
                         range_end=None,
-                        start_value='2022/10/11',
-                        end_value='2023/02/07'
+                        start_value=series['start_date'],
+                        end_value=series['end_date']
                     ),
                 ],
                 yaxis_opts=opts.AxisOpts(
@@ -182,35 +427,24 @@ class StockChartView(Grid):
             )
         )
 
-        ma_line = (
-            Line()
-            .add_xaxis(xaxis_data=model.dates)
-            .add_yaxis(
-                series_name="MA5",
-                y_axis=model.ma(5),
+        ma_line = Line().add_xaxis(xaxis_data=series['dates'])
+        for line_name, values in series['lines'].items():
+            ma_line.add_yaxis(
+                series_name=line_name,
+                y_axis=values,
                 symbol_size=0,
                 is_smooth=True,  # 曲线平滑
                 is_hover_animation=False,  # 是否开启 hover 在拐点标志上的提示动画效果。
                 linestyle_opts=opts.LineStyleOpts(width=1, opacity=1),  # 线样式配置项
                 label_opts=opts.LabelOpts(is_show=False),  # 标签配置项
             )
-            .add_yaxis(
-                series_name="MA150",
-                y_axis=model.ma(150),
-                symbol_size=0,
-                is_smooth=True,
-                is_hover_animation=False,
-                linestyle_opts=opts.LineStyleOpts(width=1, opacity=1),
-                label_opts=opts.LabelOpts(is_show=False),
-            )
-        )
 
         amount_bar = (
             Bar()
-            .add_xaxis(xaxis_data=model.dates)
+            .add_xaxis(xaxis_data=series['dates'])
             .add_yaxis(
                 series_name="成交额",
-                y_axis=model.amount,
+                y_axis=series['amount'],
                 xaxis_index=1,
                 yaxis_index=1,
                 label_opts=opts.LabelOpts(is_show=False),
@@ -244,10 +478,10 @@ class StockChartView(Grid):
 
         returns_bar = (
             Bar()
-            .add_xaxis(xaxis_data=model.dates)
+            .add_xaxis(xaxis_data=series['dates'])
             .add_yaxis(
                 series_name="涨跌幅",
-                y_axis=model.returns,
+                y_axis=series['returns'],
                 xaxis_index=1,
                 yaxis_index=1,
                 label_opts=opts.LabelOpts(is_show=False),
@@ -287,19 +521,189 @@ class StockChartView(Grid):
                           page_title=model.stock_name,  # 网页标题，控制网页卡的显示内容
                           animation_opts=opts.AnimationOpts(animation=False),
                       ))
-        self.add(kline.overlap(ma_line), grid_opts=opts.GridOpts(pos_left='10%', pos_right='8%', height='40%'))
+        self.add(kline.overlap(ma_line) if series['lines'] else kline, grid_opts=opts.GridOpts(pos_left='10%', pos_right='8%', height='40%'))
         self.add(amount_bar, grid_opts=opts.GridOpts(pos_left="10%", pos_right="8%", pos_top="48%", height="12%"))
         self.add(returns_bar, grid_opts=opts.GridOpts(pos_left="10%", pos_right="8%", pos_top="60%", height="12%"))
+        if use_dataset or typed_arrays:
+            self._use_dataset(series, typed_arrays)
+
+    def _use_dataset(self, series: dict, typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False):
+        """
+        把各series里重复的数据挪进一个按列组织的dataset
+        """
+        source, encodes = _dataset_source(series, typed_arrays)
+        if typed_arrays:
+            self.add_js_funcs(DECODER_JS)
+        self.options['dataset'] = {'source': source}
+        for chart_series, y in zip(self.options['series'], encodes):
+            chart_series.pop('data', None)
+            chart_series['encode'] = {'x': 'date', 'y': y}
+        # 类目轴的刻度从series的encode.x里取，不再单独输出
+        for axis in self.options['xAxis']:
+            axis.pop('data', None)
+
+
+def _dataset_source(series: dict, typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False) -> tuple:
+    """
+    :param series: _stock_series的结果
+    :param typed_arrays: 见StockChartView
+    :return: (按列组织的dataset.source, 依次对应K线、各指标线、成交额、涨跌幅的encode.y)
+    """
+    k_line = np.asarray(series['k_line'], dtype=np.float64).reshape(-1, 4)
+    source = {
+        'date': series['dates'],
+        'open': k_line[:, 0].tolist(),
+        'close': k_line[:, 1].tolist(),
+        'low': k_line[:, 2].tolist(),
+        'high': k_line[:, 3].tolist(),
+        **series['lines'],
+        'amount': series['amount'],
+        'returns': series['returns'],
+    }
+    if typed_arrays:
+        source = encode_source(source, resolve_encodings(typed_arrays, STOCK_ENCODINGS), default=LINE_ENCODING)
+    return source, [['open', 'close', 'low', 'high'], *series['lines'], 'amount', 'returns']
 
 
 class StockChartController:
     stock_data_dir = ""
+    cache: StockDataCache = None
+    panel: MarketPanel = None
+    profiler: ChartProfiler = None
+    resample_cache_size: int
+    __resampled: OrderedDict
 
-    def __init__(self, stock_data_dir: str):
+    def __init__(self, stock_data_dir: str, use_cache: bool = False, cache_dir: str = None, cache_size: int = 256,
+                 panel: MarketPanel = None, profiler: ChartProfiler = None):
+        """
+        :param stock_data_dir: 日线CSV目录
+        :param use_cache: 是否启用清洗后数据的二进制缓存（.npy列存 + 进程内LRU），源文件变化后自动失效
+        :param cache_dir: 缓存目录，默认{stock_data_dir}_azplot_cache
+        :param cache_size: 进程内LRU最多保留的股票数；周线、月线等合并后的K线另有一个同样大小的LRU（不受use_cache影响）
+        :param panel: 合并好的全市场面板，优先从这里取数据（不检查源CSV是否变化，需要时先panel.update()），
+                      面板里没有的代码再走缓存或CSV
+        :param profiler: 记录每个图表各阶段（read_csv、clean、model、up_limits、view、render）的耗时、内存峰值，
+                         输出大小和各series的点数，见profiling.ChartProfiler
+        """
         self.stock_data_dir = stock_data_dir
+        self.panel = panel
+        self.profiler = profiler
+        self.resample_cache_size = cache_size
+        self.__resampled = OrderedDict()
+        if use_cache:
+            self.cache = StockDataCache(stock_data_dir, cache_dir=cache_dir, max_items=cache_size)
+
+    def _load_stock_data(self, code, profile: ChartProfile = None) -> pd.DataFrame:
+        """
+        :param profile: 记录耗时的ChartProfile，从CSV读取时分read_csv、clean两个阶段，从面板、缓存读取时是load阶段
+        :return: 去掉停牌日、按交易日期排序后的日线数据
+        """
+        if self.panel is not None and code in self.panel:
+            with _stage(profile, 'load'):
+                return self.panel.frame(code)
+        if self.cache is not None:
+            with _stage(profile, 'load'):
+                return self.cache.load(code)
+        with _stage(profile, 'read_csv'):
+            stock_data = read_raw_stock_csv(f'{self.stock_data_dir}/{code}.csv')
+        with _stage(profile, 'clean'):
+            return clean_stock_data(stock_data)
+
+    def _load_recent_stock_data(self, code, since, rows_before: int, profile: ChartProfile = None,
+                                min_lines: int = 512) -> Optional[pd.DataFrame]:
+        """
+        从CSV末尾读取，读到的数据里since之前至少有rows_before根K线为止（不够时按已读部分的K线密度估计再读多少），
+        结果与_load_stock_data的最后一段相同；开销取决于窗口离现在多远，与上市时间无关
+        :param since: 窗口起点或买点
+        :return: None表示应该完整读取：面板、缓存里有这只股票，文件不是按日期升序排列，或者要读的超过了半个文件
+        """
+        if (self.panel is not None and code in self.panel) or self.cache is not None:
+            return None
+        path = f'{self.stock_data_dir}/{code}.csv'
+        since = pd.Timestamp(since)
+        while True:
+            with _stage(profile, 'read_csv'):
+                stock_data, fraction = read_raw_stock_csv_tail(path, min_lines)
+            if stock_data is None:
+                return None
+            with _stage(profile, 'clean'):
+                stock_data = clean_stock_data(stock_data)
+            trade_dates = stock_data['交易日期']
+            if fraction >= 1.0 or trade_dates.searchsorted(since) >= rows_before:
+                return stock_data
+            # 按已读部分的K线密度估计还要往前读多少行，不够时一次读到位
+            next_lines = min_lines * 4
+            if len(trade_dates) > 1:
+                days_per_bar = max((trade_dates.iloc[-1] - trade_dates.iloc[0]).days, 1) / (len(trade_dates) - 1)
+                bars_since = (trade_dates.iloc[-1] - since).days / days_per_bar
+                next_lines = max(next_lines, int((bars_since + rows_before) * 1.2))
+            # 要读的超过半个文件时，完整读取更省事
+            if fraction * next_lines / max(len(trade_dates), 1) > 0.5:
+                return None
+            min_lines = next_lines
+
+    def _load_resampled(self, code, timeframe: str, stock_data: pd.DataFrame = None,
+                        profile: ChartProfile = None) -> Tuple[pd.DataFrame, BarSnapper]:
+        """
+        按timeframe合并后的K线，按(code, timeframe)缓存在进程内LRU里，源CSV的mtime、size变化后失效；
+        命中时连日线都不用加载，同一只股票来回切换周期几乎没有开销
+        :param stock_data: 已经加载好的这只股票的日线，未命中时用它合并，不传则按code读取
+        :param profile: 记录耗时的ChartProfile，合并记为resample阶段
+        :return: (合并后的K线（浅拷贝，调用方加列不会污染缓存）, 把日期对到合并后K线上的BarSnapper)
+        """
+        key = code, parse_timeframe(timeframe)
+        try:
+            stat = os.stat(f'{self.stock_data_dir}/{code}.csv')
+            signature = stat.st_mtime_ns, stat.st_size
+        except OSError:
+            # 只在面板里有的数据没法判断是否过期，不缓存
+            signature = None
+        hit = self.__resampled.get(key)
+        if hit is not None and signature is not None and hit[0] == signature:
+            self.__resampled.move_to_end(key)
+            return hit[1].copy(deep=False), hit[2]
+
+        if stock_data is None:
+            stock_data = self._load_stock_data(code, profile)
+        with _stage(profile, 'resample'):
+            resampled = resample_stock_data(stock_data, timeframe)
+            snapper = BarSnapper(stock_data, resampled, timeframe)
+        if signature is not None:
+            self.__resampled[key] = (signature, resampled, snapper)
+            self.__resampled.move_to_end(key)
+            while len(self.__resampled) > self.resample_cache_size:
+                self.__resampled.popitem(last=False)
+        return resampled.copy(deep=False), snapper
+
+    def _new_profile(self, name: str) -> ChartProfile:
+        """
+        :return: 没有设置profiler时为None
+        """
+        return None if self.profiler is None else self.profiler.new_profile(name)
+
+    def _finish_profile(self, profile: ChartProfile, chart=None, path: str = None):
+        if profile is None:
+            return
+        if chart is not None:
+            profile.record_chart(chart)
+        if path is not None:
+            profile.record_output(path)
+        self.profiler.add(profile)
+
+    def _pool_args(self) -> tuple:
+        """
+        在子进程里重建controller所需的参数
+        """
+        panel_dir = None if self.panel is None else self.panel.panel_dir
+        if self.cache is None:
+            return self.stock_data_dir, False, None, 256, panel_dir
+        return self.stock_data_dir, True, self.cache.cache_dir, self.cache.max_items, panel_dir
 
     def _get_chart_model(self, code, buy_days: [pd.Timestamp] = None, sell_days: [pd.Timestamp] = None,
-                         window_start='2022/10/11', window_end='2023/02/07', stick_count=None):
+                         window_start='2022/10/11', window_end='2023/02/07', stick_count=None,
+                         stock_data: pd.DataFrame = None, windowed: bool = False, window_margin: int = 20,
+                         trades: CodeTrades = None, profile: ChartProfile = None, compact: bool = False,
+                         timeframe: str = 'D'):
         """
         有stick_count就用，没有就用window_start和window_end
         :param code:
@@ -308,75 +712,428 @@ class StockChartController:
         :param window_start:
         :param window_end:
         :param stick_count:
+        :param stock_data: 已经加载好的日线数据，不传则按code读取
+        :param windowed: 只输出窗口内（前后各加window_margin根）的K线，均线用窗口前INDICATOR_LOOKBACK根数据预热；
+                         否则输出全部历史，窗口只靠DataZoom在前端生效
+        :param window_margin: windowed模式下窗口两侧额外输出的K线根数，留给前端拖动
+        :param trades: 这只股票的成交记录，画成买卖点，见trades.TradeLog.for_code
+        :param profile: 记录耗时的ChartProfile，截取窗口和构建StockChartModel记为model阶段
+        :param compact: 返回省内存的compact_model.CompactStockChartModel（不修改stock_data），接口相同
+        :param timeframe: K线周期，'D'日线、'W'周线、'M'月线、'5D'每5个交易日一根，见resample.parse_timeframe；
+                          非日线时stock_data仍传日线，stick_count、window_margin按合并后的K线计数，
+                          买卖点、成交记录、窗口起止日期都对到所在的那根K线上
         :return:
+        windowed模式下直接读CSV时只从文件末尾读取够用的K线，见_load_recent_stock_data；
+        非日线的合并结果按(code, timeframe)缓存，见_load_resampled
         """
-        stock_data = pd.read_csv(f'{self.stock_data_dir}/{code}.csv', encoding='gbk', skiprows=1,
-                                 parse_dates=['交易日期'])
-        # 停牌日K线不显示
-        stock_data.dropna(subset=['成交额'], inplace=True, axis=0)
-        stock_data.sort_values('交易日期', inplace=True)
-        stock_data.reset_index(drop=True, inplace=True)
+        if not is_daily(timeframe):
+            stock_data, snapper = self._load_resampled(code, timeframe, stock_data, profile)
+            buy_days, sell_days, trades = snapper.days(buy_days), snapper.days(sell_days), snapper.trades(trades)
+            window_start, window_end = snapper.window_date(window_start), snapper.window_date(window_end)
+        elif stock_data is None and windowed:
+            if buy_days is not None and len(buy_days) > 0 and stick_count is not None:
+                since, rows_before = buy_days[0], math.ceil(stick_count * 0.5)
+            else:
+                since, rows_before = window_start, 0
+            stock_data = self._load_recent_stock_data(code, since, rows_before + window_margin + INDICATOR_LOOKBACK,
+                                                      profile)
+        if stock_data is None:
+            stock_data = self._load_stock_data(code, profile)
+        with _stage(profile, 'model'):
+            return self.__build_model(stock_data, buy_days, sell_days, window_start, window_end, stick_count,
+                                      windowed, window_margin, trades, compact)
+
+    @staticmethod
+    def __build_model(stock_data: pd.DataFrame, buy_days, sell_days, window_start, window_end, stick_count,
+                      windowed: bool, window_margin: int, trades: CodeTrades, compact: bool) -> StockModelBase:
         if buy_days is not None and len(buy_days) > 0 and stick_count is not None:
-            buy_day = buy_days[0]
-            middle_index = stock_data[stock_data.交易日期 == buy_day].index.astype(int)[0]
+            # 买点不是交易日（周末、停牌）时以它之后的第一根K线为中心，比所有K线都晚时取最后一根
+            trade_dates = stock_data['交易日期'].values
+            middle_index = min(int(trade_dates.searchsorted(np.datetime64(pd.Timestamp(buy_days[0])), side='left')),
+                               len(trade_dates) - 1)
             left_index = int(0 if middle_index < stick_count * 0.5 else middle_index - stick_count * 0.5)
-            right_index = int(stock_data.index[-1] if middle_index + stick_count * 0.5 > stock_data.index[
-                -1] else middle_index + stick_count * 0.5)
+            right_index = int(len(trade_dates) - 1 if middle_index + stick_count * 0.5 > len(trade_dates) - 1
+                              else middle_index + stick_count * 0.5)
             window_start = stock_data.iloc[left_index].交易日期.strftime('%Y/%m/%d')
             window_end = stock_data.iloc[right_index].交易日期.strftime('%Y/%m/%d')
+        elif windowed:
+            trade_dates = stock_data['交易日期'].values
+            left_index = int(trade_dates.searchsorted(np.datetime64(pd.Timestamp(window_start)), side='left'))
+            right_index = int(trade_dates.searchsorted(np.datetime64(pd.Timestamp(window_end)), side='right')) - 1
+
+        warmup = 0
+        if windowed:
+            emit_start = max(0, left_index - window_margin)
+            emit_end = min(len(stock_data), right_index + window_margin + 1)
+            data_start = max(0, emit_start - INDICATOR_LOOKBACK)
+            warmup = emit_start - data_start
+            stock_data = stock_data.iloc[data_start:emit_end].reset_index(drop=True)
 
-        model = StockChartModel(stock_df=stock_data, start_date=window_start, end_date=window_end,
-                                buy_days=buy_days, sell_days=sell_days)
+        if compact:
+            from .compact_model import CompactStockChartModel
+            model_class = CompactStockChartModel
+        else:
+            model_class = StockChartModel
+        model = model_class(stock_df=stock_data, start_date=window_start, end_date=window_end,
+                            buy_days=buy_days, sell_days=sell_days, warmup=warmup, trades=trades)
         return model
 
     def draw_stock(self, code, buy_days: [pd.Timestamp] = None, sell_days: [pd.Timestamp] = None,
-                   window_start='2022/10/11', window_end='2023/02/07'):
+                   window_start='2022/10/11', window_end='2023/02/07', windowed: bool = False,
+                   use_dataset: bool = False, trade_log: TradeLog = None,
+                   typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False, timeframe: str = 'D'):
         """
         :param code:
         :param window_start: 如：2022/10/11
         :param window_end: 如：2023/02/07
+        :param windowed: 只把窗口附近的K线写进HTML，见_get_chart_model
+        :param timeframe: K线周期，'D'、'W'、'M'或'5D'这样的N日线，见_get_chart_model
+        :param use_dataset: 见StockChartView
+        :param typed_arrays: 见StockChartView
+        :param trade_log: 回测成交记录，画出这只股票的买卖点
         :return:
         """
         import webbrowser
-        model = self._get_chart_model(code, buy_days, sell_days, window_start, window_end)
-        chart_result = StockChartView(model=model).render()
+        profile = self._new_profile(code)
+        model = self._get_chart_model(code, buy_days, sell_days, window_start, window_end, windowed=windowed,
+                                      trades=None if trade_log is None else trade_log.for_code(code), profile=profile,
+                                      timeframe=timeframe)
+        chart = _make_view(model, dict(use_dataset=use_dataset, typed_arrays=typed_arrays), profile)
+        with _stage(profile, 'render'):
+            chart_result = chart.render()
+        self._finish_profile(profile, chart, chart_result)
 
         webbrowser.open_new(chart_result)
         return chart_result
 
-    def draw_stocks(self, stocks_df: pd.DataFrame, page_title: str = '股票走势图'):
+    def draw_stocks(self, stocks_df: pd.DataFrame, page_title: str = '股票走势图', workers: int = None,
+                    windowed: bool = False, use_dataset: bool = False, lazy: bool = False,
+                    use_template: bool = False, trade_log: TradeLog = None,
+                    typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False, compact: bool = False,
+                    timeframe: str = 'D'):
         """
         :param page_title: 图表名
         :param stocks_df: 必填字段 - 股票代码、股票名称；选填字段 - 交易日期（pd.Timestamp）
+        :param workers: 进程数，None则在当前进程里逐个生成；Windows/macOS下调用方需放在 if __name__ == '__main__' 里
+        :param windowed: 每只股票只把窗口附近的K线写进HTML，见_get_chart_model
+        :param use_dataset: 见StockChartView
+        :param lazy: 页面只放一个图表实例，每只股票的数据写到{page_title}_data/下，切到对应tab时才加载，
+                     页面打开速度与股票数量无关
+        :param use_template: 用chart_template.StockChartTemplate生成图表，option骨架只构建一次，输出与StockChartView相同
+        :param trade_log: 回测成交记录，每只股票画出自己的买卖点
+        :param typed_arrays: 见StockChartView，股票多时能明显减小页面体积
+        :param compact: 用省内存的CompactStockChartModel，见_get_chart_model
+        :param timeframe: K线周期，见_get_chart_model；非日线时每只股票显示买点前后各50根合并后的K线
         :return:
+        设置了profiler时每个图表各记一条ChartProfile，整个页面的渲染另记一条（名字是page_title），
+        结束后可以用profiler.format_report()看汇总
         """
         import azhint
         azhint.df_check(stocks_df, ['股票代码', '股票名称'])
         stocks_df = stocks_df.copy()
         stocks_df['股票代码'] = stocks_df.股票代码.str.strip()
         import webbrowser
-        tab = Tab(page_title=page_title)
-        for i in stocks_df.index:
-            one_stock = stocks_df[i:i + 1]
-            name = one_stock.股票名称.iloc[0]
-            code = one_stock.股票代码.iloc[0]
-            buy_days = []
-            buy_day_str = ''
-            if '交易日期' in one_stock.columns:
-                buy_days = [one_stock.交易日期.iloc[0]]
-                buy_day_str = one_stock.交易日期.iloc[0].strftime('%Y-%m-%d')
-
-            tab.add(StockChartView(self._get_chart_model(code=code, buy_days=buy_days, stick_count=100)),
-                    tab_name=buy_day_str + name)
-
-        webbrowser.open_new(tab.render(path=f"{page_title}.html"))
+        tab = LazyTabPage(page_title=page_title) if lazy else Tab(page_title=page_title)
+
+        codes = stocks_df.股票代码.tolist()
+        names = stocks_df.股票名称.tolist()
+        trade_days = stocks_df.交易日期.tolist() if '交易日期' in stocks_df.columns else [None] * len(stocks_df)
+        # 同一代码只读一次文件：按代码分组，组内保持输入顺序
+        positions_by_code = {}
+        for position, code in enumerate(codes):
+            positions_by_code.setdefault(code, []).append(position)
+
+        def buy_days_of(position):
+            return [] if trade_days[position] is None else [trade_days[position]]
+
+        def model_kwargs_of(code):
+            # 成交记录只把这只股票的那一段传下去，不把整个TradeLog发给子进程
+            return dict(stick_count=100, windowed=windowed, compact=compact, timeframe=timeframe,
+                        trades=None if trade_log is None else trade_log.for_code(code))
+
+        view_kwargs = dict(use_dataset=use_dataset, use_template=use_template, typed_arrays=typed_arrays)
+        if workers is None:
+            pending = {code: _build_stock_views(self, code, [buy_days_of(p) for p in positions],
+                                                model_kwargs_of(code), view_kwargs, self.profiler)
+                       for code, positions in positions_by_code.items()}
+            executor = None
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers=workers)
+            # 子进程里按同样的设置记录，ChartProfile随结果传回来
+            track_memory = None if self.profiler is None else self.profiler.track_memory
+            pending = {code: executor.submit(_build_stock_views_in_worker, self._pool_args(), code,
+                                             [buy_days_of(p) for p in positions], model_kwargs_of(code),
+                                             view_kwargs, track_memory)
+                       for code, positions in positions_by_code.items()}
+
+        try:
+            # 按输入顺序往Tab里填，某只股票的结果没回来就等它，后面已经算完的先留在views里
+            views = {}
+            for position, code in enumerate(codes):
+                if position not in views:
+                    result = pending.pop(code)
+                    code_views, profiles = result if executor is None else result.result()
+                    views.update(zip(positions_by_code[code], code_views))
+                    for profile in profiles:
+                        self._finish_profile(profile)
+                buy_day_str = '' if trade_days[position] is None else trade_days[position].strftime('%Y-%m-%d')
+                tab.add(views.pop(position), tab_name=buy_day_str + names[position])
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        page_profile = self._new_profile(page_title)
+        with _stage(page_profile, 'render'):
+            page_path = tab.render(path=f"{page_title}.html")
+        self._finish_profile(page_profile, path=page_path)
+        webbrowser.open_new(page_path)
         print(tab)
 
+    def live_chart(self, code, window_start='2022/10/11', window_end='2023/02/07', windowed: bool = False,
+                   overlays: List[str] = ('MA5', 'MA150')):
+        """
+        盘中实时图：返回的LiveStockChart可以serve()出页面，再不断append()新K线，见live.LiveStockChart
+        """
+        from .live import LiveStockChart
+        model = self._get_chart_model(code, window_start=window_start, window_end=window_end, windowed=windowed)
+        return LiveStockChart(model, overlays=overlays)
+
+    def render_batch(self, codes: List[str], output_dir: str, fast_json: bool = True,
+                     window_start='2022/10/11', window_end='2023/02/07', windowed: bool = False,
+                     use_dataset: bool = False, use_template: bool = False,
+                     trade_log: TradeLog = None, typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = False,
+                     compact: bool = False, timeframe: str = 'D') -> List[dict]:
+        """
+        无浏览器批量渲染：每只股票一个{code}.html写到output_dir，并写出manifest.json；单只失败不影响其他
+        :param codes: 股票代码列表
+        :param fast_json: 用serialize.dump_options（orjson）代替pyecharts默认的option序列化
+        :param use_template: 见draw_stocks
+        :param trade_log: 回测成交记录，每只股票画出自己的买卖点
+        :param typed_arrays: 见StockChartView
+        :param compact: 用省内存的CompactStockChartModel，见_get_chart_model
+        :param timeframe: K线周期，见_get_chart_model
+        :return: manifest记录，每条包含name、path、bytes、seconds（各阶段耗时），失败的还有error
+        """
+        manifest = BatchManifest(output_dir)
+        view_kwargs = dict(use_dataset=use_dataset, use_template=use_template, typed_arrays=typed_arrays)
+        for code in codes:
+            # 没有profiler也要记耗时写进manifest，只是不跟踪内存
+            profile = self._new_profile(code) or ChartProfile(code)
+            try:
+                model = self._get_chart_model(code, window_start=window_start, window_end=window_end,
+                                              windowed=windowed, profile=profile, compact=compact,
+                                              trades=None if trade_log is None else trade_log.for_code(code),
+                                              timeframe=timeframe)
+                chart = _make_view(model, view_kwargs, profile)
+                with profile.stage('render'):
+                    path = serialize.render(chart, manifest.path_for(code), fast_json=fast_json)
+            except Exception as e:
+                manifest.add(code, timings=profile.timings, error=f'{type(e).__name__}: {e}')
+                continue
+            manifest.add(code, path, profile.timings)
+            if self.profiler is not None:
+                self._finish_profile(profile, chart, path)
+        manifest.write()
+        return manifest.entries
+
+    def render_contact_sheet(self, stocks_df: pd.DataFrame, output_dir: str, page_title: str = '选股缩略图',
+                             columns: int = 10, tile_width: int = 160, tile_height: int = 80, style: str = 'auto',
+                             workers: int = None, link_charts: bool = True, trade_log: TradeLog = None,
+                             typed_arrays: Union[bool, Dict[str, ColumnEncoding]] = True, timeframe: str = 'D') -> str:
+        """
+        无浏览器的选股结果总览：每只股票在窗口内的走势画成一张缩略图（带买卖点），用NumPy直接栅格化成PNG，
+        拼成网格写到output_dir/{page_title}.html（+ .png），点击缩略图打开完整的交互式图表
+        :param stocks_df: 同draw_stocks，必填字段 - 股票代码、股票名称；选填字段 - 交易日期（pd.Timestamp）
+        :param columns: 每行几张缩略图
+        :param style: 见thumbnail.render_tile
+        :param workers: 进程数，None则在当前进程里逐个生成；Windows/macOS下调用方需放在 if __name__ == '__main__' 里
+        :param link_charts: 同时生成懒加载的完整图表页{page_title}_charts.html（见lazy_page.LazyTabPage），
+                            缩略图链接到其中对应的图；为False时只画缩略图，快得多
+        :param trade_log: 回测成交记录，每只股票画出自己的买卖点
+        :param typed_arrays: 完整图表的数据编码，见StockChartView
+        :param timeframe: K线周期，缩略图和完整图表都用它，见_get_chart_model
+        :return: 总览HTML的绝对路径
+        设置了profiler时每个图表各记一条ChartProfile（缩略图记为thumbnail阶段），整页的渲染另记一条
+        """
+        import azhint
+        from .thumbnail import ContactSheet
+        azhint.df_check(stocks_df, ['股票代码', '股票名称'])
+        os.makedirs(output_dir, exist_ok=True)
+        codes = stocks_df.股票代码.str.strip().tolist()
+        names = stocks_df.股票名称.tolist()
+        trade_days = stocks_df.交易日期.tolist() if '交易日期' in stocks_df.columns else [None] * len(stocks_df)
+        positions_by_code = {}
+        for position, code in enumerate(codes):
+            positions_by_code.setdefault(code, []).append(position)
+
+        def buy_days_of(position):
+            return [] if trade_days[position] is None else [trade_days[position]]
+
+        def model_kwargs_of(code):
+            return dict(stick_count=100, timeframe=timeframe,
+                        trades=None if trade_log is None else trade_log.for_code(code))
+
+        tile_kwargs = dict(width=tile_width, height=tile_height, style=style)
+        view_kwargs = dict(use_template=True, typed_arrays=typed_arrays) if link_charts else None
+        if workers is None:
+            pending = {code: _build_thumbnails(self, code, [buy_days_of(p) for p in positions], model_kwargs_of(code),
+                                               tile_kwargs, view_kwargs, self.profiler)
+                       for code, positions in positions_by_code.items()}
+            executor = None
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers=workers)
+            track_memory = None if self.profiler is None else self.profiler.track_memory
+            pending = {code: executor.submit(_build_thumbnails_in_worker, self._pool_args(), code,
+                                             [buy_days_of(p) for p in positions], model_kwargs_of(code),
+                                             tile_kwargs, view_kwargs, track_memory)
+                       for code, positions in positions_by_code.items()}
+
+        sheet = ContactSheet(columns=columns, tile_width=tile_width, tile_height=tile_height)
+        charts_name = f'{page_title}_charts'
+        charts = LazyTabPage(page_title=charts_name, data_dir=os.path.join(output_dir, f'{charts_name}_data')) \
+            if link_charts else None
+        try:
+            results = {}
+            for position, code in enumerate(codes):
+                if position not in results:
+                    result = pending.pop(code)
+                    tiles, views, profiles = result if executor is None else result.result()
+                    results.update(zip(positions_by_code[code], zip(tiles, views)))
+                    for profile in profiles:
+                        self._finish_profile(profile)
+                tile, view = results.pop(position)
+                buy_day_str = '' if trade_days[position] is None else trade_days[position].strftime('%Y-%m-%d')
+                caption = f'{buy_day_str} {names[position]}'.strip()
+                if charts is not None:
+                    charts.add(view, tab_name=caption)
+                sheet.add(tile, caption, link=None if charts is None else f'{charts_name}.html#{position}')
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        page_profile = self._new_profile(page_title)
+        with _stage(page_profile, 'render'):
+            if charts is not None:
+                charts.render(os.path.join(output_dir, f'{charts_name}.html'))
+            page_path = sheet.render(os.path.join(output_dir, f'{page_title}.html'), page_title=page_title)
+        self._finish_profile(page_profile, path=page_path)
+        return page_path
+
+
+def _build_stock_views(controller: StockChartController, code, buy_days_list: List[List[pd.Timestamp]],
+                       model_kwargs: dict, view_kwargs: dict, profiler: ChartProfiler = None) -> tuple:
+    """
+    一只股票只加载一次日线数据，为每组买点各生成一个StockChartView
+    :param model_kwargs: 传给_get_chart_model的其他参数
+    :param view_kwargs: 传给StockChartView的其他参数
+    :param profiler: 用来创建每个图表的ChartProfile，加载日线的耗时记在第一个图表上
+    :return: (views, 与views一一对应的ChartProfile；没有profiler时为空)
+    """
+    profiles = [] if profiler is None else [profiler.new_profile(code) for _ in buy_days_list]
+    stock_data = controller._load_stock_data(code, profiles[0] if profiles else None)
+    views = []
+    for i, buy_days in enumerate(buy_days_list):
+        profile = profiles[i] if profiles else None
+        # StockChartModel会往stock_df里加列，每个model各给一份浅拷贝
+        model = controller._get_chart_model(code=code, buy_days=buy_days, stock_data=stock_data.copy(deep=False),
+                                            profile=profile, **model_kwargs)
+        view = _make_view(model, view_kwargs, profile)
+        if profile is not None:
+            profile.record_chart(view)
+        views.append(view)
+    return views, profiles
+
+
+def _build_thumbnails(controller: StockChartController, code, buy_days_list: List[List[pd.Timestamp]],
+                      model_kwargs: dict, tile_kwargs: dict, view_kwargs: dict = None,
+                      profiler: ChartProfiler = None) -> tuple:
+    """
+    同_build_stock_views，但为每组买点画一张缩略图
+    :param tile_kwargs: 传给thumbnail.render_tile的参数
+    :param view_kwargs: 不为None时同时生成完整图表
+    :return: (tiles, views（没有view_kwargs时全是None）, ChartProfile列表)
+    """
+    from .thumbnail import render_tile
+    profiles = [] if profiler is None else [profiler.new_profile(code) for _ in buy_days_list]
+    stock_data = controller._load_stock_data(code, profiles[0] if profiles else None)
+    tiles, views = [], []
+    for i, buy_days in enumerate(buy_days_list):
+        profile = profiles[i] if profiles else None
+        model = controller._get_chart_model(code=code, buy_days=buy_days, stock_data=stock_data.copy(deep=False),
+                                            profile=profile, **model_kwargs)
+        with _stage(profile, 'thumbnail'):
+            tiles.append(render_tile(model, **tile_kwargs))
+        view = None
+        if view_kwargs is not None:
+            view = _make_view(model, view_kwargs, profile)
+            if profile is not None:
+                profile.record_chart(view)
+        views.append(view)
+    return tiles, views, profiles
+
+
+def _make_view(model: StockModelBase, view_kwargs: dict, profile: ChartProfile = None) -> Grid:
+    """
+    :param view_kwargs: StockChartView的参数，use_template为True时改用同布局共用的StockChartTemplate
+    :param profile: 记录耗时的ChartProfile，涨停标记单独记为up_limits阶段，其余记为view阶段
+    """
+    if profile is not None:
+        with profile.stage('up_limits'):
+            model.up_limits()
+    view_kwargs = dict(view_kwargs)
+    with _stage(profile, 'view'):
+        if view_kwargs.pop('use_template', False):
+            from .chart_template import get_template
+            max_points = view_kwargs.pop('max_points', None)
+            return get_template(**view_kwargs).chart(model, max_points=max_points)
+        return StockChartView(model, **view_kwargs)
+
+
+def _stage(profile: ChartProfile, stage: str):
+    """
+    profile为None时什么也不记
+    """
+    return contextlib.nullcontext() if profile is None else profile.stage(stage)
+
+
+# 子进程里复用controller（连同它的LRU缓存），key是StockChartController._pool_args()
+_worker_controllers = {}
+
+
+def _build_stock_views_in_worker(pool_args: tuple, code, buy_days_list: List[List[pd.Timestamp]],
+                                 model_kwargs: dict, view_kwargs: dict, track_memory: bool = None) -> tuple:
+    """
+    :param track_memory: None不记录，否则在子进程里按这个设置生成ChartProfile
+    """
+    profiler = None if track_memory is None else ChartProfiler(track_memory=track_memory)
+    return _build_stock_views(_worker_controller(pool_args), code, buy_days_list, model_kwargs, view_kwargs, profiler)
+
+
+def _build_thumbnails_in_worker(pool_args: tuple, code, buy_days_list: List[List[pd.Timestamp]], model_kwargs: dict,
+                                tile_kwargs: dict, view_kwargs: dict = None, track_memory: bool = None) -> tuple:
+    profiler = None if track_memory is None else ChartProfiler(track_memory=track_memory)
+    return _build_thumbnails(_worker_controller(pool_args), code, buy_days_list, model_kwargs, tile_kwargs,
+                             view_kwargs, profiler)
+
+
+def _worker_controller(pool_args: tuple) -> StockChartController:
+    controller = _worker_controllers.get(pool_args)
+    if controller is None:
+        stock_data_dir, use_cache, cache_dir, cache_size, panel_dir = pool_args
+        controller = StockChartController(stock_data_dir, use_cache=use_cache, cache_dir=cache_dir,
+                                          cache_size=cache_size,
+                                          panel=None if panel_dir is None else MarketPanel(panel_dir, stock_data_dir))
+        _worker_controllers[pool_args] = controller
+    return controller
+
 
 def draw_stock(stock_data_dir, code, buy_days: [pd.Timestamp] = None, sell_days: [pd.Timestamp] = None,
-               window_start='2022/10/11', window_end='2023/02/07'):
+               window_start='2022/10/11', window_end='2023/02/07', windowed: bool = False):
     StockChartController(stock_data_dir=stock_data_dir).draw_stock(code=code, buy_days=buy_days, sell_days=sell_days,
-                                                                   window_start=window_start, window_end=window_end)
+                                                                   window_start=window_start, window_end=window_end,
+                                                                   windowed=windowed)
 
 
 if __name__ == '__main__':
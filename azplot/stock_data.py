@@ -0,0 +1,197 @@
+import io
+import json
+import os
+import shutil
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# 画图用到的列和类型，另外还有按日期解析的交易日期列
+STOCK_DTYPES = {
+    '开盘价': 'float64',
+    '收盘价': 'float64',
+    '最低价': 'float64',
+    '最高价': 'float64',
+    '前收盘价': 'float64',
+    '成交额': 'float64',
+    '股票名称': 'str',
+    '股票代码': 'str',
+}
+
+
+def read_stock_csv(path: str) -> pd.DataFrame:
+    """
+    读取stock-trading-data-pro格式的日线CSV（首行是标题行），并做画图前的清洗
+    :param path: {stock_data_dir}/{code}.csv
+    :return: 去掉停牌日、按交易日期升序排列的DataFrame
+    """
+    return clean_stock_data(read_raw_stock_csv(path))
+
+
+def read_raw_stock_csv(path: str) -> pd.DataFrame:
+    """
+    只读取、不清洗，见read_stock_csv
+    """
+    return pd.read_csv(path, encoding='gbk', skiprows=1, parse_dates=['交易日期'])
+
+
+def read_raw_stock_csv_tail(path: str, min_lines: int,
+                            block_size: int = 1 << 16) -> Tuple[Optional[pd.DataFrame], float]:
+    """
+    只读CSV末尾的至少min_lines行（加上标题行之后的表头），从文件末尾往前按块seek，读取量与行数有关、与文件长度无关；
+    只解析画图用到的列（交易日期和STOCK_DTYPES），类型直接指定不推断。GBK的双字节字符里不会出现换行符，可以直接按字节找行
+    :return: (未清洗的DataFrame, 读到的部分占整个数据区的比例，1.0表示已经读到第一行数据)；
+             文件不是按交易日期升序排列时DataFrame为None，调用方应改为完整读取
+    """
+    with open(path, 'rb') as f:
+        f.readline()  # 标题行
+        header = f.readline()
+        data_start = f.tell()
+        position = file_end = f.seek(0, os.SEEK_END)
+        chunks, newlines = [], 0
+        # 最后一行可能没有换行符，块的第一行可能不完整，所以要多找一个换行符
+        while position > data_start and newlines <= min_lines:
+            size = min(block_size, position - data_start)
+            position -= size
+            f.seek(position)
+            chunks.append(f.read(size))
+            newlines += chunks[-1].count(b'\n')
+    data = b''.join(reversed(chunks))
+    if position > data_start:
+        data = data[data.index(b'\n') + 1:]
+    fraction = len(data) / (file_end - data_start) if file_end > data_start else 1.0
+    stock_data = pd.read_csv(io.BytesIO(header + data), encoding='gbk', usecols=['交易日期', *STOCK_DTYPES],
+                             dtype=STOCK_DTYPES, parse_dates=['交易日期'])
+    if not stock_data['交易日期'].is_monotonic_increasing:
+        return None, fraction
+    return stock_data, fraction
+
+
+def clean_stock_data(stock_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    去掉停牌日、按交易日期升序排列，原地修改并返回stock_data
+    """
+    # 停牌日K线不显示
+    stock_data.dropna(subset=['成交额'], inplace=True, axis=0)
+    stock_data.sort_values('交易日期', inplace=True)
+    stock_data.reset_index(drop=True, inplace=True)
+    return stock_data
+
+
+class StockDataCache:
+    """
+    清洗后日线数据的二进制缓存：每只股票一个目录，每列一个.npy文件，加载时memory-map
+    源CSV的mtime、size变化后缓存自动失效；磁盘缓存前面还有一层进程内LRU
+    """
+    stock_data_dir: str
+    cache_dir: str
+    max_items: int
+    __lru: OrderedDict
+
+    META_FILE = 'meta.json'
+    # 缓存格式有变化时加1，旧格式的缓存视为无效；2：文本列的缺失值另存一个掩码
+    FORMAT_VERSION = 2
+
+    def __init__(self, stock_data_dir: str, cache_dir: str = None, max_items: int = 256):
+        """
+        :param stock_data_dir: 源CSV所在目录
+        :param cache_dir: 缓存目录，默认放在stock_data_dir旁边：{stock_data_dir}_azplot_cache
+        :param max_items: 进程内LRU最多保留的股票数
+        """
+        self.stock_data_dir = stock_data_dir
+        self.cache_dir = cache_dir or stock_data_dir.rstrip('/\\') + '_azplot_cache'
+        self.max_items = max_items
+        self.__lru = OrderedDict()
+
+    def load(self, code: str) -> pd.DataFrame:
+        """
+        :return: 与read_stock_csv结果相同的DataFrame；返回的是浅拷贝，调用方加列不会污染缓存
+        """
+        signature = self._source_signature(code)
+        hit = self.__lru.get(code)
+        if hit is not None and hit[0] == signature:
+            self.__lru.move_to_end(code)
+            return hit[1].copy(deep=False)
+
+        stock_data = self._read_columns(code, signature)
+        if stock_data is None:
+            stock_data = read_stock_csv(self._source_path(code))
+            self._write_columns(code, signature, stock_data)
+
+        self.__lru[code] = (signature, stock_data)
+        self.__lru.move_to_end(code)
+        while len(self.__lru) > self.max_items:
+            self.__lru.popitem(last=False)
+        return stock_data.copy(deep=False)
+
+    def invalidate(self, code: str = None):
+        """
+        清掉某只股票（不传code则清掉全部）的进程内缓存和磁盘缓存
+        """
+        if code is None:
+            self.__lru.clear()
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        else:
+            self.__lru.pop(code, None)
+            shutil.rmtree(self._code_dir(code), ignore_errors=True)
+
+    def _source_path(self, code: str) -> str:
+        return f'{self.stock_data_dir}/{code}.csv'
+
+    def _code_dir(self, code: str) -> str:
+        return os.path.join(self.cache_dir, code)
+
+    def _source_signature(self, code: str) -> Tuple[int, int]:
+        stat = os.stat(self._source_path(code))
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_columns(self, code: str, signature: Tuple[int, int]) -> Optional[pd.DataFrame]:
+        code_dir = self._code_dir(code)
+        try:
+            with open(os.path.join(code_dir, self.META_FILE), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (meta.get('version'), meta.get('mtime_ns'), meta.get('size')) != (self.FORMAT_VERSION, *signature):
+            return None
+
+        null_columns = set(meta['null_columns'])
+        columns = {}
+        for i, name in enumerate(meta['columns']):
+            values = np.load(os.path.join(code_dir, f'{i}.npy'), mmap_mode='r')
+            # 字符串列存成定长unicode，读回来还原成object，再按掩码把缺失值恢复成NaN
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+                if i in null_columns:
+                    values[np.load(os.path.join(code_dir, f'{i}.null.npy'))] = np.nan
+            columns[name] = values
+        # DataFrame构造时会把memmap拷进自己的block，不会一直占着缓存文件
+        return pd.DataFrame(columns)
+
+    def _write_columns(self, code: str, signature: Tuple[int, int], stock_data: pd.DataFrame):
+        code_dir = self._code_dir(code)
+        tmp_dir = f'{code_dir}.tmp{os.getpid()}'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        null_columns = []
+        for i, name in enumerate(stock_data.columns):
+            column = stock_data[name]
+            if column.dtype.kind in 'biufcM':
+                values = column.to_numpy()
+            else:
+                # 定长unicode存不了NaN（会变成字符串'nan'），缺失的位置另存一个布尔掩码
+                values = column.to_numpy(dtype=str)
+                nulls = column.isna().to_numpy()
+                if nulls.any():
+                    np.save(os.path.join(tmp_dir, f'{i}.null.npy'), nulls, allow_pickle=False)
+                    null_columns.append(i)
+            np.save(os.path.join(tmp_dir, f'{i}.npy'), values, allow_pickle=False)
+        # meta最后写，缺了它这份缓存就视为无效
+        with open(os.path.join(tmp_dir, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'version': self.FORMAT_VERSION, 'mtime_ns': signature[0], 'size': signature[1],
+                       'columns': list(stock_data.columns), 'null_columns': null_columns}, f, ensure_ascii=False)
+        shutil.rmtree(code_dir, ignore_errors=True)
+        os.replace(tmp_dir, code_dir)
@@ -0,0 +1,242 @@
+import html
+import os
+import struct
+import zlib
+from typing import List, Tuple
+
+import numpy as np
+
+from .lod import aggregate_ohlc, bucket_starts
+
+# 与StockChartView相同的配色：涨红跌绿，买点红、卖点绿
+UP_COLOR = (0xec, 0x00, 0x00)
+DOWN_COLOR = (0x00, 0xda, 0x3c)
+CLOSE_COLOR = (0x54, 0x70, 0xc6)
+BUY_COLOR = (0xdc, 0x14, 0x3c)
+SELL_COLOR = (0x22, 0x8b, 0x22)
+BACKGROUND_COLOR = (0xff, 0xff, 0xff)
+SHEET_COLOR = (0xe6, 0xe6, 0xe6)
+
+# 买卖点三角形的高度（像素），图的下方留出这么多空间
+MARKER_SIZE = 4
+
+
+def encode_png(pixels: np.ndarray, compress_level: int = 6) -> bytes:
+    """
+    不依赖PIL的PNG编码：8位RGB，每行用Up过滤（减去上一行），大片相同背景压缩得更好
+    :param pixels: (高, 宽, 3) 的uint8数组
+    """
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    height, width = pixels.shape[:2]
+    rows = pixels.reshape(height, width * 3)
+    raw = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 0] = 2  # Up
+    raw[:, 1:] = rows
+    raw[1:, 1:] -= rows[:-1]  # uint8按256取模，正是PNG要求的差值
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    return b'\x89PNG\r\n\x1a\n' + \
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) + \
+        chunk(b'IDAT', zlib.compress(raw.tobytes(), compress_level)) + \
+        chunk(b'IEND', b'')
+
+
+def render_tile(model, width: int = 160, height: int = 80, style: str = 'auto') -> np.ndarray:
+    """
+    把StockChartModel窗口（start_date到end_date）内的K线画成一张缩略图，整列像素一次性用数组比较算出来，
+    不经过浏览器；K线比像素列多时先用lod.aggregate_ohlc合并
+    :param style: 'candle'画K线，'line'画收盘价折线，'auto'在每根K线至少有3个像素宽时画K线，否则画折线
+    :return: (height, width, 3) 的uint8数组
+    """
+    dates = np.asarray(model.dates)
+    first = int(dates.searchsorted(model.start_date, side='left'))
+    last = int(dates.searchsorted(model.end_date, side='right'))
+    if first >= last:
+        # 窗口里没有K线（数据不覆盖这段时间）时画全部历史
+        first, last = 0, len(dates)
+    open_, close, low, high = (np.asarray(model.column(column), dtype=np.float64)[first:last]
+                               for column in ('开盘价', '收盘价', '最低价', '最高价'))
+    buys, sells = model.marker_positions()
+    buys, sells = buys[(buys >= first) & (buys < last)] - first, sells[(sells >= first) & (sells < last)] - first
+
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[:] = BACKGROUND_COLOR
+    n = len(close)
+    if n == 0:
+        return pixels
+    if n > width:
+        starts = bucket_starts(n, width)
+        open_, close, low, high, _ = aggregate_ohlc(open_, close, low, high, np.zeros(n), starts)
+        buys = starts.searchsorted(buys, side='right') - 1
+        sells = starts.searchsorted(sells, side='right') - 1
+        n = len(starts)
+    if style == 'auto':
+        style = 'candle' if n * 3 <= width else 'line'
+
+    # 价格 -> 行号，上下各留1个像素，下方再留出买卖点的位置
+    top, bottom = 1, height - 2 - MARKER_SIZE
+    price_high, price_low = np.nanmax(high), np.nanmin(low)
+    scale = (bottom - top) / (price_high - price_low) if price_high > price_low else 0.0
+
+    def to_row(prices):
+        return np.rint(top + (price_high - np.nan_to_num(prices, nan=price_low)) * scale).astype(np.int64)
+
+    # 每个像素列属于哪根K线，以及它在这根K线所占的几列里的偏移
+    columns = np.arange(width)
+    bar_of_column = columns * n // width
+    bar_first_column = -(-np.arange(n + 1) * width // n)
+    bar_width = np.diff(bar_first_column)
+    offset = columns - bar_first_column[bar_of_column]
+    center = bar_first_column[:-1] + (bar_width - 1) // 2
+    y = np.arange(height)[:, None]
+
+    if style == 'candle':
+        up = close >= open_
+        colors = np.where(up[:, None], np.array(UP_COLOR, dtype=np.uint8), np.array(DOWN_COLOR, dtype=np.uint8))
+        wick = offset == (bar_width - 1)[bar_of_column] // 2
+        gap = (bar_width // 5)[bar_of_column]
+        body = (offset >= gap) & (offset < bar_width[bar_of_column] - gap)
+        span_top = np.where(wick, to_row(high)[bar_of_column], to_row(np.fmax(open_, close))[bar_of_column])
+        span_bottom = np.where(wick, to_row(low)[bar_of_column], to_row(np.fmin(open_, close))[bar_of_column])
+        mask = (wick | body)[None, :] & (y >= span_top[None, :]) & (y <= span_bottom[None, :])
+        pixels[mask] = np.broadcast_to(colors[bar_of_column][None, :, :], (height, width, 3))[mask]
+    elif style == 'line':
+        # 每列画一段竖线，从上一根K线的收盘价连到这一根的收盘价，折线不会断开
+        rows = to_row(close)
+        previous = np.append(rows[:1], rows[:-1])
+        current_row, previous_row = rows[bar_of_column], previous[bar_of_column]
+        # 同一根K线占多列时只有第一列连向上一根，其余列画水平线
+        previous_row = np.where(offset == 0, previous_row, current_row)
+        mask = (y >= np.minimum(current_row, previous_row)[None, :]) & \
+               (y <= np.maximum(current_row, previous_row)[None, :])
+        pixels[mask] = CLOSE_COLOR
+    else:
+        raise ValueError(f'unknown style: {style}')
+
+    low_rows = to_row(low)
+    _stamp_markers(pixels, center[buys], low_rows[buys] + 2, BUY_COLOR)
+    _stamp_markers(pixels, center[sells], low_rows[sells] + 2, SELL_COLOR)
+    return pixels
+
+
+def _stamp_markers(pixels: np.ndarray, xs: np.ndarray, ys: np.ndarray, color: Tuple[int, int, int]):
+    """
+    在(xs, ys)下方画尖朝上的实心三角形，超出图片的部分裁掉
+    """
+    if len(xs) == 0:
+        return
+    dy, dx = np.mgrid[0:MARKER_SIZE, -MARKER_SIZE + 1:MARKER_SIZE]
+    inside = np.abs(dx) <= dy
+    dy, dx = dy[inside], dx[inside]
+    rows = (np.asarray(ys)[:, None] + dy[None, :]).ravel()
+    columns = (np.asarray(xs)[:, None] + dx[None, :]).ravel()
+    height, width = pixels.shape[:2]
+    keep = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+    pixels[rows[keep], columns[keep]] = color
+
+
+SHEET_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{page_title}</title>
+    <style>
+        body {{ font-family: sans-serif; font-size: 12px; }}
+        .sheet {{ display: grid; grid-template-columns: repeat({columns}, {width}px); gap: {gap}px; }}
+        .sheet a {{ color: #333; text-decoration: none; }}
+        .sheet a:hover .thumb {{ outline: 2px solid #5470c6; }}
+        .thumb {{ width: {width}px; height: {height}px; background-image: url("{image}"); }}
+        .caption {{ white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }}
+    </style>
+</head>
+<body>
+<div class="sheet">
+{tiles}
+</div>
+</body>
+</html>
+"""
+
+
+class ContactSheet:
+    """
+    缩略图总览：所有缩略图拼成一张PNG，再生成一个按同样网格排列的HTML，每个格子显示对应区域（CSS sprite）和名字，
+    点击打开链接（通常是完整的交互式图表）
+    """
+    columns: int
+    tile_width: int
+    tile_height: int
+    gap: int
+    _tiles: List[np.ndarray]
+    _captions: List[str]
+    _links: List[str]
+
+    def __init__(self, columns: int = 10, tile_width: int = 160, tile_height: int = 80, gap: int = 4):
+        self.columns = columns
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.gap = gap
+        self._tiles = []
+        self._captions = []
+        self._links = []
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def add(self, tile: np.ndarray, caption: str, link: str = None):
+        """
+        :param tile: render_tile的结果，大小必须是tile_height x tile_width
+        :param link: 点击格子打开的地址，None则不可点击
+        """
+        if tile.shape[:2] != (self.tile_height, self.tile_width):
+            raise ValueError(f'tile shape {tile.shape[:2]} != {(self.tile_height, self.tile_width)}')
+        self._tiles.append(tile)
+        self._captions.append(caption)
+        self._links.append(link)
+        return self
+
+    def _origin(self, index: int) -> Tuple[int, int]:
+        """
+        :return: 第index个格子在整张图里左上角的(x, y)
+        """
+        row, column = divmod(index, self.columns)
+        return column * (self.tile_width + self.gap), row * (self.tile_height + self.gap)
+
+    def sheet_pixels(self) -> np.ndarray:
+        rows = max(1, -(-len(self._tiles) // self.columns))
+        columns = min(self.columns, max(1, len(self._tiles)))
+        pixels = np.empty((rows * (self.tile_height + self.gap) - self.gap,
+                           columns * (self.tile_width + self.gap) - self.gap, 3), dtype=np.uint8)
+        pixels[:] = SHEET_COLOR
+        for index, tile in enumerate(self._tiles):
+            x, y = self._origin(index)
+            pixels[y:y + self.tile_height, x:x + self.tile_width] = tile
+        return pixels
+
+    def render(self, path: str, page_title: str = '缩略图') -> str:
+        """
+        写出HTML和同名的.png
+        :return: HTML文件的绝对路径
+        """
+        image_path = os.path.splitext(path)[0] + '.png'
+        with open(image_path, 'wb') as f:
+            f.write(encode_png(self.sheet_pixels()))
+
+        tiles = []
+        for index, (caption, link) in enumerate(zip(self._captions, self._links)):
+            x, y = self._origin(index)
+            caption = html.escape(str(caption))
+            cell = f'<div class="thumb" style="background-position: -{x}px -{y}px"></div>' \
+                   f'<div class="caption">{caption}</div>'
+            if link is None:
+                tiles.append(f'<div title="{caption}">{cell}</div>')
+            else:
+                tiles.append(f'<a href="{html.escape(link)}" target="_blank" title="{caption}">{cell}</a>')
+        page = SHEET_TEMPLATE.format(page_title=html.escape(page_title), columns=self.columns,
+                                     width=self.tile_width, height=self.tile_height, gap=self.gap,
+                                     image=html.escape(os.path.basename(image_path)), tiles='\n'.join(tiles))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(page)
+        return os.path.abspath(path)
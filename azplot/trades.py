@@ -0,0 +1,83 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# side转成去掉首尾空白的小写字符串后，在BUY_SIDES里的是买、在SELL_SIDES里的是卖，都不在的报错
+BUY_SIDES = frozenset({'buy', 'b', 'long', '买', '买入', '1', '1.0'})
+SELL_SIDES = frozenset({'sell', 's', 'short', '卖', '卖出', '-1', '-1.0'})
+
+
+class CodeTrades:
+    """
+    一只股票的成交记录，按日期升序，都是NumPy数组
+    """
+    dates: np.ndarray  # datetime64[ns]
+    is_buy: np.ndarray
+    price: np.ndarray
+    size: np.ndarray
+
+    def __init__(self, dates: np.ndarray, is_buy: np.ndarray, price: np.ndarray, size: np.ndarray):
+        self.dates = dates
+        self.is_buy = is_buy
+        self.price = price
+        self.size = size
+
+    def __len__(self):
+        return len(self.dates)
+
+
+class TradeLog:
+    """
+    整个回测的成交记录，构造时按代码排序、分组一次，之后每只股票取自己那一段只是数组切片
+    """
+    codes: List[str]
+    __bounds: Dict[str, Tuple[int, int]]
+
+    def __init__(self, trades_df: pd.DataFrame, code='code', date='date', side='side', price='price', size='size'):
+        """
+        :param trades_df: 每行一笔成交
+        :param code: 股票代码列名，与stock_data_dir下的文件名一致，如sh601360
+        :param date: 成交时间列名，可以带时分秒（回测成交记录常见），按所在交易日画
+        :param side: 买卖方向列名，不区分大小写，取值见BUY_SIDES、SELL_SIDES
+        :param price: 成交价列名，可以没有这一列
+        :param size: 成交数量列名，可以没有这一列；成交价、数量显示在买卖点的名字里
+        :raise ValueError: side有既不是买也不是卖的取值（包括缺失值）
+        """
+        import azhint
+        azhint.df_check(trades_df, [code, date, side])
+        sides = trades_df[side].astype(str).str.strip().str.lower()
+        unknown = sides[~sides.isin(BUY_SIDES | SELL_SIDES)]
+        if len(unknown) > 0:
+            raise ValueError(f'unknown trade side: {sorted(set(trades_df[side][unknown.index].astype(str)))}')
+        code_ids, unique_codes = pd.factorize(trades_df[code].astype(str).str.strip())
+        dates = pd.to_datetime(trades_df[date], format='mixed').dt.normalize().to_numpy().astype('datetime64[ns]')
+        order = np.lexsort((dates, code_ids))
+        code_ids = code_ids[order]
+        self.__dates = dates[order]
+        self.__is_buy = sides.isin(BUY_SIDES).to_numpy()[order]
+        self.__price = self.__optional_column(trades_df, price)[order]
+        self.__size = self.__optional_column(trades_df, size)[order]
+
+        # 排序后同一代码连续，按代码编号切段
+        starts = np.flatnonzero(np.diff(code_ids, prepend=-1))
+        ends = np.append(starts[1:], len(code_ids))
+        self.codes = [unique_codes[i] for i in code_ids[starts]]
+        self.__bounds = {c: (int(s), int(e)) for c, s, e in zip(self.codes, starts, ends)}
+
+    @staticmethod
+    def __optional_column(trades_df: pd.DataFrame, column: str) -> np.ndarray:
+        if column in trades_df.columns:
+            return trades_df[column].to_numpy(dtype=np.float64)
+        return np.full(len(trades_df), np.nan)
+
+    def for_code(self, code: str) -> CodeTrades:
+        """
+        :return: 这只股票的成交记录；没有成交时返回None
+        """
+        bounds = self.__bounds.get(code)
+        if bounds is None:
+            return None
+        start, end = bounds
+        return CodeTrades(self.__dates[start:end], self.__is_buy[start:end], self.__price[start:end],
+                          self.__size[start:end])
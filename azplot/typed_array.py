@@ -0,0 +1,131 @@
+import base64
+from typing import Dict, List, NamedTuple, Union
+
+import numpy as np
+import pandas as pd
+from pyecharts.commons.utils import JsCode
+
+
+class ColumnEncoding(NamedTuple):
+    """
+    一列数值在HTML里的编码方式：
+        decimals不为None、float32为False：定点数，乘以10**decimals取整后存成整数，按取值范围自动选int8/16/32，
+                                        超出int32、或者有值不止decimals位小数（还原不出原值）时退回float64；
+                                        lossy为True时不检查，按decimals四舍五入（指标线、净值这类算出来的列）
+        float32为True：存成float32，decimals不为None时前端解码后再四舍五入到这么多位小数
+        都不设：原样存成float64
+    delta为True时（只对定点数有效）存相邻两个值的差，价格、均线这类平滑序列的差值小，能用更窄的整数
+    """
+    decimals: int = None
+    delta: bool = False
+    float32: bool = False
+    lossy: bool = False
+
+
+# 前端解码函数，通过chart.add_js_funcs放在option之前；解码结果是普通数组，缺失值为null
+DECODER_JS = """
+function azplotDecode(data, type, scale, delta) {
+    var bytes = atob(data), buffer = new Uint8Array(bytes.length);
+    for (var i = 0; i < bytes.length; i++) buffer[i] = bytes.charCodeAt(i);
+    var ArrayType = {i8: Int8Array, i16: Int16Array, i32: Int32Array, f32: Float32Array, f64: Float64Array}[type];
+    var raw = new ArrayType(buffer.buffer), isInt = type.charAt(0) === 'i';
+    var missing = isInt ? -Math.pow(2, 8 * raw.BYTES_PER_ELEMENT - 1) : null;
+    var values = new Array(raw.length), sum = 0;
+    for (var j = 0; j < raw.length; j++) {
+        var v = raw[j];
+        if (isInt ? v === missing : v !== v) { values[j] = null; continue; }
+        if (delta) v = sum += v;
+        values[j] = isInt ? (scale === 1 ? v : v / scale) : (scale ? Math.round(v * scale) / scale : v);
+    }
+    return values;
+}
+function azplotDates(data, type) {
+    return azplotDecode(data, type, 1, 1).map(function (day) {
+        var date = new Date(day * 86400000);
+        return date.getUTCFullYear() + '/' + ('0' + (date.getUTCMonth() + 1)).slice(-2) + '/' +
+            ('0' + date.getUTCDate()).slice(-2);
+    });
+}
+"""
+
+_INT_TYPES = [('i8', np.int8), ('i16', np.int16), ('i32', np.int32)]
+
+
+def encode_column(values, encoding: ColumnEncoding) -> JsCode:
+    """
+    :param values: 一列数值，None/NaN为缺失值
+    :return: 前端求值后得到原数组的JsCode
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if encoding.float32:
+        scale = 0 if encoding.decimals is None else 10 ** encoding.decimals
+        return _decode_call(values.astype('<f4'), 'f32', scale, False)
+    if encoding.decimals is None:
+        return _decode_call(values.astype('<f8'), 'f64', 0, False)
+
+    scale = 10 ** encoding.decimals
+    missing = np.isnan(values)
+    ints = np.round(values * scale)
+    if not encoding.lossy and not np.array_equal(ints[~missing] / scale, values[~missing]):
+        return _decode_call(values.astype('<f8'), 'f64', 0, False)
+    if encoding.delta:
+        # 缺失值位置沿用前一个值，差值为0，之后再标成缺失
+        last_valid = np.maximum.accumulate(np.where(missing, 0, np.arange(len(ints))))
+        filled = np.nan_to_num(ints[last_valid])
+        ints = np.diff(filled, prepend=0)
+    present = ints[~missing]
+    low, high = (present.min(), present.max()) if len(present) else (0, 0)
+    for type_name, int_type in _INT_TYPES:
+        info = np.iinfo(int_type)
+        # 最小值留给缺失值
+        if low > info.min and high <= info.max:
+            return _decode_call(np.where(missing, info.min, ints).astype(np.dtype(int_type).newbyteorder('<')),
+                                type_name, scale, encoding.delta)
+    return _decode_call(values.astype('<f8'), 'f64', 0, False)
+
+
+def encode_dates(dates: List[str]) -> Union[JsCode, List[str]]:
+    """
+    日期字符串（如2023/02/07）存成距1970-01-01天数的差值，前端还原成 YYYY/MM/DD；不是日期的原样返回
+    """
+    try:
+        days = pd.to_datetime(pd.Series(dates), format='mixed').to_numpy().astype('datetime64[D]').astype(np.int64)
+    except (ValueError, TypeError):
+        return dates
+    deltas = np.diff(days, prepend=0)
+    for type_name, int_type in _INT_TYPES:
+        info = np.iinfo(int_type)
+        if deltas.min(initial=0) > info.min and deltas.max(initial=0) <= info.max:
+            data = base64.b64encode(deltas.astype(np.dtype(int_type).newbyteorder('<')).tobytes()).decode('ascii')
+            return JsCode(f"azplotDates('{data}', '{type_name}')")
+    return dates
+
+
+def encode_source(source: Dict[str, list], encodings: Dict[str, ColumnEncoding],
+                  default: ColumnEncoding) -> Dict[str, Union[JsCode, list]]:
+    """
+    :param source: 按列组织的dataset.source，date列按日期编码
+    :param encodings: 列名 -> 编码方式，没有的列用default
+    """
+    return {name: encode_dates(values) if name == 'date' else encode_column(values, encodings.get(name, default))
+            for name, values in source.items()}
+
+
+def resolve_encodings(typed_arrays: Union[bool, Dict[str, ColumnEncoding]],
+                      defaults: Dict[str, ColumnEncoding]) -> Dict[str, ColumnEncoding]:
+    """
+    :param typed_arrays: True用defaults，dict则覆盖defaults里的同名列；键'price'是open、close、low、high四列的简写
+    """
+    encodings = dict(defaults)
+    if isinstance(typed_arrays, dict):
+        for name, encoding in typed_arrays.items():
+            if name == 'price':
+                encodings.update({column: encoding for column in ('open', 'close', 'low', 'high')})
+            else:
+                encodings[name] = encoding
+    return encodings
+
+
+def _decode_call(array: np.ndarray, type_name: str, scale, delta: bool) -> JsCode:
+    data = base64.b64encode(array.tobytes()).decode('ascii')
+    return JsCode(f"azplotDecode('{data}', '{type_name}', {scale:g}, {int(delta)})")
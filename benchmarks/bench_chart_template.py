@@ -0,0 +1,46 @@
+"""
+StockChartView逐个构建 vs StockChartTemplate注入数据，对比每个图的构建+序列化耗时
+两边都在计时内从同样的DataFrame新建模型（模型里缓存的指标、涨停标记不会被前一轮预热），
+序列化都用serialize.dumps，差别只在option怎么构建
+用法：python benchmarks/bench_chart_template.py [股票数] [K线根数]
+"""
+import os
+import sys
+import time
+
+# 直接运行脚本时sys.path[0]是benchmarks/，把仓库根目录加进来才能导入azplot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from azplot import serialize
+from azplot.chart_template import StockChartTemplate
+from azplot.stock_bar import StockChartModel, StockChartView
+from synthetic import synthetic_stock_df
+
+
+def main(stock_count: int = 50, bar_count: int = 250):
+    # 与read_stock_csv一样去掉停牌日
+    frames = [synthetic_stock_df(f'sh{600000 + i}', bar_count, i).dropna(subset=['成交额']).reset_index(drop=True)
+              for i in range(stock_count)]
+
+    def new_model(df):
+        return StockChartModel(df.copy(), start_date=df.交易日期.iloc[0].strftime('%Y/%m/%d'),
+                               end_date=df.交易日期.iloc[-1].strftime('%Y/%m/%d'))
+
+    start = time.perf_counter()
+    for df in frames:
+        serialize.dump_options(StockChartView(new_model(df)))
+    before = (time.perf_counter() - start) / stock_count
+
+    template = StockChartTemplate()
+    start = time.perf_counter()
+    for df in frames:
+        template.chart(new_model(df)).dump_options()
+    after = (time.perf_counter() - start) / stock_count
+
+    print(f'{stock_count} charts x {bar_count} bars')
+    print(f'StockChartView:     {before * 1000:8.2f} ms/chart')
+    print(f'StockChartTemplate: {after * 1000:8.2f} ms/chart  ({before / after:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
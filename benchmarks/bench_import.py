@@ -0,0 +1,56 @@
+"""
+import azplot 的耗时和副作用检查：在全新的解释器里导入，超出时间预算、提前加载了重依赖或改了pandas全局配置时以非0退出
+用法：python benchmarks/bench_import.py [预算毫秒数]
+"""
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import azplot 本身不应该带进来的模块
+HEAVY_MODULES = ['pandas', 'numpy', 'pyecharts', 'azhint', 'decimal']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import azplot
+elapsed = time.perf_counter() - start
+print(elapsed * 1000)
+print(','.join(m for m in {heavy!r} if m in sys.modules))
+import pandas as pd
+defaults = [pd.get_option(o) for o in ('expand_frame_repr', 'display.max_rows', 'display.unicode.east_asian_width')]
+azplot.StockChartController
+after = [pd.get_option(o) for o in ('expand_frame_repr', 'display.max_rows', 'display.unicode.east_asian_width')]
+print(defaults == after)
+"""
+
+
+def measure() -> tuple:
+    # 子进程从仓库根目录导入azplot，不依赖当前目录和是否已安装
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    output = subprocess.run([sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES)], check=True,
+                            capture_output=True, text=True, env=env).stdout.splitlines()
+    return float(output[0]), [m for m in output[1].split(',') if m], output[2] == 'True'
+
+
+def main(budget_ms: float = 50, repeat: int = 5):
+    # 取多次里最快的一次，排除磁盘缓存等干扰
+    results = [measure() for _ in range(repeat)]
+    elapsed = min(r[0] for r in results)
+    loaded, options_untouched = results[0][1], results[0][2]
+    print(f'import azplot: {elapsed:.2f} ms (budget {budget_ms:.0f} ms)')
+    failures = []
+    if elapsed > budget_ms:
+        failures.append(f'import took {elapsed:.2f} ms, over the {budget_ms:.0f} ms budget')
+    if loaded:
+        failures.append(f'import azplot loaded heavy modules eagerly: {loaded}')
+    if not options_untouched:
+        failures.append('importing azplot.stock_bar changed pandas display options')
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,196 @@
+"""
+离线基准测试：用模拟数据测量 加载、建模、构建视图、渲染 各阶段的耗时和输出字节数，与保存的基线比较
+覆盖 StockChartController（_get_chart_model、StockChartModel、StockChartView）和 NetLineView，
+分别在不同的K线根数、股票数下测量；windowed用例看长历史文件上近期窗口的读取（只读CSV末尾），timeframe用例看周线/月线的合并和切换
+用法（在仓库根目录或任意目录下，不需要先安装azplot）：
+    python benchmarks/bench_suite.py           # 与 benchmarks/baseline.json 比较，有退化时以非0退出
+    python benchmarks/bench_suite.py --save    # 把本次结果存为基线
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+from pyecharts.charts import Tab
+
+# 直接运行脚本时sys.path[0]是benchmarks/，把仓库根目录加进来才能导入azplot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from azplot.netvalue_line import NetLineModel, NetLineView
+from azplot.stock_bar import StockChartController, StockChartView
+from synthetic import synthetic_equity_df, write_stock_dir
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# (K线根数, 股票数)
+STOCK_CASES = [(250, 1), (1000, 1), (4000, 1), (1000, 20)]
+NET_VALUE_CASES = [1000, 4000, 20000]
+WINDOWED_CASES = [1000, 6000]
+TIMEFRAME_CASES = ['W', 'M']
+
+# 比基线慢这么多（比例）且绝对差值超过NOISE_SECONDS才算退化；基线与机器有关，换机器后先--save
+TIME_TOLERANCE = 0.5
+NOISE_SECONDS = 0.005
+BYTES_TOLERANCE = 0.01
+
+
+def timed(stages: Dict[str, float], stage: str, func: Callable):
+    start = time.perf_counter()
+    result = func()
+    stages[stage] = stages.get(stage, 0) + time.perf_counter() - start
+    return result
+
+
+def bench_stocks(work_dir: str, bar_count: int, stock_count: int) -> dict:
+    stock_data_dir = os.path.join(work_dir, f'stocks_{bar_count}_{stock_count}')
+    codes = write_stock_dir(stock_data_dir, stock_count, bar_count)
+    controller = StockChartController(stock_data_dir)
+    stages = {}
+    views = []
+    for code in codes:
+        stock_data = timed(stages, 'load', lambda: controller._load_stock_data(code))
+        model = timed(stages, 'model', lambda: controller._get_chart_model(code, stock_data=stock_data))
+        views.append(timed(stages, 'view', lambda: StockChartView(model)))
+
+    path = os.path.join(work_dir, f'stocks_{bar_count}_{stock_count}.html')
+    if stock_count == 1:
+        timed(stages, 'render', lambda: views[0].render(path))
+    else:
+        # 多只股票与draw_stocks一样放进一个Tab
+        def render_tab():
+            tab = Tab(page_title='bench')
+            for code, view in zip(codes, views):
+                tab.add(view, code)
+            tab.render(path)
+        timed(stages, 'render', render_tab)
+    return {'seconds': stages, 'bytes': os.path.getsize(path)}
+
+
+def bench_windowed(work_dir: str, bar_count: int) -> dict:
+    """
+    windowed模式下画最近100根K线，耗时应与上市时间基本无关
+    """
+    stock_data_dir = os.path.join(work_dir, f'windowed_{bar_count}')
+    code = write_stock_dir(stock_data_dir, 1, bar_count)[0]
+    controller = StockChartController(stock_data_dir)
+    stages = {}
+    model = timed(stages, 'model', lambda: controller._get_chart_model(
+        code, window_start='2023/02/07', window_end='2023/06/30', windowed=True))
+    view = timed(stages, 'view', lambda: StockChartView(model))
+    path = os.path.join(work_dir, f'windowed_{bar_count}.html')
+    timed(stages, 'render', lambda: view.render(path))
+    return {'seconds': stages, 'bytes': os.path.getsize(path)}
+
+
+def bench_timeframe(work_dir: str, timeframe: str) -> dict:
+    """
+    4000根日线合并成周线/月线：resample是第一次（合并+建图），switch是切回来时（命中缓存，只建图）
+    """
+    stock_data_dir = os.path.join(work_dir, f'timeframe_{timeframe}')
+    code = write_stock_dir(stock_data_dir, 1, 4000)[0]
+    controller = StockChartController(stock_data_dir)
+    stages = {}
+    timed(stages, 'resample', lambda: controller._get_chart_model(code, timeframe=timeframe))
+    model = timed(stages, 'switch', lambda: controller._get_chart_model(code, timeframe=timeframe))
+    view = timed(stages, 'view', lambda: StockChartView(model))
+    path = os.path.join(work_dir, f'timeframe_{timeframe}.html')
+    timed(stages, 'render', lambda: view.render(path))
+    return {'seconds': stages, 'bytes': os.path.getsize(path)}
+
+
+def bench_net_value(work_dir: str, bar_count: int) -> dict:
+    equity_df = synthetic_equity_df(bar_count)
+    stages = {}
+    model = timed(stages, 'model', lambda: NetLineModel(equity_df, name='bench'))
+    view = timed(stages, 'view', lambda: NetLineView(model))
+    path = os.path.join(work_dir, f'net_value_{bar_count}.html')
+    timed(stages, 'render', lambda: view.render(path))
+    return {'seconds': stages, 'bytes': os.path.getsize(path)}
+
+
+def run(repeat: int = 3) -> Dict[str, dict]:
+    """
+    :param repeat: 每个用例跑几次，各阶段取最快的一次
+    :return: 用例名 -> {'seconds': {阶段: 秒}, 'bytes': 输出字节数}
+    """
+    cases = {f'stock/{bars}bars/{stocks}stocks': (bench_stocks, bars, stocks) for bars, stocks in STOCK_CASES}
+    cases.update({f'net_value/{bars}bars': (bench_net_value, bars) for bars in NET_VALUE_CASES})
+    cases.update({f'stock_windowed/{bars}bars': (bench_windowed, bars) for bars in WINDOWED_CASES})
+    cases.update({f'stock_timeframe/{timeframe}': (bench_timeframe, timeframe) for timeframe in TIMEFRAME_CASES})
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='azplot_bench_') as work_dir:
+        # 预热：第一次渲染要编译jinja模板、导入pyecharts的各个模块，不计入结果
+        bench_stocks(work_dir, 250, 1)
+        bench_net_value(work_dir, 250)
+        for name, (func, *args) in cases.items():
+            runs = [func(work_dir, *args) for _ in range(repeat)]
+            results[name] = {
+                'seconds': {stage: min(r['seconds'][stage] for r in runs) for stage in runs[0]['seconds']},
+                'bytes': runs[0]['bytes'],
+            }
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float = TIME_TOLERANCE) -> list:
+    """
+    :return: 退化的描述，没有退化时为空
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for stage, seconds in result['seconds'].items():
+            base_seconds = base['seconds'].get(stage)
+            if base_seconds is not None and seconds > base_seconds * (1 + tolerance) \
+                    and seconds - base_seconds > NOISE_SECONDS:
+                regressions.append(f'{name} {stage}: {seconds * 1000:.1f} ms, baseline {base_seconds * 1000:.1f} ms')
+        if result['bytes'] > base['bytes'] * (1 + BYTES_TOLERANCE):
+            regressions.append(f'{name} bytes: {result["bytes"]}, baseline {base["bytes"]}')
+    return regressions
+
+
+def print_table(results: Dict[str, dict], baseline: Dict[str, dict]):
+    for name, result in results.items():
+        base = baseline.get(name, {'seconds': {}, 'bytes': None})
+        cells = []
+        for stage, seconds in result['seconds'].items():
+            base_seconds = base['seconds'].get(stage)
+            change = '' if base_seconds is None else f' ({seconds / base_seconds - 1:+.0%})'
+            cells.append(f'{stage} {seconds * 1000:.1f}ms{change}')
+        change = '' if base['bytes'] is None else f' ({result["bytes"] / base["bytes"] - 1:+.1%})'
+        print(f'{name:32s} {"  ".join(cells)}  bytes {result["bytes"]}{change}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--save', action='store_true', help='把本次结果存为基线')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基线文件路径')
+    parser.add_argument('--tolerance', type=float, default=TIME_TOLERANCE, help='耗时比基线慢多少（比例）算退化')
+    parser.add_argument('--repeat', type=int, default=3, help='每个用例跑几次，取最快的一次')
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat)
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print_table(results, {})
+        print(f'baseline saved to {args.baseline}')
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+离线的模拟行情数据：stock-trading-data-pro格式的日线CSV（GBK编码、首行标题行）和策略净值曲线
+"""
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# stock-trading-data-pro日线CSV的列顺序
+STOCK_COLUMNS = ['交易日期', '开盘价', '收盘价', '最低价', '最高价', '前收盘价', '成交额', '股票名称', '股票代码']
+TITLE_ROW = '数据由邢不行整理，对数据字段有疑问的，可以直接微信私信邢不行，微信号：xbx297'
+
+# 默认截止到这一天，StockChartController各方法的默认窗口（2022/10/11 ~ 2023/02/07）落在数据里
+DEFAULT_END = '2023-06-30'
+
+
+def synthetic_stock_df(code: str, bar_count: int, seed: int, end: str = DEFAULT_END) -> pd.DataFrame:
+    """
+    几何随机游走的日线，约2%的涨停（收盘价=最高价，涨幅10%）、约1%的停牌（成交额为空）
+    :return: 与read_stock_csv读出的列相同，交易日期是Timestamp
+    """
+    rng = np.random.default_rng(seed)
+    close = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, bar_count))), 2)
+    pre_close = np.append(close[0], close[:-1])
+    up_limit = rng.choice(bar_count, bar_count // 50, replace=False)
+    close[up_limit] = np.round(pre_close[up_limit] * 1.1, 2)
+    pre_close = np.append(close[0], close[:-1])
+    open_ = np.round(pre_close * (1 + rng.normal(0, 0.01, bar_count)), 2)
+    high = np.round(np.maximum(open_, close) * (1 + abs(rng.normal(0, 0.01, bar_count))), 2)
+    high[up_limit] = close[up_limit]
+    amount = np.round(rng.uniform(1e7, 1e9, bar_count), 2)
+    amount[rng.choice(bar_count, bar_count // 100, replace=False)] = np.nan
+    return pd.DataFrame({
+        '交易日期': pd.bdate_range(end=end, periods=bar_count),
+        '开盘价': open_,
+        '收盘价': close,
+        '最低价': np.round(np.minimum(open_, close) * (1 - abs(rng.normal(0, 0.01, bar_count))), 2),
+        '最高价': high,
+        '前收盘价': pre_close,
+        '成交额': amount,
+        '股票名称': f'股票{seed}',
+        '股票代码': code,
+    })[STOCK_COLUMNS]
+
+
+def write_stock_csv(stock_df: pd.DataFrame, path: str):
+    """
+    按stock-trading-data-pro的格式写出：GBK编码，第一行是标题行，第二行起是带表头的数据
+    """
+    with open(path, 'w', encoding='gbk', newline='') as f:
+        f.write(TITLE_ROW + '\n')
+        stock_df.to_csv(f, index=False, date_format='%Y-%m-%d')
+
+
+def write_stock_dir(stock_data_dir: str, stock_count: int, bar_count: int, seed: int = 0) -> List[str]:
+    """
+    在stock_data_dir下生成stock_count个{code}.csv
+    :return: 股票代码列表
+    """
+    os.makedirs(stock_data_dir, exist_ok=True)
+    codes = []
+    for i in range(stock_count):
+        code = f'sh{600000 + i}'
+        write_stock_csv(synthetic_stock_df(code, bar_count, seed + i), os.path.join(stock_data_dir, f'{code}.csv'))
+        codes.append(code)
+    return codes
+
+
+def synthetic_equity_df(bar_count: int, seed: int = 0, end: str = DEFAULT_END) -> pd.DataFrame:
+    """
+    :return: draw_net_value需要的格式：index是交易日期，列为 equity_curve、涨跌幅、benchmark
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.015, bar_count)
+    benchmark_returns = rng.normal(0.0002, 0.012, bar_count)
+    return pd.DataFrame({
+        'equity_curve': np.cumprod(1 + returns),
+        '涨跌幅': returns,
+        'benchmark': np.cumprod(1 + benchmark_returns),
+    }, index=pd.bdate_range(end=end, periods=bar_count, name='交易日期'))
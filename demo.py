@@ -1,5 +1,15 @@
+import sys
+import tempfile
+
 from azplot import draw_stock
 
 if __name__ == '__main__':
-    draw_stock(stock_data_dir=r'D:\Work\Code\azen-quant\data\xbx_stock_data\data\stock-trading-data-pro',
-               code='sh601360')
+    # 用法：python demo.py [stock_data_dir] [code]；不传目录时用benchmarks/synthetic.py生成的模拟数据
+    if len(sys.argv) > 1:
+        stock_data_dir = sys.argv[1]
+        code = sys.argv[2] if len(sys.argv) > 2 else 'sh601360'
+    else:
+        from benchmarks.synthetic import write_stock_dir
+        stock_data_dir = tempfile.mkdtemp(prefix='azplot_demo_')
+        code = write_stock_dir(stock_data_dir, stock_count=1, bar_count=2000)[0]
+    draw_stock(stock_data_dir=stock_data_dir, code=code)
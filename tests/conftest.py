@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# 直接在仓库里运行pytest时也能导入azplot，不需要先安装
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def stock_data_dir(tmp_path) -> str:
+    """
+    3只股票、各600根K线的模拟日线目录（benchmarks/synthetic.py生成），代码是sh600000 ~ sh600002
+    """
+    from benchmarks.synthetic import write_stock_dir
+    stock_data_dir = str(tmp_path / 'stock')
+    write_stock_dir(stock_data_dir, 3, 600)
+    return stock_data_dir
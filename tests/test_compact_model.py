@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot import serialize
+from azplot.compact_model import CompactStockChartModel, compact_column
+from azplot.stock_bar import StockChartModel, StockChartView
+from benchmarks.synthetic import synthetic_stock_df
+
+PRICES = ['开盘价', '收盘价', '最低价', '最高价', '前收盘价']
+OVERLAYS = ['MA5', 'MA150', 'EMA20', 'BOLL']
+
+
+def stock_df(prices: str) -> pd.DataFrame:
+    """
+    :param prices: 'plain'：2位小数；'3dp'：3位小数；'adjusted'：乘以复权因子、不四舍五入
+    """
+    df = synthetic_stock_df('sh600000', 400, 0).dropna(subset=['成交额']).reset_index(drop=True)
+    if prices == '3dp':
+        df[PRICES] = np.round(df[PRICES] * 1.0013, 3)
+    elif prices == 'adjusted':
+        df[PRICES] = df[PRICES] * 1.0372819
+    return df
+
+
+def models(df: pd.DataFrame, **kwargs):
+    kwargs = dict(start_date='2022/10/11', end_date='2023/02/07', **kwargs)
+    return StockChartModel(df.copy(), **kwargs), CompactStockChartModel(df, **kwargs)
+
+
+@pytest.mark.parametrize('prices', ['plain', '3dp', 'adjusted'])
+@pytest.mark.parametrize('warmup', [0, 150])
+def test_same_options_as_stock_chart_model(prices, warmup):
+    df = stock_df(prices)
+    days = df['交易日期'].iloc[[200, 260, 330]].tolist()
+    model, compact = models(df, buy_days=days[:2], sell_days=days[2:], warmup=warmup)
+    for view_args in ({}, {'use_dataset': True}, {'max_points': 100}):
+        expected = serialize.dump_options(StockChartView(model, overlays=OVERLAYS, **view_args))
+        assert serialize.dump_options(StockChartView(compact, overlays=OVERLAYS, **view_args)) == expected
+    assert len(compact) == len(model.dates)
+    assert compact.returns == model.returns
+    assert compact.stock_name == model.stock_name and compact.code == model.code
+
+
+def test_input_frame_not_mutated():
+    df = stock_df('adjusted')
+    before = df.copy()
+    compact = CompactStockChartModel(df, start_date='2022/10/11', end_date='2023/02/07', warmup=100)
+    compact.up_limits()
+    compact.ma(150)
+    rebuilt = compact.stock_df
+    rebuilt['涨跌幅'] = 0.0
+    pd.testing.assert_frame_equal(df, before)
+    assert '涨跌幅' not in df.columns
+
+
+def test_slots_only():
+    _, compact = models(stock_df('plain'))
+    assert not hasattr(compact, '__dict__')
+    with pytest.raises(AttributeError):
+        compact.anything = 1
+
+
+def test_compact_column():
+    plain = np.array([10.03, 12.5, np.nan])
+    packed, decimals = compact_column(plain, 2)
+    assert (packed.dtype, decimals) == (np.float32, 2)
+    assert np.array_equal(np.round(packed.astype(np.float64), 2), plain, equal_nan=True)
+
+    adjusted = plain * 1.0372819
+    values, decimals = compact_column(adjusted, 2)
+    assert decimals is None and values is adjusted
@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import azplot
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# import azplot 本身不应该带进来的模块，与benchmarks/bench_import.py相同
+HEAVY_MODULES = ['pandas', 'numpy', 'pyecharts', 'azhint', 'decimal']
+# import azplot 的耗时上限（毫秒），比benchmarks/bench_import.py的50ms预算宽松得多，只为发现又在导入时加载了重依赖
+IMPORT_BUDGET_MS = 300
+PANDAS_OPTIONS = ['expand_frame_repr', 'display.max_rows', 'display.max_columns',
+                  'display.unicode.east_asian_width', 'display.unicode.ambiguous_as_wide']
+
+
+def run_fresh(code: str):
+    """
+    在全新的解释器里运行code，返回它最后一行输出的JSON
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True, env=env,
+                            cwd=REPO_ROOT).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_does_not_load_heavy_modules():
+    loaded = run_fresh(f'import json, sys\nimport azplot\n'
+                       f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))')
+    assert loaded == []
+
+
+def test_import_is_fast():
+    # 只计import azplot本身，不含解释器启动；取3次里最快的，排除磁盘缓存等干扰
+    elapsed = min(run_fresh('import json, time\nstart = time.perf_counter()\nimport azplot\n'
+                            'print(json.dumps((time.perf_counter() - start) * 1000))') for _ in range(3))
+    assert elapsed < IMPORT_BUDGET_MS
+
+
+def test_using_controller_keeps_pandas_options():
+    before, after = run_fresh(f'import json\nimport pandas as pd\nimport azplot\n'
+                              f'options = {PANDAS_OPTIONS!r}\n'
+                              f'before = [pd.get_option(o) for o in options]\n'
+                              f'azplot.StockChartController, azplot.draw_net_value\n'
+                              f'print(json.dumps([before, [pd.get_option(o) for o in options]]))')
+    assert before == after
+
+
+@pytest.mark.parametrize('name', azplot.__all__)
+def test_exports_resolve(name):
+    assert getattr(azplot, name) is not None
+    assert name in dir(azplot)
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        azplot.no_such_name
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.indicators import IndicatorContext, parse_indicator
+
+
+def synthetic_close(n: int = 5000) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return np.round(300 + np.cumsum(rng.normal(0, 1, n)), 2)
+
+
+@pytest.mark.parametrize('n', [5, 20, 150])
+def test_ma_matches_pandas_rolling_exactly(n):
+    close = synthetic_close()
+    expected = pd.Series(close).rolling(n).mean().to_numpy()
+    assert np.array_equal(IndicatorContext(close).compute('ma', n=n), expected, equal_nan=True)
+
+
+def test_ma_with_nan_matches_pandas_rolling():
+    close = synthetic_close(300)
+    close[[10, 11, 200]] = np.nan
+    expected = pd.Series(close).rolling(5).mean().to_numpy()
+    assert np.array_equal(IndicatorContext(close).compute('ma', n=5), expected, equal_nan=True)
+
+
+def test_amount_ma_uses_amount_column():
+    close = synthetic_close(100)
+    amount = close * 1e8
+    result = IndicatorContext(close, amount=amount).compute('amount_ma', n=10)
+    assert np.array_equal(result, pd.Series(amount).rolling(10).mean().to_numpy(), equal_nan=True)
+
+
+def test_boll_std_matches_population_std():
+    # 价格水平很高、波动很小时 E[x²] - E[x]² 会严重抵消
+    close = 1e6 + np.round(np.random.default_rng(1).normal(0, 0.01, 2000), 2)
+    result = IndicatorContext(close).compute('boll', n=20, k=2)
+    std = pd.Series(close).rolling(20).std(ddof=0).to_numpy()
+    mid = pd.Series(close).rolling(20).mean().to_numpy()
+    assert np.array_equal(result['mid'], mid, equal_nan=True)
+    assert np.array_equal(result['upper'], mid + 2 * std, equal_nan=True)
+    assert np.array_equal(result['lower'], mid - 2 * std, equal_nan=True)
+    assert np.all(result['upper'][19:] >= result['lower'][19:])
+
+
+def test_compute_is_memoized():
+    context = IndicatorContext(synthetic_close(100))
+    assert context.compute('ma', n=5) is context.compute('ma', n=5)
+    macd = context.compute('macd')
+    assert set(macd) == {'dif', 'dea', 'macd'}
+    assert context.compute('macd') is macd
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('MA5', ('ma', {'n': 5})),
+    ('ma150', ('ma', {'n': 150})),
+    ('BOLL', ('boll', {})),
+    ('BOLL20', ('boll', {'n': 20})),
+    ('MACD', ('macd', {})),
+])
+def test_parse_indicator(spec, expected):
+    assert parse_indicator(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['MACD12', 'XYZ5', '5MA', ''])
+def test_parse_indicator_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_indicator(spec)
@@ -0,0 +1,134 @@
+import http.client
+import json
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot import serialize
+from azplot.live import LiveStockChart
+from azplot.stock_bar import StockChartModel, StockChartView
+
+OVERLAYS = ['MA5', 'MA20', 'MA150']
+
+
+def stock_df(n=400, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = np.round(10 + np.cumsum(rng.normal(0, 0.2, n)), 2)
+    pre_close = np.r_[close[0], close[:-1]]
+    # 几根涨停，检查'板'标记
+    limit_up = np.arange(50, n, 37)
+    close[limit_up] = np.round(pre_close[limit_up] * 1.1, 2)
+    return pd.DataFrame({
+        '交易日期': pd.bdate_range('2021-01-04', periods=n),
+        '开盘价': pre_close,
+        '收盘价': close,
+        '最低价': np.minimum(pre_close, close) - 0.05,
+        '最高价': np.maximum(pre_close, close),
+        '前收盘价': pre_close,
+        '成交额': np.round(rng.uniform(1e6, 1e8, n), 2),
+        '股票名称': '测试',
+        '股票代码': 'sh600000',
+    })
+
+
+def model_of(df: pd.DataFrame) -> StockChartModel:
+    return StockChartModel(df.copy(), '2021/01/04', '2030/12/31')
+
+
+def bar_of(row: pd.Series) -> dict:
+    return {column: row[column] for column in ['交易日期', '开盘价', '收盘价', '最低价', '最高价', '前收盘价', '成交额']}
+
+
+def chart_data(options: dict) -> str:
+    """
+    图上会随K线变化的部分：横轴、每个系列的数据、K线上的标记
+    """
+    series = options['series']
+    return serialize.dumps({'xAxis': [axis['data'] for axis in options['xAxis']],
+                            'series': [s['data'] for s in series],
+                            'markPoint': series[0].get('markPoint', {}).get('data', [])})
+
+
+def test_append_and_update_match_fresh_model():
+    full = stock_df()
+    live = LiveStockChart(model_of(full.iloc[:200]), overlays=OVERLAYS)
+    rng = np.random.default_rng(1)
+    for i in range(200, len(full)):
+        row = full.iloc[i]
+        # 盘中先推几个临时价，最后一次update成收盘时的那根
+        for _ in range(int(rng.integers(0, 3))):
+            live.append(dict(bar_of(row), 收盘价=round(row['收盘价'] + rng.normal(0, 0.1), 2)))
+        live.append(bar_of(row))
+
+    fresh = model_of(full)
+    expected = serialize.clean_options(StockChartView(fresh, overlays=OVERLAYS).options)
+    assert chart_data(live.options()) == chart_data(expected)
+    for n, line in zip([5, 20, 150], live.options()['series'][1:4]):
+        # 均线逐位相同，不是近似相等
+        assert np.array_equal([value for _, value in line['data']], fresh.ma(n), equal_nan=True)
+
+
+def test_older_bar_rejected():
+    full = stock_df(100)
+    live = LiveStockChart(model_of(full), overlays=OVERLAYS)
+    with pytest.raises(ValueError):
+        live.append(bar_of(full.iloc[50]))
+
+
+@pytest.fixture
+def live():
+    full = stock_df(260)
+    live = LiveStockChart(model_of(full.iloc[:200]), overlays=OVERLAYS, history_size=30)
+    live.rows = full.iloc[200:]
+    live.serve(port=0)
+    yield live
+    live.close()
+
+
+def request(live, target: str, headers=None) -> http.client.HTTPResponse:
+    connection = http.client.HTTPConnection(*live.server.server_address[:2], timeout=5)
+    connection.request('GET', target, headers=headers or {})
+    return connection.getresponse()
+
+
+def read_events(response, count: int) -> list:
+    events = []
+    while len(events) < count:
+        fields = {}
+        for line in iter(response.fp.readline, b'\n'):
+            key, _, value = line.decode('utf-8').rstrip('\n').partition(': ')
+            fields[key] = value
+        if '' not in fields:  # 跳过': ping'心跳
+            events.append(fields)
+    return events
+
+
+def test_bars_between_page_and_subscribe_are_replayed(live):
+    live.append(bar_of(live.rows.iloc[0]))
+    page = request(live, '/').read().decode('utf-8')
+    seq = int(re.search(r'var SEQ = (\d+);', page).group(1))
+    assert seq == 1
+    assert '2021/10/11' in page
+
+    # 页面拿到之后、订阅之前的K线
+    live.append(bar_of(live.rows.iloc[1]))
+    live.append(dict(bar_of(live.rows.iloc[1]), 收盘价=1.0))
+    events = read_events(request(live, f'/events?since={seq}'), 2)
+    assert [int(event['id']) for event in events] == [2, 3]
+    assert [json.loads(event['data'])['op'] for event in events] == ['append', 'update']
+
+    # 断线重连带Last-Event-ID，优先于since
+    response = request(live, '/events?since=0', {'Last-Event-ID': '2'})
+    live.append(bar_of(live.rows.iloc[2]))
+    events = read_events(response, 2)
+    assert [int(event['id']) for event in events] == [3, 4]
+
+
+def test_replay_too_old_reloads_page(live):
+    for i in range(40):
+        live.append(bar_of(live.rows.iloc[i]))
+    events = read_events(request(live, '/events?since=1'), 1)
+    assert events[0]['event'] == 'reload'
+    assert request(live, '/events?since=abc').status == 400
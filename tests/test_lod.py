@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.lod import aggregate_ohlc, bucket_ends, bucket_starts, compound_returns, minmax_indices
+
+
+def random_walk(n: int, seed: int = 0) -> np.ndarray:
+    return 100 + np.cumsum(np.random.default_rng(seed).normal(0, 1, n))
+
+
+@pytest.mark.parametrize('n, bucket_count', [(10, 3), (10, 10), (10, 20), (1000, 7), (1, 5)])
+def test_bucket_starts_cover_range(n, bucket_count):
+    starts = bucket_starts(n, bucket_count)
+    assert starts[0] == 0
+    assert len(starts) <= bucket_count
+    assert np.all(np.diff(starts) > 0)
+    ends = bucket_ends(starts, n)
+    assert ends[-1] == n - 1
+    assert np.array_equal(starts[1:], ends[:-1] + 1)
+
+
+def test_aggregate_ohlc_matches_groupby():
+    n = 503
+    close = random_walk(n)
+    open_, low, high = close - 0.5, close - 1, close + 1
+    amount = np.abs(random_walk(n, seed=1)) * 1e6
+    amount[[5, 100]] = np.nan
+    starts = bucket_starts(n, 40)
+    result = aggregate_ohlc(open_, close, low, high, amount, starts)
+
+    groups = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    frame = pd.DataFrame({'open': open_, 'close': close, 'low': low, 'high': high, 'amount': amount}).groupby(groups)
+    expected = (frame['open'].first(), frame['close'].last(), frame['low'].min(), frame['high'].max(),
+                frame['amount'].sum())
+    for actual, wanted in zip(result, expected):
+        assert np.allclose(actual, wanted.to_numpy())
+
+
+@pytest.mark.parametrize('series_count', [1, 3])
+@pytest.mark.parametrize('max_points', [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 50, 999])
+def test_minmax_indices_never_exceeds_max_points(series_count, max_points):
+    series = [random_walk(1000, seed) for seed in range(series_count)]
+    indices = minmax_indices(series, max_points)
+    assert 1 <= len(indices) <= max(1, max_points)
+    assert indices[0] == 0
+    assert np.all(np.diff(indices) > 0)
+    if max_points >= 2:
+        assert indices[-1] == 999
+
+
+def test_minmax_indices_keeps_extremes():
+    values = random_walk(1000)
+    indices = minmax_indices([values], 100)
+    assert values.argmin() in indices
+    assert values.argmax() in indices
+
+
+def test_minmax_indices_short_series_untouched():
+    assert np.array_equal(minmax_indices([np.arange(5.0)], 10), np.arange(5))
+
+
+def test_compound_returns_preserves_total_return():
+    returns = np.random.default_rng(2).normal(0, 0.01, 500)
+    indices = minmax_indices([np.cumprod(1 + returns)], 60)
+    merged = compound_returns(returns, indices)
+    assert np.isclose(np.prod(1 + merged), np.prod(1 + returns[:indices[-1] + 1]))
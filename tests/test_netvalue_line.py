@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from azplot import serialize
+from azplot.netvalue_line import NetSweepModel, NetSweepView
+
+
+def sweep_curves() -> dict:
+    """
+    日历不同的几条曲线：完整的、晚开始的、每5天缺1天的（日期并集上要填充）、中间有NaN的
+    """
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2020-01-01', periods=500)
+
+    def curve(index):
+        return pd.DataFrame({'equity_curve': np.cumprod(1 + rng.normal(0.0005, 0.015, len(index)))}, index=index)
+
+    curves = {
+        'full': curve(dates),
+        'late': curve(dates[200:]),
+        'sparse': curve(dates[np.arange(len(dates)) % 5 != 2]),
+        'holes': curve(dates[:450]),
+    }
+    curves['holes'].iloc[100:110] = np.nan
+    return curves
+
+
+def reference_stats(curves: dict) -> pd.DataFrame:
+    """
+    逐条曲线单独用pandas计算
+    """
+    rows = {}
+    for key, df in curves.items():
+        nav = df['equity_curve'].dropna()
+        returns = nav.pct_change().dropna()
+        rows[key] = {'final_nav': nav.iloc[-1],
+                     'max_drawdown': (nav / nav.cummax() - 1).min(),
+                     'sharpe': returns.mean() / returns.std() * np.sqrt(252)}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def test_stats_match_per_curve_reference():
+    curves = sweep_curves()
+    model = NetSweepModel(curves)
+    expected = reference_stats(curves)
+    # 填充出来的日子不算进收益率，否则缺日子的曲线夏普比率偏低；统计用float64算，不受float32存储影响
+    pd.testing.assert_frame_equal(model.stats, expected[model.stats.columns], rtol=1e-9)
+    assert model.values.shape == (500, 4)
+    assert np.isnan(model.values[:200, model.names.index('late')]).all()
+
+
+def test_wide_frame_input_and_ranking():
+    curves = sweep_curves()
+    wide = pd.concat({key: df['equity_curve'] for key, df in curves.items()}, axis=1)
+    model = NetSweepModel(wide)
+    pd.testing.assert_frame_equal(model.stats, NetSweepModel(curves).stats)
+    best = int(np.argmax(model.stats['sharpe'].to_numpy()))
+    assert model.top(1, by='sharpe') == [best]
+    low, median, high = model.percentile_band()
+    assert np.all(low[200:] <= median[200:]) and np.all(median[200:] <= high[200:])
+
+
+def test_view_draws_top_n():
+    model = NetSweepModel(sweep_curves())
+    options = serialize.clean_options(NetSweepView(model, top_n=2, max_points=100).options)
+    names = [series['name'] for series in options['series']]
+    assert [model.names[i] for i in model.top(2)] == [name for name in names if name in model.names]
@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.panel import MarketPanel
+from azplot.stock_data import read_stock_csv
+from benchmarks.synthetic import synthetic_stock_df, write_stock_csv
+
+CODES = ['sh600000', 'sh600001']
+
+
+@pytest.fixture
+def full_dfs():
+    return {code: synthetic_stock_df(code, 300, seed) for seed, code in enumerate(CODES)}
+
+
+@pytest.fixture
+def stock_dir(tmp_path, full_dfs) -> str:
+    """
+    每只股票先只写前280根，留给增量更新的用例
+    """
+    stock_dir = str(tmp_path / 'stock')
+    os.makedirs(stock_dir)
+    for code, df in full_dfs.items():
+        write_stock_csv(df.iloc[:280], os.path.join(stock_dir, f'{code}.csv'))
+    return stock_dir
+
+
+def assert_same_as_csv(panel: MarketPanel, stock_dir: str, code: str):
+    expected = read_stock_csv(os.path.join(stock_dir, f'{code}.csv'))
+    # 面板里交易日期统一存成datetime64[ns]，read_csv读出来的精度可能不同
+    pd.testing.assert_frame_equal(panel.frame(code), expected, check_dtype=False)
+
+
+def is_one_segment(panel: MarketPanel, code: str) -> bool:
+    # 只有一段时column是memmap上的切片，多段时拼接成普通数组
+    return isinstance(panel.column('收盘价', code), np.memmap)
+
+
+def test_round_trip_and_date_range(stock_dir, tmp_path):
+    panel = MarketPanel.build(stock_dir, str(tmp_path / 'panel'))
+    assert panel.codes == CODES
+    for code in CODES:
+        assert_same_as_csv(panel, stock_dir, code)
+
+    expected = read_stock_csv(os.path.join(stock_dir, 'sh600000.csv'))
+    expected = expected[(expected['交易日期'] >= '2022-12-01') & (expected['交易日期'] <= '2023-01-31')]
+    pd.testing.assert_frame_equal(panel.frame('sh600000', '2022-12-01', '2023-01-31'),
+                                  expected.reset_index(drop=True), check_dtype=False)
+
+    # 重新打开同一个目录，读到的内容相同
+    reopened = MarketPanel(panel.panel_dir)
+    pd.testing.assert_frame_equal(reopened.frame('sh600001'), panel.frame('sh600001'))
+
+
+def test_frame_is_zero_copy(stock_dir):
+    panel = MarketPanel.build(stock_dir)
+    frame = panel.frame('sh600000')
+    memmap = panel.column('收盘价', 'sh600000')
+    assert isinstance(memmap, np.memmap)
+    assert np.shares_memory(frame['收盘价'].to_numpy(), memmap)
+    assert not memmap.flags.writeable
+
+
+def test_update_appends_new_rows_and_rewrites_changed_history(stock_dir, full_dfs, tmp_path):
+    panel = MarketPanel.build(stock_dir, str(tmp_path / 'panel'))
+    size = os.path.getsize(os.path.join(panel.panel_dir, '0.bin'))
+
+    # 只多了新的交易日：只追加新行
+    write_stock_csv(full_dfs['sh600000'], os.path.join(stock_dir, 'sh600000.csv'))
+    assert panel.update() == ['sh600000']
+    assert_same_as_csv(panel, stock_dir, 'sh600000')
+    assert_same_as_csv(panel, stock_dir, 'sh600001')
+    assert panel.calendar[-1] == np.datetime64('2023-06-30')
+    appended = os.path.getsize(os.path.join(panel.panel_dir, '0.bin')) - size
+    assert appended == 20 * 8 - 8 * full_dfs['sh600000'].iloc[280:]['成交额'].isna().sum()
+    assert panel.update() == []
+
+    # 复权重算改了历史：整只股票重新追加一份
+    rewritten = full_dfs['sh600001'].copy()
+    rewritten['收盘价'] = rewritten['收盘价'] * 2
+    write_stock_csv(rewritten, os.path.join(stock_dir, 'sh600001.csv'))
+    assert panel.update() == ['sh600001']
+    assert_same_as_csv(panel, stock_dir, 'sh600001')
+    assert not is_one_segment(panel, 'sh600000')
+
+    # compact回收作废的行，每只股票一段，内容不变
+    before = {code: panel.frame(code) for code in CODES}
+    rows = os.path.getsize(os.path.join(panel.panel_dir, '0.bin')) // 8
+    panel.compact()
+    assert os.path.getsize(os.path.join(panel.panel_dir, '0.bin')) // 8 < rows
+    for code in CODES:
+        assert is_one_segment(panel, code)
+        pd.testing.assert_frame_equal(panel.frame(code), before[code])
+    reopened = MarketPanel(panel.panel_dir)
+    for code in CODES:
+        pd.testing.assert_frame_equal(reopened.frame(code), before[code])
+
+
+def test_append_frame(stock_dir, full_dfs):
+    panel = MarketPanel.build(stock_dir)
+    day_df = pd.concat([df.iloc[280:283] for df in full_dfs.values()])
+    # 已有的交易日不会重复追加
+    day_df = pd.concat([day_df, full_dfs['sh600000'].iloc[270:275]])
+    assert sorted(panel.append_frame(day_df)) == CODES
+    for code, df in full_dfs.items():
+        expected = df.iloc[:283].dropna(subset=['成交额']).reset_index(drop=True)
+        pd.testing.assert_frame_equal(panel.frame(code), expected, check_dtype=False)
+    assert panel.append_frame(day_df) == []
+
+
+def test_missing_strings_stay_missing(stock_dir, full_dfs):
+    panel = MarketPanel.build(stock_dir)
+    new_code = full_dfs['sh600000'].iloc[:3].assign(股票代码='sh600009')
+    new_code['股票名称'] = [None, '新股', None]
+    no_name = full_dfs['sh600001'].iloc[280:282].drop(columns=['股票名称'])
+    panel.append_frame(pd.concat([new_code, no_name]))
+
+    assert panel.frame('sh600009')['股票名称'].isna().tolist() == [True, False, True]
+    assert panel.frame('sh600009')['股票名称'][1] == '新股'
+    assert panel.column('股票名称', 'sh600009')[0] == MarketPanel.MISSING_ID
+    names = panel.frame('sh600001')['股票名称']
+    assert names.iloc[-2:].isna().all()
+    # 缺失值不会显示成取值表里的第一个名字
+    assert names.iloc[:-2].eq('股票1').all()
+    assert None not in panel.vocab('股票名称')
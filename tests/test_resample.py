@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.resample import BarSnapper, normalize_timeframe, parse_timeframe, resample_stock_data
+from azplot.stock_bar import StockChartController
+from azplot.stock_data import read_stock_csv
+from azplot.trades import CodeTrades
+
+
+@pytest.fixture
+def daily(stock_data_dir) -> pd.DataFrame:
+    stock_data = read_stock_csv(os.path.join(stock_data_dir, 'sh600000.csv'))
+    # 模拟连续停牌：清洗后这几周没有任何K线
+    return stock_data.drop(index=range(100, 120)).reset_index(drop=True)
+
+
+def groupby_reference(stock_data: pd.DataFrame, key) -> pd.DataFrame:
+    groups = stock_data.groupby(key, sort=False)
+    return pd.DataFrame({
+        '交易日期': groups['交易日期'].last(), '开盘价': groups['开盘价'].first(), '收盘价': groups['收盘价'].last(),
+        '最低价': groups['最低价'].min(), '最高价': groups['最高价'].max(), '前收盘价': groups['前收盘价'].first(),
+        '成交额': groups['成交额'].sum(),
+    }).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('timeframe', ['W', 'M', '5D'])
+def test_matches_groupby(daily, timeframe):
+    keys = {'W': daily['交易日期'].dt.to_period('W-SUN'), 'M': daily['交易日期'].dt.to_period('M'),
+            '5D': np.arange(len(daily)) // 5}
+    expected = groupby_reference(daily, keys[timeframe])
+    result = resample_stock_data(daily, timeframe)
+    assert np.array_equal(result['交易日期'].to_numpy(), expected['交易日期'].to_numpy())
+    for column in expected.columns[1:]:
+        assert np.allclose(result[column], expected[column])
+    assert (result['股票代码'] == 'sh600000').all()
+
+
+def test_daily_is_returned_unchanged(daily):
+    assert resample_stock_data(daily, 'D') is daily
+    assert resample_stock_data(daily, '1d') is daily
+
+
+@pytest.mark.parametrize('timeframe, expected', [('d', 'D'), ('1D', 'D'), ('w', 'W'), ('M', 'M'), ('10d', '10D')])
+def test_normalize_timeframe(timeframe, expected):
+    assert normalize_timeframe(timeframe) == expected
+
+
+@pytest.mark.parametrize('timeframe', ['0D', '2W', 'X', '', 'D5'])
+def test_bad_timeframe(timeframe):
+    with pytest.raises(ValueError):
+        parse_timeframe(timeframe)
+
+
+def test_snapper_maps_days_to_containing_bar(daily):
+    weekly = resample_stock_data(daily, 'W')
+    snapper = BarSnapper(daily, weekly, 'W')
+    dates = daily['交易日期']
+    # 周中的交易日对到本周最后一个交易日；停牌期间的日期、数据范围外的日期去掉
+    suspended = dates[99] + pd.Timedelta(days=14)
+    days = [dates[5], suspended, pd.Timestamp('1990-01-01'), dates.iloc[-1] + pd.Timedelta(days=30)]
+    week_end = weekly['交易日期'][weekly['交易日期'] >= dates[5]].iloc[0]
+    assert snapper.days(days) == [week_end]
+    assert snapper.days(None) is None
+
+    trades = CodeTrades(np.array(days[:2], dtype='datetime64[ns]'), np.array([True, False]), np.array([1.0, 2.0]),
+                        np.array([100.0, 100.0]))
+    snapped = snapper.trades(trades)
+    assert len(snapped) == 1
+    assert snapped.dates[0] == np.datetime64(week_end)
+    assert snapper.window_date(dates[5].strftime('%Y/%m/%d')) == week_end.strftime('%Y/%m/%d')
+
+
+def test_controller_caches_per_code_and_timeframe(stock_data_dir):
+    controller = StockChartController(stock_data_dir)
+    weekly = controller._get_chart_model('sh600000', window_start='2023/01/03', window_end='2023/03/31',
+                                         timeframe='W')
+    daily = controller._get_chart_model('sh600000', window_start='2023/01/03', window_end='2023/03/31')
+    assert len(weekly.dates) < len(daily.dates)
+    assert weekly.start_date in weekly.dates and weekly.end_date in weekly.dates
+
+    frame, snapper = controller._load_resampled('sh600000', 'w')
+    again, snapper_again = controller._load_resampled('sh600000', 'W')
+    assert snapper_again is snapper
+    assert again.equals(frame)
+    # 返回的是浅拷贝，加列不影响缓存
+    again['涨跌幅'] = 0.0
+    assert '涨跌幅' not in controller._load_resampled('sh600000', 'W')[0].columns
+
+    # 源文件变化后重新合并
+    path = os.path.join(stock_data_dir, 'sh600000.csv')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert controller._load_resampled('sh600000', 'W')[1] is not snapper
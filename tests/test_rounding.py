@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.stock_bar import StockChartModel, round_half_up_pct, round_half_up_pct_decimal
+
+
+def assert_same(ratios):
+    ratios = pd.Series(np.asarray(ratios, dtype=np.float64))
+    vectorized = round_half_up_pct(ratios.to_numpy())
+    reference = round_half_up_pct_decimal(ratios).to_numpy()
+    assert np.array_equal(vectorized, reference, equal_nan=True)
+    # -0.0 与 0.0 比较相等，符号要单独核对
+    assert np.array_equal(np.signbit(vectorized), np.signbit(reference))
+
+
+def test_half_ties_round_away_from_zero():
+    ties = (np.arange(-2000, 2000) + 0.5) / 10000
+    assert_same(ties)
+    # 乘以10000后正好是x.5的几个值
+    assert round_half_up_pct(np.array([0.00005, -0.00005, 0.00125, -0.00375])).tolist() == [0.01, -0.01, 0.13, -0.38]
+
+
+def test_values_just_below_half():
+    assert_same(np.nextafter((np.arange(0, 1000) + 0.5) / 10000, 0))
+    assert_same(np.nextafter((np.arange(-1000, 0) + 0.5) / 10000, 0))
+
+
+def test_negative_ratios_and_signed_zero():
+    assert_same([-0.1, -0.0999, -0.00004, -0.0, 0.0, 0.00004])
+
+
+def test_nan():
+    assert_same([np.nan, 0.0123, np.nan])
+
+
+@pytest.mark.parametrize('scale', [1e3, 1e6, 1e10])
+def test_large_magnitudes(scale):
+    assert_same(np.random.default_rng(0).normal(0, scale, 1000))
+
+
+def test_random_price_ratios():
+    # 真实数据里涨跌幅来自两位小数价格相除
+    rng = np.random.default_rng(1)
+    pre_close = np.round(rng.uniform(1, 500, 20000), 2)
+    close = np.round(pre_close * rng.uniform(0.9, 1.1, 20000), 2)
+    assert_same(close / pre_close - 1)
+
+
+def test_model_rounding_modes_agree():
+    n = 300
+    rng = np.random.default_rng(2)
+    pre_close = np.round(rng.uniform(5, 50, n), 2)
+    close = np.round(pre_close * rng.uniform(0.9, 1.1, n), 2)
+    close[10] = np.nan
+
+    def frame():
+        return pd.DataFrame({'交易日期': pd.date_range('2022-01-03', periods=n, freq='B'), '开盘价': pre_close,
+                             '收盘价': close, '最低价': np.fmin(pre_close, close), '最高价': np.fmax(pre_close, close),
+                             '前收盘价': pre_close, '成交额': 1e8, '股票名称': '测试', '股票代码': 'sh600000'})
+
+    vectorized = StockChartModel(frame(), '2022/01/03', '2022/12/30', rounding='vectorized')
+    reference = StockChartModel(frame(), '2022/01/03', '2022/12/30', rounding='decimal')
+    assert np.array_equal(vectorized.returns, reference.returns, equal_nan=True)
+    with pytest.raises(ValueError):
+        StockChartModel(frame(), '2022/01/03', '2022/12/30', rounding='bankers')
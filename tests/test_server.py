@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from azplot.server import ChartServer
+from azplot.stock_bar import StockChartController
+
+
+@pytest.fixture
+def server(stock_data_dir):
+    server = ChartServer(StockChartController(stock_data_dir), executor=ThreadPoolExecutor(2), max_items=2)
+    yield server
+    server.close()
+
+
+def get(server, target, headers=None):
+    return asyncio.run(server.respond('GET', target, headers or {}))
+
+
+def test_stock_json(server):
+    status, headers, body = get(server, '/stock/sh600000.json?start=2023/01/03&end=2023/03/31')
+    assert status == '200 OK'
+    assert headers['Content-Type'] == 'application/json'
+    option = json.loads(body)
+    assert option['series'][0]['type'] == 'candlestick'
+
+
+def test_stock_page(server):
+    status, headers, body = get(server, '/stock/sh600001')
+    assert status == '200 OK'
+    assert headers['Content-Type'].startswith('text/html')
+    assert b'echarts' in body
+
+
+@pytest.mark.parametrize('target, status', [
+    ('/stock/sh699999', '404 Not Found'),
+    ('/nothing/sh600000', '404 Not Found'),
+    ('/stock/sh600000?start=not-a-date', '400 Bad Request'),
+    ('/stock/sh600000?stick_count=abc', '400 Bad Request'),
+    ('/stock/sh600000?timeframe=2W', '400 Bad Request'),
+    ('/stock/..%2Fsh600000', '400 Bad Request'),
+    ('/stock/sh600000?windowed=maybe', '400 Bad Request'),
+    ('/stock/sh600000?windowed=2', '400 Bad Request'),
+    # 买点是周六，以之后的第一根K线为中心
+    ('/stock/sh600000.json?buy=2023-02-04&stick_count=50', '200 OK'),
+    ('/stock/sh600000.json?buy=2030-01-01&stick_count=50', '200 OK'),
+])
+def test_errors(server, target, status):
+    assert get(server, target)[0] == status
+
+
+def test_windowed_flag_is_case_insensitive(server):
+    for value in ('1', 'TRUE', ' yes ', 'On'):
+        assert server.cache_key('stock', 'sh600000', {'windowed': value})[3][5] == ('windowed', True)
+    for value in ('0', 'False', 'NO', 'off'):
+        assert server.cache_key('stock', 'sh600000', {'windowed': value})[3][5] == ('windowed', False)
+    assert server.cache_key('stock', 'sh600000', {})[3][5] == ('windowed', False)
+
+
+def test_non_trading_buy_day_snaps_to_next_bar(server):
+    def window(buy_day):
+        _, _, body = get(server, f'/stock/sh600000.json?buy={buy_day}&stick_count=50')
+        zoom = json.loads(body)['dataZoom'][0]
+        return zoom['startValue'], zoom['endValue']
+
+    assert window('2023-02-04') == window('2023-02-06')
+
+
+def test_equivalent_urls_share_cache_entry(server):
+    get(server, '/stock/sh600000.json?buy=2023-02-07,2023-01-10&timeframe=w')
+    get(server, '/stock/sh600000.json?buy=2023/01/10,2023/02/07&timeframe=W')
+    assert server.stats['misses'] == 1
+    assert server.stats['hits'] == 1
+
+
+def test_etag_not_modified_and_source_change(server, stock_data_dir):
+    target = '/stock/sh600000.json'
+    etag = get(server, target)[1]['ETag']
+    status, _, body = get(server, target, {'if-none-match': etag})
+    assert (status, body) == ('304 Not Modified', b'')
+    assert server.stats['misses'] == 1
+
+    # 源文件更新后ETag变化，旧ETag拿到的是新内容
+    path = os.path.join(stock_data_dir, 'sh600000.csv')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    status, headers, _ = get(server, target, {'if-none-match': etag})
+    assert status == '200 OK'
+    assert headers['ETag'] != etag
+
+
+def test_concurrent_requests_coalesce_and_count_one_miss(server):
+    target = '/stock/sh600002.json'
+
+    async def burst():
+        return await asyncio.gather(*[server.respond('GET', target, {}) for _ in range(3)])
+
+    responses = asyncio.run(burst())
+    assert len({body for _, _, body in responses}) == 1
+    get(server, target)
+    stats = json.loads(get(server, '/stats')[2])
+    # 3个并发请求只渲染一次，第4个命中LRU
+    assert (stats['misses'], stats['coalesced'], stats['hits']) == (1, 2, 1)
+    assert stats['hit_rate'] == 0.5
+    assert stats['cache_items'] == 1
+
+
+def test_lru_evicts_oldest(server):
+    for code in ('sh600000', 'sh600001', 'sh600002'):
+        get(server, f'/stock/{code}.json')
+    assert server.stats_snapshot()['cache_items'] == 2
+    get(server, '/stock/sh600000.json')
+    assert server.stats['misses'] == 4
+
+
+def test_method_not_allowed(server):
+    assert asyncio.run(server.respond('POST', '/stock/sh600000', {}))[0] == '405 Method Not Allowed'
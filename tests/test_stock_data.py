@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.stock_bar import StockChartController
+from azplot.stock_data import StockDataCache, read_raw_stock_csv, read_raw_stock_csv_tail, read_stock_csv
+from benchmarks import synthetic
+
+TITLE = '数据由邢不行整理，对数据字段有疑问的，可以直接微信私信邢不行，微信号：xbx297'
+
+
+def write_stock_csv(path: str, industries):
+    """
+    写一个stock-trading-data-pro格式的CSV，带一个停牌日（成交额为空）和一列文本列行业
+    """
+    n = len(industries)
+    close = np.round(10 + np.arange(n) * 0.1, 2)
+    stock_data = pd.DataFrame({
+        '交易日期': pd.date_range('2023-01-02', periods=n, freq='B').strftime('%Y-%m-%d'),
+        '开盘价': close - 0.05,
+        '收盘价': close,
+        '最低价': close - 0.1,
+        '最高价': close + 0.1,
+        '前收盘价': np.append(close[:1], close[:-1]),
+        '成交额': np.where(np.arange(n) == 3, np.nan, 1e8),
+        '股票名称': '测试',
+        '股票代码': 'sh600000',
+        '行业': industries,
+    })
+    with open(path, 'w', encoding='gbk', newline='') as f:
+        f.write(TITLE + '\n')
+        stock_data.to_csv(f, index=False)
+
+
+def test_cache_round_trip_keeps_nan_in_text_columns(tmp_path):
+    stock_data_dir = str(tmp_path / 'stock')
+    os.makedirs(stock_data_dir)
+    path = os.path.join(stock_data_dir, 'sh600000.csv')
+    write_stock_csv(path, ['银行', np.nan, '银行', '银行', np.nan, '银行'])
+    expected = read_stock_csv(path)
+    assert expected['行业'].isna().sum() == 2
+
+    cache_dir = str(tmp_path / 'cache')
+    # 第一次从CSV读并写缓存，第二个实例没有进程内LRU，只能从磁盘缓存读
+    assert StockDataCache(stock_data_dir, cache_dir=cache_dir).load('sh600000').equals(expected)
+    from_disk = StockDataCache(stock_data_dir, cache_dir=cache_dir).load('sh600000')
+    assert from_disk.equals(expected)
+    assert from_disk['行业'].isna().tolist() == expected['行业'].isna().tolist()
+    assert 'nan' not in from_disk['行业'].tolist()
+
+
+def test_cache_invalidated_when_source_changes(tmp_path):
+    stock_data_dir = str(tmp_path / 'stock')
+    os.makedirs(stock_data_dir)
+    path = os.path.join(stock_data_dir, 'sh600000.csv')
+    write_stock_csv(path, ['银行'] * 6)
+    cache = StockDataCache(stock_data_dir, cache_dir=str(tmp_path / 'cache'))
+    assert len(cache.load('sh600000')) == 5  # 停牌日去掉了
+
+    write_stock_csv(path, ['银行'] * 8)
+    assert len(cache.load('sh600000')) == 7
+
+
+def test_loaded_frame_is_a_copy(tmp_path):
+    stock_data_dir = str(tmp_path / 'stock')
+    os.makedirs(stock_data_dir)
+    write_stock_csv(os.path.join(stock_data_dir, 'sh600000.csv'), ['银行'] * 6)
+    cache = StockDataCache(stock_data_dir, cache_dir=str(tmp_path / 'cache'))
+    stock_data = cache.load('sh600000')
+    stock_data['涨跌幅'] = 0.0
+    assert '涨跌幅' not in cache.load('sh600000').columns
+
+
+@pytest.fixture
+def long_csv(tmp_path) -> str:
+    """
+    8000根K线（1992年到2023-06-30）的模拟日线，按stock-trading-data-pro格式写出，换行是LF
+    """
+    stock_data_dir = str(tmp_path / 'long')
+    os.makedirs(stock_data_dir)
+    path = os.path.join(stock_data_dir, 'sh600000.csv')
+    synthetic.write_stock_csv(synthetic.synthetic_stock_df('sh600000', 8000, 0), path)
+    return path
+
+
+def rewrite(path: str, transform) -> str:
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(transform(data))
+    return path
+
+
+@pytest.mark.parametrize('transform', [
+    lambda data: data,
+    lambda data: data.replace(b'\n', b'\r\n'),
+    lambda data: data.rstrip(b'\n'),
+    lambda data: data.replace(b'\n', b'\r\n').rstrip(b'\r\n'),
+], ids=['lf', 'crlf', 'lf-no-trailing-newline', 'crlf-no-trailing-newline'])
+@pytest.mark.parametrize('min_lines, block_size', [(1, 1 << 16), (100, 1 << 16), (100, 97), (5000, 1 << 16)])
+def test_tail_matches_full_read(long_csv, transform, min_lines, block_size):
+    path = rewrite(long_csv, transform)
+    full = read_raw_stock_csv(path)
+    tail, fraction = read_raw_stock_csv_tail(path, min_lines, block_size=block_size)
+    assert len(tail) >= min(min_lines, len(full))
+    pd.testing.assert_frame_equal(tail, full.iloc[-len(tail):].reset_index(drop=True), check_dtype=False)
+    if min_lines >= len(full):
+        # 比整个文件还多：读到第一行为止
+        assert fraction == 1.0 and len(tail) == len(full)
+    else:
+        assert 0 < fraction < 1.0
+
+
+def test_tail_of_unsorted_file_is_none(long_csv):
+    full = read_raw_stock_csv(long_csv)
+    shuffled = full.sample(frac=1, random_state=0)
+    synthetic.write_stock_csv(shuffled, long_csv)
+    assert read_raw_stock_csv_tail(long_csv, 100)[0] is None
+    controller = StockChartController(os.path.dirname(long_csv))
+    assert controller._load_recent_stock_data('sh600000', '2023-01-03', 50) is None
+
+
+@pytest.mark.parametrize('year', range(2012, 2024))
+def test_load_recent_matches_full_read(long_csv, year):
+    """
+    2012年的窗口要读将近四成文件，都还在一半以内，不会退回完整读取
+    """
+    controller = StockChartController(os.path.dirname(long_csv))
+    full = controller._load_stock_data('sh600000')
+    since = pd.Timestamp(f'{year}-03-01')
+    # min_lines很小，要靠估计K线密度往前多读几次
+    recent = controller._load_recent_stock_data('sh600000', since, 200, min_lines=16)
+    assert recent is not None
+    assert recent['交易日期'].searchsorted(since) >= 200 or len(recent) == len(full)
+    pd.testing.assert_frame_equal(recent, full.iloc[-len(recent):].reset_index(drop=True), check_dtype=False)
+
+
+def test_load_recent_reads_whole_file_for_old_windows(long_csv):
+    controller = StockChartController(os.path.dirname(long_csv))
+    assert controller._load_recent_stock_data('sh600000', '1995-03-01', 200) is None
+    assert StockChartController(os.path.dirname(long_csv), use_cache=True)._load_recent_stock_data(
+        'sh600000', '2023-03-01', 200) is None
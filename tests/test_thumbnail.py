@@ -0,0 +1,108 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.stock_bar import StockChartController, StockChartModel
+from azplot.thumbnail import BUY_COLOR, MARKER_SIZE, SELL_COLOR, ContactSheet, encode_png, render_tile
+from benchmarks.synthetic import synthetic_stock_df
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    """
+    只解码encode_png写出的格式：8位RGB、单个IDAT、每行Up过滤
+    """
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, position = {}, 8
+    while position < len(data):
+        length, tag = struct.unpack('>I4s', data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        assert struct.unpack('>I', data[position + 8 + length:position + 12 + length])[0] == zlib.crc32(tag + body)
+        chunks[tag] = body
+        position += 12 + length
+    width, height, depth, color_type = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    assert (depth, color_type) == (8, 2)
+    raw = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width * 3 + 1)
+    assert (raw[:, 0] == 2).all()
+    return np.cumsum(raw[:, 1:], axis=0, dtype=np.uint8).reshape(height, width, 3)
+
+
+def model_with_markers(bar_count: int, buy: int, sell: int) -> StockChartModel:
+    df = synthetic_stock_df('sh600000', 400, 0).dropna(subset=['成交额']).reset_index(drop=True)
+    dates = df['交易日期']
+    start, end = dates.iloc[300], dates.iloc[300 + bar_count - 1]
+    return StockChartModel(df, start.strftime('%Y/%m/%d'), end.strftime('%Y/%m/%d'),
+                           buy_days=[dates.iloc[300 + buy]], sell_days=[dates.iloc[300 + sell]])
+
+
+def marker_columns(tile: np.ndarray, color) -> np.ndarray:
+    return np.flatnonzero((tile == np.array(color, dtype=np.uint8)).all(axis=2).any(axis=0))
+
+
+def test_png_round_trip():
+    pixels = np.random.default_rng(0).integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    data = encode_png(pixels)
+    assert struct.unpack('>II', data[16:24]) == (53, 37)
+    assert np.array_equal(decode_png(data), pixels)
+
+
+@pytest.mark.parametrize('style', ['candle', 'line'])
+def test_markers_on_trade_bar_columns(style):
+    width, bar_count, buy, sell = 160, 40, 10, 31
+    tile = render_tile(model_with_markers(bar_count, buy, sell), width=width, height=80, style=style)
+    assert tile.shape == (80, width, 3)
+    for bar, color in ((buy, BUY_COLOR), (sell, SELL_COLOR)):
+        # 这根K线占[first, next_first)几列，三角形以其中间那列为中心
+        first, next_first = -(-bar * width // bar_count), -(-(bar + 1) * width // bar_count)
+        center = first + (next_first - first - 1) // 2
+        columns = marker_columns(tile, color)
+        assert columns.min() == center - MARKER_SIZE + 1
+        assert columns.max() == center + MARKER_SIZE - 1
+
+
+def test_markers_follow_aggregated_bars():
+    # K线比像素列多，合并后买点落在它所在的那一组里
+    width, bar_count = 20, 60
+    tile = render_tile(model_with_markers(bar_count, 0, 59), width=width, height=40)
+    assert marker_columns(tile, BUY_COLOR).min() == 0
+    assert marker_columns(tile, SELL_COLOR).max() == width - 1
+
+
+def test_contact_sheet_layout(tmp_path):
+    tiles = [np.full((10, 20, 3), i * 40, dtype=np.uint8) for i in range(5)]
+    sheet = ContactSheet(columns=2, tile_width=20, tile_height=10, gap=4)
+    for i, tile in enumerate(tiles):
+        sheet.add(tile, f'<{i}>', link=None if i == 0 else f'chart.html#{i}')
+    with pytest.raises(ValueError):
+        sheet.add(np.zeros((5, 5, 3), dtype=np.uint8), 'bad')
+
+    path = sheet.render(str(tmp_path / 'sheet.html'))
+    pixels = decode_png(open(str(tmp_path / 'sheet.png'), 'rb').read())
+    assert pixels.shape == (3 * 10 + 2 * 4, 2 * 20 + 4, 3)
+    assert np.array_equal(pixels[14:24, 24:44], tiles[3])
+    page = open(path, encoding='utf-8').read()
+    assert '&lt;0&gt;' in page and 'href="chart.html#4"' in page
+    assert 'background-position: -24px -14px' in page
+
+
+def test_contact_sheet_same_with_workers(stock_data_dir, tmp_path):
+    pytest.importorskip('azhint')
+    stocks_df = pd.DataFrame({'股票代码': ['sh600000', 'sh600001', 'sh600002', 'sh600000'],
+                              '股票名称': ['甲', '乙', '丙', '甲'],
+                              '交易日期': pd.to_datetime(['2023-01-10', '2023-02-07', '2022-11-15', '2023-03-01'])})
+    controller = StockChartController(stock_data_dir)
+    sheets = []
+    for workers in (None, 2):
+        output_dir = str(tmp_path / f'workers_{workers}')
+        path = controller.render_contact_sheet(stocks_df, output_dir, columns=2, workers=workers, link_charts=False)
+        with open(os.path.join(output_dir, '选股缩略图.png'), 'rb') as f:
+            png = f.read()
+        with open(path, encoding='utf-8') as f:
+            sheets.append((png, f.read()))
+    assert sheets[0] == sheets[1]
+    pixels = decode_png(sheets[0][0])
+    assert pixels.shape == (2 * 80 + 4, 2 * 160 + 4, 3)
+    assert len(marker_columns(pixels, BUY_COLOR)) > 0
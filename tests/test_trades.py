@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from azplot.resample import BarSnapper, resample_stock_data
+from azplot.stock_bar import StockChartModel
+from azplot.trades import CodeTrades
+
+pytest.importorskip('azhint')
+from azplot.trades import TradeLog  # noqa: E402
+
+
+def stock_df(n: int = 30) -> pd.DataFrame:
+    close = np.round(10 + np.arange(n) * 0.1, 2)
+    return pd.DataFrame({'交易日期': pd.date_range('2023-01-02', periods=n, freq='B'), '开盘价': close,
+                         '收盘价': close, '最低价': close - 0.2, '最高价': close + 0.2,
+                         '前收盘价': np.append(close[:1], close[:-1]), '成交额': 1e8, '股票名称': '测试',
+                         '股票代码': 'sh600000'})
+
+
+def trades_df(**columns) -> pd.DataFrame:
+    data = {'code': ['sh600000', ' sh600000', 'sz000001', 'sh600000'],
+            'date': ['2023-01-05 10:31:00', '2023-01-05 14:02:00', '2023-01-06', '2023-01-10 09:30:05'],
+            'side': ['buy', 'BUY', 'Sell', ' Sell '],
+            'price': [10.3, 10.4, 8.0, 10.9],
+            'size': [100, 300, 500, 400]}
+    data.update(columns)
+    return pd.DataFrame(data)
+
+
+def test_sides_are_case_insensitive_and_dates_floored():
+    log = TradeLog(trades_df())
+    assert sorted(log.codes) == ['sh600000', 'sz000001']
+    trades = log.for_code('sh600000')
+    assert trades.is_buy.tolist() == [True, True, False]
+    assert trades.dates.astype('datetime64[D]').astype(str).tolist() == ['2023-01-05', '2023-01-05', '2023-01-10']
+    assert (trades.dates == trades.dates.astype('datetime64[D]')).all()
+    assert log.for_code('sh699999') is None
+
+
+@pytest.mark.parametrize('side', ['hold', 'nan', np.nan, ''])
+def test_unknown_side_raises(side):
+    with pytest.raises(ValueError, match='unknown trade side'):
+        TradeLog(trades_df(side=['buy', side, 'sell', 'sell']))
+
+
+def test_numeric_and_chinese_sides():
+    log = TradeLog(trades_df(side=[1, '买入', -1, '卖']))
+    assert log.for_code('sh600000').is_buy.tolist() == [True, True, False]
+
+
+def test_intraday_fills_get_markers_with_price_and_size():
+    model = StockChartModel(stock_df(), '2023/01/02', '2023/02/10', trades=TradeLog(trades_df()).for_code('sh600000'))
+    buys, sells = model.marker_positions()
+    assert buys.tolist() == [3] and sells.tolist() == [6]
+    marks = [item.opts for item in model.trade_data()]
+    assert [(mark['coord'][0], mark['value']) for mark in marks] == [('2023/01/05', '买'), ('2023/01/10', '卖')]
+    # 两笔买入合成一个箭头：按数量加权的均价 (10.3*100 + 10.4*300) / 400
+    assert marks[0]['name'] == '买 2笔 均价10.38 共400'
+    assert marks[1]['name'] == '卖 1笔 均价10.90 共400'
+
+
+def test_price_and_size_are_optional():
+    trades = TradeLog(trades_df().drop(columns=['price', 'size'])).for_code('sh600000')
+    assert np.isnan(trades.price).all() and np.isnan(trades.size).all()
+    model = StockChartModel(stock_df(), '2023/01/02', '2023/02/10', trades=trades)
+    assert [item.opts['name'] for item in model.trade_data()] == ['买 2笔', '卖 1笔']
+
+
+def test_non_trading_day_marker_is_dropped():
+    trades = CodeTrades(np.array(['2023-01-07', '2023-01-09'], dtype='datetime64[ns]'), np.array([True, True]),
+                        np.array([1.0, 1.0]), np.array([1.0, 1.0]))
+    model = StockChartModel(stock_df(), '2023/01/02', '2023/02/10', trades=trades)
+    assert [item.opts['coord'][0] for item in model.trade_data()] == ['2023/01/09']
+
+
+@pytest.mark.parametrize('timeframe', ['W', '3D'])
+def test_intraday_days_snap_to_resampled_bars(timeframe):
+    daily = stock_df()
+    resampled = resample_stock_data(daily, timeframe)
+    snapper = BarSnapper(daily, resampled, timeframe)
+    label = snapper.days([pd.Timestamp('2023-01-05')])
+    assert snapper.days([pd.Timestamp('2023-01-05 10:31:00')]) == label
+    assert len(label) == 1
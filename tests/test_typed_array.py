@@ -0,0 +1,140 @@
+import base64
+import json
+import re
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from azplot.typed_array import (ColumnEncoding, DECODER_JS, encode_column, encode_dates, encode_source,
+                                resolve_encodings)
+
+CALL = re.compile(r"azplot(Decode|Dates)\('([^']*)', '(\w+)'(?:, ([^,]+), (\d))?\)")
+TYPES = {'i8': '<i1', 'i16': '<i2', 'i32': '<i4', 'f32': '<f4', 'f64': '<f8'}
+
+
+def js_of(code) -> str:
+    return code.js_code.replace('--x_x--0_0--', '')
+
+
+def parse_call(code) -> tuple:
+    kind, data, type_name, scale, delta = CALL.fullmatch(js_of(code)).groups()
+    return kind, np.frombuffer(base64.b64decode(data), dtype=TYPES[type_name]), type_name, scale, delta
+
+
+def decode(code) -> np.ndarray:
+    """
+    DECODER_JS里azplotDecode的Python版，缺失值为NaN
+    """
+    _, raw, type_name, scale, delta = parse_call(code)
+    scale = float(scale)
+    values = raw.astype(np.float64)
+    if type_name.startswith('i'):
+        missing = raw == np.iinfo(raw.dtype).min
+        if delta == '1':
+            values = np.cumsum(np.where(missing, 0, values))
+        values = values if scale == 1 else values / scale
+        values[missing] = np.nan
+    elif scale:
+        # Math.round
+        values = np.floor(values * scale + 0.5) / scale
+    return values
+
+
+def prices(n: int = 1000, seed: int = 0) -> np.ndarray:
+    return np.round(20 + np.cumsum(np.random.default_rng(seed).normal(0, 0.2, n)), 2)
+
+
+def test_delta_fixed_point_round_trip_with_missing():
+    values = prices()
+    values[[0, 10, 11, 999]] = np.nan
+    code = encode_column(values, ColumnEncoding(decimals=2, delta=True))
+    # 第一个差值就是值本身（约2000），其余差值很小，整列用int16
+    assert parse_call(code)[2] == 'i16'
+    assert np.array_equal(decode(code), values, equal_nan=True)
+
+
+def test_fixed_point_picks_wider_type_when_needed():
+    values = np.array([0.0, 1000.0, -1000.0, 12.5])
+    code = encode_column(values, ColumnEncoding(decimals=2))
+    assert parse_call(code)[2] == 'i32'
+    assert np.array_equal(decode(code), values)
+
+
+def test_fixed_point_falls_back_to_float64_beyond_int32():
+    values = np.array([1e12, 2.5, np.nan])
+    code = encode_column(values, ColumnEncoding(decimals=2))
+    assert parse_call(code)[2] == 'f64'
+    assert np.array_equal(decode(code), values, equal_nan=True)
+
+
+def test_float32_rounds_back_to_decimals():
+    values = np.round(np.random.default_rng(1).uniform(1e7, 1e9, 500), 2)
+    values[3] = np.nan
+    code = encode_column(values, ColumnEncoding(float32=True, decimals=0))
+    assert parse_call(code)[2] == 'f32'
+    decoded = decode(code)
+    assert np.allclose(decoded, values, rtol=1e-6, equal_nan=True)
+    assert np.array_equal(decoded, np.floor(decoded + 0.5), equal_nan=True)
+
+
+@pytest.mark.parametrize('delta', [False, True])
+def test_fixed_point_falls_back_to_float64_instead_of_rounding(delta):
+    values = np.array([10.123, 10.456, np.nan, 10.789])
+    code = encode_column(values, ColumnEncoding(decimals=2, delta=delta))
+    assert parse_call(code)[2] == 'f64'
+    assert np.array_equal(decode(code), values, equal_nan=True)
+
+
+def test_lossy_fixed_point_rounds_to_decimals():
+    values = np.array([10.123, 10.456, np.nan, 10.789])
+    code = encode_column(values, ColumnEncoding(decimals=2, delta=True, lossy=True))
+    assert parse_call(code)[2] == 'i16'
+    assert np.array_equal(decode(code), [10.12, 10.46, np.nan, 10.79], equal_nan=True)
+
+
+def test_plain_float64_is_lossless():
+    values = np.random.default_rng(2).normal(0, 1, 100)
+    assert np.array_equal(decode(encode_column(values, ColumnEncoding())), values)
+
+
+def test_encode_dates():
+    dates = ['2023/01/03', '2023/01/04', '2023/02/07', '2024/02/29']
+    kind, raw, type_name, _, _ = parse_call(encode_dates(dates))
+    assert (kind, type_name) == ('Dates', 'i16')
+    days = np.cumsum(raw).astype('datetime64[D]')
+    assert [str(day).replace('-', '/') for day in days] == dates
+    assert encode_dates(['a', 'b']) == ['a', 'b']
+
+
+def test_encode_source_and_resolve_encodings():
+    encodings = resolve_encodings({'price': ColumnEncoding(decimals=3)}, {'close': ColumnEncoding(decimals=2),
+                                                                           'amount': ColumnEncoding(float32=True)})
+    assert encodings['open'] == encodings['close'] == ColumnEncoding(decimals=3)
+    assert encodings['amount'] == ColumnEncoding(float32=True)
+    assert resolve_encodings(True, encodings) == encodings
+
+    source = encode_source({'date': ['2023/01/03'], 'close': [1.234], 'ma5': [np.nan]}, encodings,
+                           default=ColumnEncoding(decimals=3, delta=True))
+    assert parse_call(source['date'])[0] == 'Dates'
+    assert decode(source['close']).tolist() == [1.234]
+    assert np.isnan(decode(source['ma5'])).all()
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='需要node运行前端解码函数')
+def test_javascript_decoder_matches():
+    values = prices(300)
+    values[[5, 6]] = np.nan
+    codes = [encode_column(values, ColumnEncoding(decimals=2, delta=True)),
+             encode_column(values, ColumnEncoding(decimals=2)),
+             encode_column(values * 1e6, ColumnEncoding(float32=True, decimals=0)),
+             encode_column(values, ColumnEncoding())]
+    dates = ['2023/01/03', '2023/01/04', '2023/02/07', '2024/02/29']
+    script = DECODER_JS + 'console.log(JSON.stringify([' + ', '.join(js_of(code) for code in codes) + ', ' + \
+        js_of(encode_dates(dates)) + ']));'
+    decoded = json.loads(subprocess.run(['node', '-e', script], check=True, capture_output=True, text=True).stdout)
+    for code, result in zip(codes, decoded[:-1]):
+        assert np.array_equal(np.array(result, dtype=np.float64), decode(code), equal_nan=True)
+    assert np.array_equal(np.array(decoded[0], dtype=np.float64), values, equal_nan=True)
+    assert decoded[-1] == dates